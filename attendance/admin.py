@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import User, Class, Subject, Lesson, QRCode, Attendance
+from .models import User, Class, Subject, Lesson, QRCode, Attendance, ScanReceipt
 
 @admin.register(User)
 class UserAdmin(BaseUserAdmin):
@@ -31,7 +31,7 @@ class SubjectAdmin(admin.ModelAdmin):
 
 @admin.register(Lesson)
 class LessonAdmin(admin.ModelAdmin):
-    list_display = ['subject', 'class_room', 'start_time', 'end_time']
+    list_display = ['subject', 'class_room', 'start_time', 'end_time', 'finalized_at']
     list_filter = ['subject', 'class_room', 'start_time']
     search_fields = ['subject__name', 'class_room__name']
 
@@ -47,3 +47,9 @@ class AttendanceAdmin(admin.ModelAdmin):
     list_display = ['student', 'lesson', 'status', 'marked_at']
     list_filter = ['status', 'lesson__subject', 'lesson__class_room']
     search_fields = ['student__full_name', 'lesson__subject__name']
+
+@admin.register(ScanReceipt)
+class ScanReceiptAdmin(admin.ModelAdmin):
+    list_display = ['device_id', 'seq', 'teacher', 'code', 'scanned_at', 'result']
+    list_filter = ['result', 'teacher']
+    search_fields = ['device_id', 'code']
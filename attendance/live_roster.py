@@ -0,0 +1,131 @@
+import asyncio
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+
+DEFAULT_LIVE_ROSTER = {
+    'BACKEND': 'attendance.live_roster.InProcessBroker',
+    'QUEUE_SIZE': 256,
+    'KEEPALIVE_SECONDS': 15,
+}
+
+
+class Subscription:
+    # One open roster stream. Events are handed to the subscriber's event
+    # loop, so publishing from a sync request thread never blocks on a slow
+    # client: once QUEUE_SIZE events are waiting, further ones are dropped and
+    # counted, and the client is expected to reconnect for a fresh snapshot.
+
+    def __init__(self, lesson_id, queue_size):
+        self.lesson_id = lesson_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+
+    def deliver(self, event):
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class InProcessBroker:
+    # Pub/sub between the requests of one process. An idle subscriber is a
+    # parked coroutine and a dict entry; nothing runs between scans. With
+    # several worker processes, a scan only reaches streams opened on the
+    # same process, so such deployments plug in a shared BACKEND that keeps
+    # the subscribe/unsubscribe/publish/stats interface.
+
+    def __init__(self, queue_size=256):
+        self.queue_size = queue_size
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self.published = 0
+        self.delivered = 0
+
+    def subscribe(self, lesson_id):
+        subscription = Subscription(lesson_id, self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(lesson_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.lesson_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.lesson_id]
+
+    def publish(self, lesson_id, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(lesson_id, ()))
+            self.published += 1
+            self.delivered += len(subscribers)
+        for subscription in subscribers:
+            subscription.deliver(event)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'lessons': len(self._subscribers),
+                'subscribers': sum(len(subscribers) for subscribers in self._subscribers.values()),
+                'published': self.published,
+                'delivered': self.delivered,
+            }
+
+
+_live_roster = None
+
+
+def live_roster_option(name):
+    return {**DEFAULT_LIVE_ROSTER, **getattr(settings, 'LIVE_ROSTER', {})}[name]
+
+
+def get_live_roster():
+    global _live_roster
+    if _live_roster is None:
+        backend = import_string(live_roster_option('BACKEND'))
+        _live_roster = backend(queue_size=live_roster_option('QUEUE_SIZE'))
+    return _live_roster
+
+
+def roster_event(attendance):
+    return {
+        'student_id': attendance.student_id,
+        'status': attendance.status,
+        'marked_at': attendance.marked_at.isoformat() if attendance.marked_at else None,
+    }
+
+
+def publish_attendance(attendances):
+    # Streams learn about a mark only once it is committed, so a rolled back
+    # scan is never shown.
+    events = [(attendance.lesson_id, roster_event(attendance)) for attendance in attendances]
+    if not events:
+        return
+
+    def publish():
+        broker = get_live_roster()
+        for lesson_id, event in events:
+            broker.publish(lesson_id, event)
+
+    transaction.on_commit(publish)
+
+
+@receiver(setting_changed)
+def _reset_live_roster(sender, setting, **kwargs):
+    global _live_roster
+    if setting == 'LIVE_ROSTER':
+        _live_roster = None
@@ -0,0 +1,41 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from attendance.models import Lesson
+from attendance.write_behind import get_scan_queue
+
+
+class Command(BaseCommand):
+    help = 'Finalize ended lessons: insert absent rows for every student who was not scanned.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace', type=int, default=0, help='Minutes to wait after end_time before finalizing a lesson')
+        parser.add_argument('--dry-run', action='store_true', help='Only list the lessons that would be finalized')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        lessons = Lesson.objects.filter(
+            finalized_at__isnull=True,
+            end_time__lte=now - timedelta(minutes=options['grace']),
+        ).select_related('class_room').order_by('end_time')
+
+        if options['dry_run']:
+            for lesson in lessons:
+                self.stdout.write(f'{lesson.id}: {lesson.class_room.name} ended {lesson.end_time}')
+            return
+
+        # Scans still sitting in the write-behind queue must land first, or
+        # their students would be counted absent until the next flush.
+        queue = get_scan_queue()
+        if queue is not None:
+            queue.flush()
+
+        finalized = absent = 0
+        for lesson in lessons.iterator():
+            absent += lesson.finalize(now)
+            finalized += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Finalized {finalized} lessons, marked {absent} students absent.'
+        ))
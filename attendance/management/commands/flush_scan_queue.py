@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from attendance.write_behind import get_scan_queue
+
+
+class Command(BaseCommand):
+    help = "Flush queued attendance scans (SCAN_WRITE_BEHIND) into the database."
+
+    def handle(self, *args, **options):
+        queue = get_scan_queue()
+        if queue is None:
+            raise CommandError("SCAN_WRITE_BEHIND is not enabled.")
+        flushed = queue.flush()
+        self.stdout.write(self.style.SUCCESS(f"Flushed {flushed} queued scans."))
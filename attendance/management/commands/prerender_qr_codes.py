@@ -0,0 +1,97 @@
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from attendance.models import QRCode
+from attendance.qr_cache import get_qr_image_cache, render_key
+from attendance.rendering import QR_ERROR_CORRECTION, QR_FORMATS, QR_RENDER_DEFAULTS, render_qr_batch
+
+
+class Command(BaseCommand):
+    help = "Pre-render QR code images for lessons in a date range using a process pool."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=date.fromisoformat, help="First lesson date (YYYY-MM-DD), defaults to today")
+        parser.add_argument('--end', type=date.fromisoformat, help="Last lesson date (YYYY-MM-DD), defaults to --start")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--resume-after', type=int, default=0, help="Skip QR codes with id <= this value")
+        parser.add_argument('--output-dir', help="Also write <code>.<ext> files into this directory")
+        parser.add_argument('--image-format', choices=list(QR_FORMATS), default=QR_RENDER_DEFAULTS['format'])
+        parser.add_argument('--box-size', type=int, default=QR_RENDER_DEFAULTS['box_size'])
+        parser.add_argument('--border', type=int, default=QR_RENDER_DEFAULTS['border'])
+        parser.add_argument('--error-correction', choices=list(QR_ERROR_CORRECTION), default=QR_RENDER_DEFAULTS['error_correction'])
+
+    def handle(self, *args, **options):
+        start = options['start'] or timezone.localdate()
+        end = options['end'] or start
+        if end < start:
+            raise CommandError("--end must not be before --start.")
+        if options['workers'] < 1 or options['chunk_size'] < 1:
+            raise CommandError("--workers and --chunk-size must be positive.")
+
+        cache = get_qr_image_cache()
+        output_dir = Path(options['output_dir']) if options['output_dir'] else None
+        if cache.shared is None and output_dir is None:
+            raise CommandError(
+                "Nothing to warm: set QR_IMAGE_CACHE['SHARED_CACHE'] or pass --output-dir."
+            )
+        if output_dir is not None:
+            output_dir.mkdir(parents=True, exist_ok=True)
+
+        rows = QRCode.objects.filter(
+            lesson__start_time__date__gte=start,
+            lesson__start_time__date__lte=end,
+            id__gt=options['resume_after'],
+        ).order_by('id').values_list('id', 'code')
+
+        params = {
+            'format': options['image_format'],
+            'box_size': options['box_size'],
+            'border': options['border'],
+            'error_correction': options['error_correction'],
+        }
+        extension = 'svg' if params['format'] == 'svg' else 'png'
+        total = 0
+        started = time.perf_counter()
+        pending = deque()
+
+        def drain(future, last_id):
+            nonlocal total
+            rendered = future.result()
+            cache.publish({render_key(code, params): image for code, image in rendered})
+            if output_dir is not None:
+                for code, image in rendered:
+                    (output_dir / f'{code}.{extension}').write_bytes(image)
+            total += len(rendered)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"{total} images, {total / elapsed:.1f} images/s (resume after id {last_id})"
+            )
+
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            chunk = []
+            for qr_id, code in rows.iterator(chunk_size=options['chunk_size']):
+                chunk.append(code)
+                if len(chunk) == options['chunk_size']:
+                    pending.append((pool.submit(render_qr_batch, chunk, params), qr_id))
+                    chunk = []
+                # Bound the in-flight chunks so memory stays flat on large ranges.
+                while len(pending) > options['workers'] * 2:
+                    drain(*pending.popleft())
+            if chunk:
+                pending.append((pool.submit(render_qr_batch, chunk, params), qr_id))
+            while pending:
+                drain(*pending.popleft())
+
+        elapsed = time.perf_counter() - started
+        rate = total / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Rendered {total} QR images for {start}..{end} in {elapsed:.2f}s ({rate:.1f} images/s)"
+        ))
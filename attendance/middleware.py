@@ -0,0 +1,30 @@
+from django.db import OperationalError, connection
+
+
+class QueryCountMiddleware:
+    # Reports the database work of each request in response headers:
+    # X-Query-Count, plus X-DB-Lock-Timeout when the request failed on
+    # SQLite's "database is locked". Enabled by the benchmark settings that
+    # benchmarks/loadtest.py serves; it is not in the default MIDDLEWARE.
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = 0
+
+        def count(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count):
+            response = self.get_response(request)
+        response['X-Query-Count'] = str(queries)
+        if getattr(request, '_db_lock_timeout', False):
+            response['X-DB-Lock-Timeout'] = '1'
+        return response
+
+    def process_exception(self, request, exception):
+        if isinstance(exception, OperationalError) and 'locked' in str(exception):
+            request._db_lock_timeout = True
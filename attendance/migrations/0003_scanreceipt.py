@@ -0,0 +1,32 @@
+# Generated by Django 5.2.3 on 2026-10-18 17:54
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0002_alter_user_phone_number'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScanReceipt',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('device_id', models.CharField(max_length=64)),
+                ('seq', models.PositiveBigIntegerField()),
+                ('code', models.CharField(max_length=100)),
+                ('scanned_at', models.DateTimeField()),
+                ('result', models.CharField(choices=[('ok', 'OK'), ('invalid', 'Invalid'), ('wrong_teacher', 'Wrong teacher'), ('duplicate', 'Duplicate')], max_length=20)),
+                ('attendance_status', models.CharField(blank=True, max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('teacher', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scan_receipts', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('teacher', 'device_id', 'seq')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 17:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0003_scanreceipt'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lesson',
+            name='finalized_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
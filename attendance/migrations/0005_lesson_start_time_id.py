@@ -0,0 +1,17 @@
+# Generated by Django 5.2.3 on 2026-10-18 18:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0004_lesson_finalized_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='lesson',
+            index=models.Index(fields=['start_time', 'id'], name='lesson_start_time_id'),
+        ),
+    ]
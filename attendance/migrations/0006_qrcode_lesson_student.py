@@ -0,0 +1,17 @@
+# Generated by Django 5.2.3 on 2026-10-18 18:33
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0005_lesson_start_time_id'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='qrcode',
+            unique_together={('lesson', 'student')},
+        ),
+    ]
@@ -1,11 +1,10 @@
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
-import qrcode
-from PIL import Image
-import io
 import base64
 import uuid
+from .qr_cache import get_qr_image_cache
+from .qr_tokens import signed_tokens_enabled
 
 class User(AbstractUser):
     ROLE_CHOICES = [
@@ -45,19 +44,58 @@ class Lesson(models.Model):
     class_room = models.ForeignKey(Class, on_delete=models.CASCADE, related_name='lessons')
     start_time = models.DateTimeField()
     end_time = models.DateTimeField()
+    finalized_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        # Keyset pagination of lesson and QR code lists seeks on this pair.
+        indexes = [models.Index(fields=['start_time', 'id'], name='lesson_start_time_id')]
+    
     def __str__(self):
         return f"{self.subject.name} - {self.class_room.name} - {self.start_time}"
     
     def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        for student in self.class_room.students.all():
-            QRCode.objects.get_or_create(
-                lesson=self,
-                student=student,
-                defaults={'code': str(uuid.uuid4())}
+        # One transaction, so listings cached in between cannot miss the codes.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if not signed_tokens_enabled() and kwargs.get('update_fields') is None:
+                self.provision_qr_codes()
+    
+    def provision_qr_codes(self):
+        with transaction.atomic():
+            missing_ids = self.class_room.students.exclude(
+                qr_codes__lesson=self
+            ).values_list('id', flat=True)
+            qr_codes = [
+                QRCode(lesson=self, student_id=student_id, code=str(uuid.uuid4()))
+                for student_id in missing_ids
+            ]
+            return QRCode.objects.bulk_create(qr_codes)
+    
+    def finalize(self, now=None):
+        # Closes the lesson: every student who was never scanned gets an
+        # explicit 'absent' row, so reports only aggregate Attendance.
+        # ignore_conflicts keeps a scan that lands concurrently.
+        now = now or timezone.now()
+        with transaction.atomic():
+            missing_ids = list(self.class_room.students.exclude(
+                attendances__lesson=self
+            ).values_list('id', flat=True))
+            Attendance.objects.bulk_create(
+                [
+                    Attendance(lesson=self, student_id=student_id, status='absent')
+                    for student_id in missing_ids
+                ],
+                ignore_conflicts=True
             )
+            # Rows skipped as conflicts are not returned as such, so count
+            # what was actually written: scanned rows carry a marked_at.
+            absent = Attendance.objects.filter(
+                lesson=self, student_id__in=missing_ids, marked_at__isnull=True
+            ).count()
+            self.finalized_at = now
+            self.save(update_fields=['finalized_at'])
+        return absent
 
 class QRCode(models.Model):
     lesson = models.ForeignKey(Lesson, on_delete=models.CASCADE, related_name='qr_codes')
@@ -65,17 +103,17 @@ class QRCode(models.Model):
     code = models.CharField(max_length=100, unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
-    def generate_qr_image(self):
-        qr = qrcode.QRCode(version=1, box_size=10, border=5)
-        qr.add_data(self.code)
-        qr.make(fit=True)
-        
-        img = qr.make_image(fill_color="black", back_color="white")
-        buffer = io.BytesIO()
-        img.save(buffer, format='PNG')
-        buffer.seek(0)
-        
-        return base64.b64encode(buffer.getvalue()).decode()
+    class Meta:
+        # One code per student and lesson. The my-qr-codes list seeks on
+        # (lesson start_time, lesson id): it walks the lesson_start_time_id
+        # index and probes this one for the student's code.
+        unique_together = ['lesson', 'student']
+    
+    def render_qr_image(self, **params):
+        return get_qr_image_cache().get_or_render(self.code, **params)
+    
+    def generate_qr_image(self, **params):
+        return base64.b64encode(self.render_qr_image(**params)).decode()
     
     def __str__(self):
         return f"QR for {self.student.full_name} - {self.lesson}"
@@ -95,6 +133,31 @@ class Attendance(models.Model):
     
     class Meta:
         unique_together = ['lesson', 'student']
+        # A student's attendance rate is counted by status from this index alone.
+        indexes = [models.Index(fields=['student', 'status'], name='attendance_student_status')]
     
     def __str__(self):
         return f"{self.student.full_name} - {self.lesson} - {self.status}"
+
+class ScanReceipt(models.Model):
+    RESULT_CHOICES = [
+        ('ok', 'OK'),
+        ('invalid', 'Invalid'),
+        ('wrong_teacher', 'Wrong teacher'),
+        ('duplicate', 'Duplicate'),
+    ]
+    
+    teacher = models.ForeignKey(User, on_delete=models.CASCADE, related_name='scan_receipts')
+    device_id = models.CharField(max_length=64)
+    seq = models.PositiveBigIntegerField()
+    code = models.CharField(max_length=100)
+    scanned_at = models.DateTimeField()
+    result = models.CharField(max_length=20, choices=RESULT_CHOICES)
+    attendance_status = models.CharField(max_length=10, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        unique_together = ['teacher', 'device_id', 'seq']
+    
+    def __str__(self):
+        return f"{self.device_id}#{self.seq} - {self.result}"
@@ -0,0 +1,130 @@
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+DEFAULT_API_PAGINATION = {
+    'PAGE_SIZE': 20,
+    'MAX_PAGE_SIZE': 100,
+}
+
+
+def api_pagination_option(name):
+    return {**DEFAULT_API_PAGINATION, **getattr(settings, 'API_PAGINATION', {})}[name]
+
+
+class KeysetPagination(BasePagination):
+    # Cursor pagination on a unique ordering (the last field must be unique,
+    # normally id). A page is "rows after the last row seen", a WHERE on the
+    # ordering columns, so page 500 costs the same as page 1 where OFFSET
+    # would scan every skipped row. The cursor is an opaque base64 token of
+    # that position and a direction, which gives previous links as well.
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, ordering=('id',)):
+        self.ordering = ordering
+        self.page_size = api_pagination_option('PAGE_SIZE')
+        self.max_page_size = api_pagination_option('MAX_PAGE_SIZE')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        reverse, position = self.decode_cursor(request)
+
+        queryset = queryset.order_by(*(f'-{field}' if reverse else field for field in self.ordering))
+        try:
+            if position is not None:
+                queryset = queryset.filter(self.after(position, reverse))
+            rows = list(queryset[:self.page_size + 1])
+        except (ValidationError, ValueError, TypeError):
+            # A well-formed token whose values do not fit the columns.
+            raise NotFound(self.invalid_cursor_message)
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        # Moving backwards, the page we came from is always ahead of us.
+        self.has_next = has_more if not reverse else position is not None
+        self.has_previous = position is not None if not reverse else has_more
+        self.first_position = self.position(rows[0]) if rows else None
+        self.last_position = self.position(rows[-1]) if rows else None
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def after(self, position, reverse):
+        # (a, b) > (x, y) written as a >= x AND (a > x OR (a = x AND b > y)).
+        # The redundant a >= x is what lets the database start an index range
+        # at the cursor; the OR alone is read by scanning from the start.
+        lookup = 'lt' if reverse else 'gt'
+        condition = Q()
+        for index, field in enumerate(self.ordering):
+            equal = {name: value for name, value in zip(self.ordering[:index], position)}
+            condition |= Q(**equal, **{f'{field}__{lookup}': position[index]})
+        return Q(**{f'{self.ordering[0]}__{lookup}e': position[0]}) & condition
+
+    def position(self, row):
+        values = []
+        for field in self.ordering:
+            if isinstance(row, dict):
+                # A .values() row keyed by the ordering lookups.
+                value = row[field]
+            else:
+                value = row
+                for attr in field.split('__'):
+                    value = getattr(value, attr)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        return values
+
+    def encode_cursor(self, position, reverse):
+        payload = json.dumps({'p': position, 'r': int(reverse)}, separators=(',', ':'))
+        token = base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return False, None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+            position, reverse = payload['p'], bool(payload['r'])
+        except (binascii.Error, ValueError, TypeError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return reverse, position
+
+    def get_next_link(self):
+        if not self.has_next or self.last_position is None:
+            return None
+        return self.encode_cursor(self.last_position, False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if self.first_position is None:
+            return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return self.encode_cursor(self.first_position, True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
@@ -0,0 +1,117 @@
+from django.conf import settings
+from django.urls import reverse
+from rest_framework import serializers
+from rest_framework.utils.encoders import JSONEncoder
+
+
+# Read fast path: the list views fetch .values() rows and build the same
+# dicts that LessonSerializer, AttendanceSerializer and QRCodeSerializer would,
+# key for key and in the same order, without model instances or per-field
+# serializer calls. Whenever a serializer changes, its projection here must
+# change with it; the byte-compatibility test compares the two.
+
+DEFAULT_FAST_READ_PATH = {
+    'ENABLED': True,
+}
+
+_datetime_field = serializers.DateTimeField()
+_encoder = JSONEncoder()
+
+
+def fast_read_path_option(name):
+    return {**DEFAULT_FAST_READ_PATH, **getattr(settings, 'FAST_READ_PATH', {})}[name]
+
+
+def _datetime(value):
+    # A DateTimeField: converted to the current time zone.
+    return _datetime_field.to_representation(value)
+
+
+def _raw_datetime(value):
+    # A datetime returned from a SerializerMethodField: left to the encoder.
+    return _encoder.default(value) if value is not None else None
+
+
+LESSON_VALUES = (
+    'id', 'subject_id', 'subject__name', 'class_room_id', 'class_room__name',
+    'subject__teacher__full_name', 'start_time', 'end_time', 'finalized_at', 'created_at',
+)
+
+
+def lesson_rows(rows):
+    return [
+        {
+            'id': row['id'],
+            'subject': row['subject_id'],
+            'subject_name': row['subject__name'],
+            'class_room': row['class_room_id'],
+            'class_name': row['class_room__name'],
+            'teacher_name': row['subject__teacher__full_name'],
+            'start_time': _datetime(row['start_time']),
+            'end_time': _datetime(row['end_time']),
+            'finalized_at': _datetime(row['finalized_at']),
+            'created_at': _datetime(row['created_at']),
+        }
+        for row in rows
+    ]
+
+
+ATTENDANCE_VALUES = (
+    'id', 'lesson_id', 'student_id', 'student__full_name', 'status', 'marked_at',
+    'lesson__subject__name', 'lesson__class_room__name', 'lesson__start_time',
+    'lesson__subject__teacher__full_name', 'created_at',
+)
+
+
+def attendance_row(row):
+    return {
+        'id': row['id'],
+        'lesson': row['lesson_id'],
+        'student': row['student_id'],
+        'student_name': row['student__full_name'],
+        'status': row['status'],
+        'marked_at': _datetime(row['marked_at']),
+        'lesson_info': {
+            'subject': row['lesson__subject__name'],
+            'class': row['lesson__class_room__name'],
+            'start_time': _raw_datetime(row['lesson__start_time']),
+            'teacher': row['lesson__subject__teacher__full_name'],
+        },
+        'is_present': row['status'] in ['present', 'late'],
+        'created_at': _datetime(row['created_at']),
+    }
+
+
+def attendance_rows(rows):
+    return [attendance_row(row) for row in rows]
+
+
+QR_CODE_VALUES = (
+    'id', 'code', 'lesson__id', 'lesson__subject__name', 'lesson__class_room__name',
+    'lesson__start_time', 'lesson__end_time', 'student__full_name', 'created_at',
+)
+QR_CODE_FIELDS = ['id', 'code', 'qr_image_url', 'lesson_info', 'student_name', 'created_at']
+
+
+def qr_code_rows(rows, request, query, fields=()):
+    # Metadata only: rows that embed the rendered image take the serializer.
+    wanted = [name for name in QR_CODE_FIELDS if not fields or name in fields]
+    origin = request.build_absolute_uri('/')[:-1]
+    suffix = f'?{query}' if query else ''
+    result = []
+    for row in rows:
+        item = {
+            'id': row['id'],
+            'code': row['code'],
+            'qr_image_url': f"{origin}{reverse('qr_code_image', args=[row['id']])}{suffix}",
+            'lesson_info': {
+                'subject': row['lesson__subject__name'],
+                'class': row['lesson__class_room__name'],
+                'start_time': _raw_datetime(row['lesson__start_time']),
+                'end_time': _raw_datetime(row['lesson__end_time']),
+            },
+            'student_name': row['student__full_name'],
+            'created_at': _datetime(row['created_at']),
+        }
+        result.append({name: item[name] for name in wanted})
+    return result
@@ -0,0 +1,163 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .rendering import QR_RENDER_DEFAULTS, render_qr
+
+
+DEFAULT_QR_IMAGE_CACHE = {
+    'MAX_ENTRIES': 2048,
+    'SHARED_CACHE': None,
+    'TIMEOUT': 60 * 60 * 24 * 7,
+    'KEY_PREFIX': 'qr_img',
+    'CACHE_CONTROL': 'private, max-age=31536000, immutable',
+}
+
+
+def render_key(code, params):
+    # The rendered bytes depend only on the payload and the render parameters,
+    # so the key is content-addressed and never needs invalidating.
+    raw = '|'.join([code] + [f'{name}={params[name]}' for name in sorted(params)])
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class QRImageCache:
+    def __init__(self, max_entries=2048, shared_cache=None, timeout=None, key_prefix='qr_img'):
+        self.max_entries = max_entries
+        self.shared_cache = shared_cache
+        self.timeout = timeout
+        self.key_prefix = key_prefix
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def shared(self):
+        if not self.shared_cache:
+            return None
+        return caches[self.shared_cache]
+
+    def _shared_key(self, key):
+        return f'{self.key_prefix}:{key}'
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+
+        shared = self.shared
+        if shared is not None:
+            value = shared.get(self._shared_key(key))
+            if value is not None:
+                with self._lock:
+                    self.shared_hits += 1
+                self._store_local(key, value)
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def peek(self, key):
+        # A lookup that leaves the cache as it was: no LRU reordering, no
+        # copy of a shared hit into this process and no hit/miss counted.
+        with self._lock:
+            value = self._entries.get(key)
+        if value is None and self.shared is not None:
+            value = self.shared.get(self._shared_key(key))
+        return value
+
+    def set(self, key, value):
+        self._store_local(key, value)
+        shared = self.shared
+        if shared is not None:
+            shared.set(self._shared_key(key), value, timeout=self.timeout)
+
+    def publish(self, items):
+        shared = self.shared
+        if shared is None:
+            return 0
+        shared.set_many(
+            {self._shared_key(key): value for key, value in items.items()},
+            timeout=self.timeout,
+        )
+        return len(items)
+
+    def _store_local(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def key_for(self, code, **params):
+        return render_key(code, {**QR_RENDER_DEFAULTS, **params})
+
+    def get_or_render(self, code, **params):
+        params = {**QR_RENDER_DEFAULTS, **params}
+        key = render_key(code, params)
+        value = self.get(key)
+        if value is None:
+            value = render_qr(code, **params)
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.shared_hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'shared_cache': self.shared_cache,
+                'hits': self.hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': round((self.hits + self.shared_hits) / lookups, 4) if lookups else 0,
+            }
+
+
+_qr_image_cache = None
+
+
+def qr_image_cache_option(name):
+    return {**DEFAULT_QR_IMAGE_CACHE, **getattr(settings, 'QR_IMAGE_CACHE', {})}[name]
+
+
+def get_qr_image_cache():
+    global _qr_image_cache
+    if _qr_image_cache is None:
+        options = {**DEFAULT_QR_IMAGE_CACHE, **getattr(settings, 'QR_IMAGE_CACHE', {})}
+        _qr_image_cache = QRImageCache(
+            max_entries=options['MAX_ENTRIES'],
+            shared_cache=options['SHARED_CACHE'],
+            timeout=options['TIMEOUT'],
+            key_prefix=options['KEY_PREFIX'],
+        )
+    return _qr_image_cache
+
+
+@receiver(setting_changed)
+def _reset_qr_image_cache(sender, setting, **kwargs):
+    global _qr_image_cache
+    if setting == 'QR_IMAGE_CACHE':
+        _qr_image_cache = None
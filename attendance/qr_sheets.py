@@ -0,0 +1,198 @@
+import io
+import struct
+import zlib
+
+from PIL import Image, ImageDraw
+
+from .qr_cache import get_qr_image_cache
+from .rendering import QR_RENDER_DEFAULTS, build_qr, render_qr
+
+
+LABEL_HEIGHT = 16
+PDF_PAGE_SIZE = (595, 842)  # A4 in points
+PDF_MARGIN = 28
+
+
+def sheet_cell_size(code, params):
+    qr = build_qr(
+        code,
+        box_size=params['box_size'],
+        border=params['border'],
+        error_correction=params['error_correction'],
+    )
+    return len(qr.get_matrix()) * params['box_size']
+
+
+def cached_modules(code, params):
+    # Sheets use small boxes and borders that nothing else renders, so the
+    # cache is peeked for the default render, which scans and
+    # prerender_qr_codes keep warm, and its modules are cut out of the quiet
+    # zone. A peek leaves the LRU as it was, so a 1000-student sheet doesn't
+    # push the hot entries out. Returns None when there is nothing to reuse.
+    if params['error_correction'] != QR_RENDER_DEFAULTS['error_correction']:
+        return None
+    image_cache = get_qr_image_cache()
+    png = image_cache.peek(image_cache.key_for(code))
+    if png is None:
+        return None
+    image = Image.open(io.BytesIO(png)).convert('1')
+    margin = QR_RENDER_DEFAULTS['border'] * QR_RENDER_DEFAULTS['box_size']
+    return image.crop((margin, margin, image.width - margin, image.height - margin))
+
+
+def sheet_tile(code, label, params, cell_size):
+    tile = Image.new('1', (cell_size, cell_size + LABEL_HEIGHT), 1)
+    modules = cached_modules(code, params)
+    if modules is not None:
+        # Every module maps onto a whole number of pixels, so nearest
+        # neighbour scaling reproduces a render at the sheet's box size.
+        margin = params['border'] * params['box_size']
+        size = cell_size - 2 * margin
+        tile.paste(modules.resize((size, size), Image.NEAREST), (margin, margin))
+    else:
+        qr = Image.open(io.BytesIO(render_qr(code, **params))).convert('1')
+        if qr.width > cell_size:
+            qr = qr.resize((cell_size, cell_size), Image.NEAREST)
+        tile.paste(qr, ((cell_size - qr.width) // 2, (cell_size - qr.height) // 2))
+    ImageDraw.Draw(tile).text((4, cell_size + 2), label[:40], fill=0)
+    return tile
+
+
+def iter_tile_rows(entries, params, columns, cell_size):
+    row = []
+    for code, label in entries:
+        row.append(sheet_tile(code, label, params, cell_size))
+        if len(row) == columns:
+            yield row
+            row = []
+    if row:
+        yield row
+
+
+def compose_row(tiles, columns, cell_size):
+    strip = Image.new('1', (columns * cell_size, cell_size + LABEL_HEIGHT), 1)
+    for index, tile in enumerate(tiles):
+        strip.paste(tile, (index * cell_size, 0))
+    return strip
+
+
+def _png_chunk(tag, data):
+    return (
+        struct.pack('>I', len(data)) + tag + data
+        + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+    )
+
+
+def stream_png_sheet(entries, total, params, columns, cell_size):
+    # 1-bit grayscale PNG written one strip of tiles at a time; only the
+    # current strip is ever held in memory.
+    width = columns * cell_size
+    rows = max(1, -(-total // columns))
+    height = rows * (cell_size + LABEL_HEIGHT)
+    stride = (width + 7) // 8
+
+    yield b'\x89PNG\r\n\x1a\n'
+    yield _png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 1, 0, 0, 0, 0))
+
+    compressor = zlib.compressobj(9)
+    written = 0
+    for tiles in iter_tile_rows(entries, params, columns, cell_size):
+        if written == rows:
+            break
+        raw = compose_row(tiles, columns, cell_size).tobytes()
+        scanlines = b''.join(
+            b'\x00' + raw[offset:offset + stride] for offset in range(0, len(raw), stride)
+        )
+        yield _png_chunk(b'IDAT', compressor.compress(scanlines) + compressor.flush(zlib.Z_SYNC_FLUSH))
+        written += 1
+
+    # Pad with blank rows if fewer codes arrived than were counted.
+    blank = (b'\x00' + b'\xff' * stride) * (cell_size + LABEL_HEIGHT)
+    for _ in range(rows - written):
+        yield _png_chunk(b'IDAT', compressor.compress(blank))
+    yield _png_chunk(b'IDAT', compressor.flush())
+    yield _png_chunk(b'IEND', b'')
+
+
+class _PDFWriter:
+    def __init__(self):
+        self.offset = 0
+        self.offsets = {}
+        self.next_id = 3  # 1 is the catalog, 2 the page tree
+
+    def allocate(self):
+        obj_id = self.next_id
+        self.next_id += 1
+        return obj_id
+
+    def write(self, data):
+        self.offset += len(data)
+        return data
+
+    def obj(self, obj_id, body, stream=None):
+        self.offsets[obj_id] = self.offset
+        if stream is None:
+            return self.write(f'{obj_id} 0 obj\n{body}\nendobj\n'.encode())
+        return self.write(
+            f'{obj_id} 0 obj\n{body}\nstream\n'.encode() + stream + b'\nendstream\nendobj\n'
+        )
+
+
+def stream_pdf_sheet(entries, params, columns, cell_size, rows_per_page):
+    # Each page is a single Flate-compressed 1-bit image. Pages are emitted as
+    # soon as they are full; the page tree and xref follow at the end.
+    pdf = _PDFWriter()
+    page_ids = []
+    page_width, page_height = PDF_PAGE_SIZE
+
+    yield pdf.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    yield pdf.obj(1, '<< /Type /Catalog /Pages 2 0 R >>')
+
+    def page(strips):
+        image = Image.new('1', (columns * cell_size, len(strips) * (cell_size + LABEL_HEIGHT)), 1)
+        for index, strip in enumerate(strips):
+            image.paste(strip, (0, index * (cell_size + LABEL_HEIGHT)))
+
+        scale = min(
+            (page_width - 2 * PDF_MARGIN) / image.width,
+            (page_height - 2 * PDF_MARGIN) / (rows_per_page * (cell_size + LABEL_HEIGHT)),
+        )
+        draw_width, draw_height = image.width * scale, image.height * scale
+        top = page_height - PDF_MARGIN - draw_height
+
+        image_id, content_id, page_id = pdf.allocate(), pdf.allocate(), pdf.allocate()
+        data = zlib.compress(image.tobytes(), 9)
+        content = f'q {draw_width:.2f} 0 0 {draw_height:.2f} {PDF_MARGIN} {top:.2f} cm /Im0 Do Q'.encode()
+        page_ids.append(page_id)
+        return b''.join([
+            pdf.obj(
+                image_id,
+                f'<< /Type /XObject /Subtype /Image /Width {image.width} /Height {image.height} '
+                f'/ColorSpace /DeviceGray /BitsPerComponent 1 /Filter /FlateDecode /Length {len(data)} >>',
+                data,
+            ),
+            pdf.obj(content_id, f'<< /Length {len(content)} >>', content),
+            pdf.obj(
+                page_id,
+                f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {page_width} {page_height}] '
+                f'/Resources << /XObject << /Im0 {image_id} 0 R >> >> /Contents {content_id} 0 R >>',
+            ),
+        ])
+
+    strips = []
+    for tiles in iter_tile_rows(entries, params, columns, cell_size):
+        strips.append(compose_row(tiles, columns, cell_size))
+        if len(strips) == rows_per_page:
+            yield page(strips)
+            strips = []
+    if strips or not page_ids:
+        yield page(strips or [Image.new('1', (columns * cell_size, cell_size + LABEL_HEIGHT), 1)])
+
+    kids = ' '.join(f'{page_id} 0 R' for page_id in page_ids)
+    yield pdf.obj(2, f'<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>')
+
+    xref_offset = pdf.offset
+    lines = [f'xref\n0 {pdf.next_id}\n', '0000000000 65535 f \n']
+    lines += [f'{pdf.offsets[obj_id]:010d} 00000 n \n' for obj_id in range(1, pdf.next_id)]
+    lines.append(f'trailer\n<< /Size {pdf.next_id} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n')
+    yield pdf.write(''.join(lines).encode())
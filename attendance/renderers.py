@@ -0,0 +1,119 @@
+import abc
+import csv
+import io
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # optional; JSONRenderer's output is used instead
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    # JSONRenderer output produced by orjson. Types orjson would format
+    # differently (datetimes) or not at all (Decimal, lazy strings) go through
+    # DRF's own encoder, so the bytes match JSONRenderer's compact output.
+    # Indented or ASCII-only output falls back to JSONRenderer.
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or data is None
+            or self.ensure_ascii
+            or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(
+                data,
+                default=self.encoder_class().default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME,
+            )
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+class StreamingRenderer(BaseRenderer, abc.ABC):
+    # Renders a sequence of records; subclasses implement chunks(), which
+    # yields the encoded bytes of each record. stream() is a generator for
+    # StreamingHttpResponse: the first chunk (with any header) is sent as soon
+    # as it is rendered, so the client sees the download start, and the rest
+    # leaves in chunks of about BUFFER_SIZE bytes while the rows are still
+    # being read. render() handles the ordinary Responses of the same view,
+    # such as errors.
+    charset = 'utf-8'
+    BUFFER_SIZE = 64 * 1024
+
+    def stream(self, rows):
+        chunks = iter(self.chunks(rows))
+        first = next(chunks, None)
+        if first is None:
+            return
+        yield first
+
+        buffer = []
+        size = 0
+        for chunk in chunks:
+            buffer.append(chunk)
+            size += len(chunk)
+            if size >= self.BUFFER_SIZE:
+                yield b''.join(buffer)
+                buffer = []
+                size = 0
+        if buffer:
+            yield b''.join(buffer)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return b''.join(self.chunks(data if isinstance(data, list) else [data]))
+
+    @abc.abstractmethod
+    def chunks(self, rows):
+        ...
+
+
+def flatten(row, prefix=''):
+    # {'lesson_info': {'subject': ...}} -> {'lesson_info.subject': ...}
+    flat = {}
+    for key, value in row.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f'{prefix}{key}.'))
+        else:
+            flat[f'{prefix}{key}'] = value
+    return flat
+
+
+class CSVRenderer(StreamingRenderer):
+    # One header line taken from the first record; nested objects become
+    # dotted columns.
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def chunks(self, rows):
+        out = io.StringIO()
+        writer = None
+        for row in rows:
+            row = flatten(row)
+            if writer is None:
+                writer = csv.DictWriter(out, fieldnames=list(row), extrasaction='ignore')
+                writer.writeheader()
+            writer.writerow(row)
+            yield out.getvalue().encode(self.charset)
+            out.seek(0)
+            out.truncate()
+
+
+class NDJSONRenderer(StreamingRenderer):
+    # One JSON document per line, each the bytes JSONRenderer gives the record.
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    def chunks(self, rows):
+        renderer = FastJSONRenderer()
+        for row in rows:
+            yield renderer.render(row) + b'\n'
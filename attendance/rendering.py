@@ -0,0 +1,85 @@
+import io
+
+import qrcode
+import qrcode.image.svg
+from PIL import Image
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+QR_FORMATS = {
+    'png': 'image/png',
+    'png1bit': 'image/png',
+    'svg': 'image/svg+xml',
+}
+
+QR_ERROR_CORRECTION = {
+    'L': qrcode.constants.ERROR_CORRECT_L,
+    'M': qrcode.constants.ERROR_CORRECT_M,
+    'Q': qrcode.constants.ERROR_CORRECT_Q,
+    'H': qrcode.constants.ERROR_CORRECT_H,
+}
+
+QR_RENDER_DEFAULTS = {
+    'format': 'png',
+    'box_size': 10,
+    'border': 5,
+    'error_correction': 'M',
+}
+
+
+def build_qr(data, box_size=10, border=5, error_correction='M'):
+    qr = qrcode.QRCode(
+        version=1,
+        box_size=box_size,
+        border=border,
+        error_correction=QR_ERROR_CORRECTION[error_correction],
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+    return qr
+
+
+def rasterize_pil(qr):
+    return qr.make_image(fill_color="black", back_color="white").get_image()
+
+
+def rasterize_numpy(qr):
+    # Expand the module matrix (border included) to pixels in two repeats,
+    # pack it to 1 bit per pixel and hand the rows straight to PIL.
+    dark = np.asarray(qr.get_matrix(), dtype=bool)
+    pixels = np.repeat(np.repeat(~dark, qr.box_size, axis=0), qr.box_size, axis=1)
+    height, width = pixels.shape
+    packed = np.packbits(pixels, axis=1)
+    return Image.frombuffer('1', (width, height), packed, 'raw', '1', 0, 1)
+
+
+RASTERIZERS = {'pil': rasterize_pil}
+if np is not None:
+    RASTERIZERS['numpy'] = rasterize_numpy
+
+
+def default_rasterizer():
+    from django.conf import settings
+    name = getattr(settings, 'QR_RASTERIZER', 'numpy') if settings.configured else 'numpy'
+    return name if name in RASTERIZERS else 'pil'
+
+
+def render_qr(data, format='png', box_size=10, border=5, error_correction='M', rasterizer=None):
+    qr = build_qr(data, box_size=box_size, border=border, error_correction=error_correction)
+
+    if format == 'svg':
+        img = qr.make_image(image_factory=qrcode.image.svg.SvgPathImage)
+        return img.to_string(encoding='utf-8')
+
+    img = RASTERIZERS[rasterizer or default_rasterizer()](qr)
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG', optimize=format == 'png1bit')
+    return buffer.getvalue()
+
+
+def render_qr_batch(codes, params):
+    return [(code, render_qr(code, **params)) for code in codes]
@@ -0,0 +1,184 @@
+import functools
+import hashlib
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from rest_framework.response import Response
+
+from .projections import fast_read_path_option
+
+
+DEFAULT_RESPONSE_CACHE = {
+    'ENABLED': True,
+    'CACHE': 'default',
+    'TIMEOUT': 300,
+    'KEY_PREFIX': 'resp',
+}
+
+ADMIN_SCOPE = 'admin'
+
+
+def user_scope(user_id):
+    return f'user:{user_id}'
+
+
+def scope_for(user):
+    # Admins all see the same lists; teachers and students see their own.
+    return ADMIN_SCOPE if user.role == 'admin' else user_scope(user.id)
+
+
+def plain(data):
+    # Serializer output (ReturnList/ReturnDict) keeps a reference to its
+    # serializer; cache only the plain containers.
+    if isinstance(data, dict):
+        return {key: plain(value) for key, value in data.items()}
+    if isinstance(data, list):
+        return [plain(value) for value in data]
+    return data
+
+
+class ResponseCache:
+    # GET responses cached per (endpoint, scope, full URL). Every scope has a
+    # version token that is part of the key; invalidating a scope replaces the
+    # token, so its old entries are never read again and simply expire. A
+    # response computed while the scope is invalidated is stored under the
+    # version read before the queries ran, which nobody reads any more.
+
+    def __init__(self, cache_alias='default', timeout=300, key_prefix='resp'):
+        self.cache_alias = cache_alias
+        self.timeout = timeout
+        self.key_prefix = key_prefix
+        self._lock = threading.Lock()
+        self.hits = {}
+        self.misses = {}
+        self.invalidations = 0
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def _version_key(self, scope):
+        return f'{self.key_prefix}:v:{scope}'
+
+    def version(self, scope):
+        key = self._version_key(scope)
+        version = self.cache.get(key)
+        if version is None:
+            # A fresh random token rather than 0: an evicted version must not
+            # bring back the entries it used to cover.
+            self.cache.add(key, uuid.uuid4().hex, timeout=None)
+            version = self.cache.get(key)
+        return version
+
+    def key_for(self, endpoint, request):
+        url = hashlib.sha256(request.build_absolute_uri().encode()).hexdigest()
+        scope = scope_for(request.user)
+        # The two read paths are byte-identical by design, but a body built by
+        # one is never served as the other's.
+        path = 'fast' if fast_read_path_option('ENABLED') else 'serializer'
+        return f'{self.key_prefix}:{endpoint}:{scope}:{self.version(scope)}:{path}:{url}'
+
+    def get(self, endpoint, key):
+        data = self.cache.get(key)
+        with self._lock:
+            counter = self.misses if data is None else self.hits
+            counter[endpoint] = counter.get(endpoint, 0) + 1
+        return data
+
+    def set(self, key, data):
+        self.cache.set(key, plain(data), timeout=self.timeout)
+
+    def invalidate(self, scopes):
+        scopes = set(scopes)
+        if not scopes:
+            return
+        self.cache.set_many(
+            {self._version_key(scope): uuid.uuid4().hex for scope in scopes},
+            timeout=None,
+        )
+        with self._lock:
+            self.invalidations += len(scopes)
+
+    def stats(self):
+        with self._lock:
+            endpoints = {}
+            for endpoint in sorted(set(self.hits) | set(self.misses)):
+                hits = self.hits.get(endpoint, 0)
+                misses = self.misses.get(endpoint, 0)
+                endpoints[endpoint] = {
+                    'hits': hits,
+                    'misses': misses,
+                    'hit_ratio': round(hits / (hits + misses), 4) if hits + misses else 0,
+                }
+            return {
+                'cache': self.cache_alias,
+                'endpoints': endpoints,
+                'invalidated_scopes': self.invalidations,
+            }
+
+
+_response_cache = None
+
+
+def response_cache_option(name):
+    return {**DEFAULT_RESPONSE_CACHE, **getattr(settings, 'RESPONSE_CACHE', {})}[name]
+
+
+def get_response_cache():
+    global _response_cache
+    if _response_cache is None:
+        options = {**DEFAULT_RESPONSE_CACHE, **getattr(settings, 'RESPONSE_CACHE', {})}
+        _response_cache = ResponseCache(
+            cache_alias=options['CACHE'],
+            timeout=options['TIMEOUT'],
+            key_prefix=options['KEY_PREFIX'],
+        )
+    return _response_cache
+
+
+def invalidate_scopes(scopes):
+    # After commit, so a request cannot cache the old rows under the new
+    # version while the change is still uncommitted.
+    scopes = set(scopes)
+    if scopes:
+        transaction.on_commit(lambda: get_response_cache().invalidate(scopes))
+
+
+def cache_response(endpoint, skip_params=()):
+    # Caches the 200 responses of a GET view. Requests carrying one of
+    # skip_params depend on the clock rather than on the data (e.g.
+    # ?upcoming=) and are always computed.
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if (
+                request.method != 'GET'
+                or not response_cache_option('ENABLED')
+                or any(name in request.GET for name in skip_params)
+            ):
+                return view(request, *args, **kwargs)
+
+            response_cache = get_response_cache()
+            key = response_cache.key_for(endpoint, request)
+            data = response_cache.get(endpoint, key)
+            if data is not None:
+                return Response(data)
+
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200 and isinstance(response, Response):
+                response_cache.set(key, response.data)
+            return response
+        return wrapper
+    return decorator
+
+
+@receiver(setting_changed)
+def _reset_response_cache(sender, setting, **kwargs):
+    global _response_cache
+    if setting == 'RESPONSE_CACHE':
+        _response_cache = None
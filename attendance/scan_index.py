@@ -0,0 +1,126 @@
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db.models import Min
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Lesson, QRCode, User
+
+
+DEFAULT_SCAN_INDEX = {
+    'ENABLED': True,
+    'MAX_AGE': 60,
+}
+
+
+class ActiveLessonIndex:
+    # Per-process map of the codes of lessons whose start_time..end_time
+    # window is open right now. It is rebuilt in bulk when a lesson opens or
+    # closes, when a signal reports a change, or after MAX_AGE seconds as a
+    # bound on changes made by other processes.
+
+    def __init__(self, max_age=60):
+        self.max_age = timedelta(seconds=max_age)
+        self._snapshot = ({}, {}, {})
+        self._valid_until = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+
+    def invalidate(self):
+        self._valid_until = None
+
+    def _ensure_fresh(self, now):
+        if self._valid_until is not None and now < self._valid_until:
+            return
+        with self._lock:
+            if self._valid_until is None or now >= self._valid_until:
+                self._load(now)
+
+    def _load(self, now):
+        lessons = {
+            lesson.id: lesson
+            for lesson in Lesson.objects.filter(
+                start_time__lte=now, end_time__gte=now
+            ).select_related('subject__teacher', 'class_room')
+        }
+        codes = {}
+        students = {}
+        if lessons:
+            codes = {
+                code: (lesson_id, student_id)
+                for code, lesson_id, student_id in QRCode.objects.filter(
+                    lesson_id__in=list(lessons)
+                ).values_list('code', 'lesson_id', 'student_id')
+            }
+            students = {
+                student.id: student
+                for student in User.objects.filter(
+                    student_classes__in={lesson.class_room_id for lesson in lessons.values()}
+                ).only('id', 'full_name').distinct()
+            }
+
+        boundaries = [now + self.max_age]
+        next_start = Lesson.objects.filter(start_time__gt=now).aggregate(value=Min('start_time'))['value']
+        if next_start is not None:
+            boundaries.append(next_start)
+        if lessons:
+            boundaries.append(min(lesson.end_time for lesson in lessons.values()) + timedelta(microseconds=1))
+
+        self._snapshot = (codes, lessons, students)
+        self._valid_until = min(boundaries)
+        self.loads += 1
+
+    def snapshot(self, now=None):
+        # (codes, lessons, students): code -> (lesson_id, student_id), and the
+        # open lessons and their students keyed by id. Callers keep the tuple
+        # so a concurrent reload cannot mix two generations.
+        self._ensure_fresh(now or timezone.now())
+        return self._snapshot
+
+    def record(self, hits, misses):
+        self.hits += hits
+        self.misses += misses
+
+    def stats(self):
+        codes, lessons, _ = self._snapshot
+        return {
+            'codes': len(codes),
+            'open_lessons': len(lessons),
+            'valid_until': self._valid_until,
+            'hits': self.hits,
+            'misses': self.misses,
+            'loads': self.loads,
+        }
+
+
+_scan_index = None
+
+
+def scan_index_option(name):
+    return {**DEFAULT_SCAN_INDEX, **getattr(settings, 'SCAN_INDEX', {})}[name]
+
+
+def get_scan_index():
+    global _scan_index
+    if not scan_index_option('ENABLED'):
+        return None
+    if _scan_index is None:
+        _scan_index = ActiveLessonIndex(max_age=scan_index_option('MAX_AGE'))
+    return _scan_index
+
+
+def invalidate_scan_index():
+    if _scan_index is not None:
+        _scan_index.invalidate()
+
+
+@receiver(setting_changed)
+def _reset_scan_index(sender, setting, **kwargs):
+    global _scan_index
+    if setting == 'SCAN_INDEX':
+        _scan_index = None
@@ -0,0 +1,293 @@
+from collections import namedtuple
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .live_roster import publish_attendance
+from .models import Attendance, Lesson, QRCode, ScanReceipt
+from .qr_tokens import is_qr_token, signed_tokens_enabled, verify_qr_token
+from .scan_index import get_scan_index
+from .write_behind import get_scan_queue
+
+
+# lesson and student are only set when the target came from the active
+# lesson index; they let the response be built without further reads.
+ScanTarget = namedtuple(
+    'ScanTarget',
+    ['code', 'lesson_id', 'student_id', 'teacher_id', 'start_time', 'lesson', 'student'],
+    defaults=(None, None),
+)
+
+
+def classify_scan(start_time, scanned_at):
+    time_diff = scanned_at - start_time
+    if time_diff <= timedelta(minutes=15):
+        return 'present'
+    if time_diff <= timedelta(minutes=30):
+        return 'late'
+    return 'absent'
+
+
+def resolve_scan_code(code):
+    return resolve_scan_codes([code]).get(code)
+
+
+def _target_from_index(code, lesson, student_id, students):
+    return ScanTarget(
+        code, lesson.id, student_id, lesson.subject.teacher_id, lesson.start_time,
+        lesson, students.get(student_id),
+    )
+
+
+def resolve_scan_codes(codes, scanned_at=None):
+    # scanned_at optionally maps codes to when they were scanned; signed
+    # tokens are checked for expiry against that time instead of now.
+    codes = set(codes)
+    scanned_at = scanned_at or {}
+    targets = {}
+    index_codes, index_lessons, index_students = {}, {}, {}
+    index = get_scan_index()
+    if index is not None:
+        index_codes, index_lessons, index_students = index.snapshot()
+
+    token_claims = {}
+    if signed_tokens_enabled():
+        # The signature already proves which student and lesson a token is
+        # for; only the lessons' teacher and start time are read.
+        for code in codes:
+            if is_qr_token(code):
+                claims = verify_qr_token(code, now=scanned_at.get(code))
+                if claims is not None:
+                    token_claims[code] = claims
+
+    for code, claims in list(token_claims.items()):
+        lesson = index_lessons.get(claims.lesson_id)
+        if lesson is not None:
+            targets[code] = _target_from_index(code, lesson, claims.student_id, index_students)
+            del token_claims[code]
+    uuid_codes = []
+    for code in codes:
+        if is_qr_token(code):
+            continue
+        entry = index_codes.get(code)
+        if entry is None:
+            uuid_codes.append(code)
+        else:
+            lesson_id, student_id = entry
+            targets[code] = _target_from_index(code, index_lessons[lesson_id], student_id, index_students)
+    if index is not None:
+        index.record(len(targets), len(codes) - len(targets))
+
+    if token_claims:
+        lessons = {
+            lesson_id: (teacher_id, start_time)
+            for lesson_id, teacher_id, start_time in Lesson.objects.filter(
+                id__in={claims.lesson_id for claims in token_claims.values()}
+            ).values_list('id', 'subject__teacher_id', 'start_time')
+        }
+        for code, claims in token_claims.items():
+            if claims.lesson_id in lessons:
+                targets[code] = ScanTarget(code, claims.lesson_id, claims.student_id, *lessons[claims.lesson_id])
+
+    if uuid_codes:
+        rows = QRCode.objects.filter(code__in=uuid_codes).values_list(
+            'code', 'lesson_id', 'student_id', 'lesson__subject__teacher_id', 'lesson__start_time'
+        )
+        for row in rows:
+            targets[row[0]] = ScanTarget(*row)
+    return targets
+
+
+UPSERT_ATTENDANCE_SQL = (
+    'INSERT INTO {table} AS attendance (lesson_id, student_id, status, marked_at, created_at) '
+    'VALUES {values} '
+    'ON CONFLICT (lesson_id, student_id) DO UPDATE '
+    'SET status = excluded.status, marked_at = excluded.marked_at '
+    'WHERE attendance.marked_at IS NULL OR excluded.marked_at < attendance.marked_at '
+    'RETURNING id, lesson_id, student_id, status, marked_at, created_at'
+)
+
+
+def upsert_attendance(attendances):
+    # The earliest scan of a student wins, whatever order the scans arrive
+    # in: an offline upload replaces a later online scan, and a rescan never
+    # turns present into late. Each batch is one INSERT ... ON CONFLICT DO
+    # UPDATE whose WHERE only overwrites a stored row holding a later scan,
+    # or none (the absent rows of Lesson.finalize), so concurrent scans of
+    # the same student cannot race on the constraint. Returns the rows that
+    # were inserted or updated, as stored; rows that kept an earlier scan
+    # are left out.
+    earliest = {}
+    for attendance in attendances:
+        pair = (attendance.lesson_id, attendance.student_id)
+        if pair not in earliest or attendance.marked_at < earliest[pair].marked_at:
+            earliest[pair] = attendance
+    if not earliest:
+        return []
+    
+    fields = [Attendance._meta.get_field(name) for name in ('lesson', 'student', 'status', 'marked_at', 'created_at')]
+    batch_size = connection.ops.bulk_batch_size(fields, list(earliest.values()))
+    placeholder = '(%s)' % ', '.join(['%s'] * len(fields))
+    created_at = timezone.now()
+    rows = [
+        [
+            field.get_db_prep_save(value, connection)
+            for field, value in zip(fields, (
+                attendance.lesson_id, attendance.student_id, attendance.status,
+                attendance.marked_at, created_at,
+            ))
+        ]
+        for attendance in earliest.values()
+    ]
+    written = []
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        sql = UPSERT_ATTENDANCE_SQL.format(
+            table=connection.ops.quote_name(Attendance._meta.db_table),
+            values=', '.join([placeholder] * len(batch)),
+        )
+        written.extend(Attendance.objects.raw(sql, [param for row in batch for param in row]))
+    return written
+
+
+def mark_attendance_batch(codes, teacher, scanned_at):
+    targets = resolve_scan_codes(codes)
+    results = []
+    attendances = []
+    seen_pairs = set()
+
+    for code in codes:
+        target = targets.get(code)
+        if target is None:
+            results.append({'qr_code': code, 'result': 'invalid'})
+            continue
+
+        # Authorize first: another teacher's code is wrong_teacher however
+        # often it repeats, and never reveals which student it belongs to.
+        if target.teacher_id != teacher.id:
+            results.append({'qr_code': code, 'result': 'wrong_teacher', 'lesson': target.lesson_id})
+            continue
+
+        pair = (target.lesson_id, target.student_id)
+        if pair in seen_pairs:
+            results.append({'qr_code': code, 'result': 'duplicate', 'lesson': target.lesson_id, 'student': target.student_id})
+            continue
+        seen_pairs.add(pair)
+
+        status = classify_scan(target.start_time, scanned_at)
+        attendances.append(Attendance(
+            lesson_id=target.lesson_id,
+            student_id=target.student_id,
+            status=status,
+            marked_at=scanned_at,
+        ))
+        results.append({'qr_code': code, 'result': 'ok', 'lesson': target.lesson_id, 'student': target.student_id, 'status': status})
+
+    record_attendance(attendances)
+    return results
+
+
+def record_attendance(attendances):
+    # Returns the rows written, as stored, or None when the scans were handed
+    # to the write-behind queue, which publishes them once it flushes them.
+    if not attendances:
+        return []
+    queue = get_scan_queue()
+    if queue is not None:
+        queue.enqueue(attendances)
+        return None
+    # One INSERT ... ON CONFLICT DO UPDATE per batch of rows; see
+    # upsert_attendance for the earliest-scan rule it applies. Only the rows
+    # it changed reach live rosters, with their stored values.
+    with transaction.atomic():
+        written = upsert_attendance(attendances)
+        publish_attendance(written)
+    return written
+
+
+def sync_scans(teacher, device_id, records, now):
+    # Offline scanners upload (code, scanned_at, seq) records. (teacher,
+    # device_id, seq) is the idempotency key: a record seen before returns its
+    # stored result, so retrying a whole upload is safe.
+    seqs = {record['seq'] for record in records}
+    stored = {
+        receipt.seq: receipt
+        for receipt in ScanReceipt.objects.filter(teacher=teacher, device_id=device_id, seq__in=seqs)
+    }
+    fresh = {}
+    for record in records:
+        if record['seq'] not in stored:
+            fresh.setdefault(record['seq'], record)
+
+    # A signed token is valid if its earliest scan in the upload was made
+    # before it expired (with the usual grace window), however late the
+    # upload arrives; later scans of the same code are duplicates anyway.
+    scan_times = {}
+    for record in fresh.values():
+        scanned_at = min(record['scanned_at'], now)
+        if record['code'] not in scan_times or scanned_at < scan_times[record['code']]:
+            scan_times[record['code']] = scanned_at
+    targets = resolve_scan_codes(scan_times, scanned_at=scan_times)
+    receipts = []
+    earliest = {}
+    for seq, record in sorted(fresh.items()):
+        scanned_at = min(record['scanned_at'], now)
+        target = targets.get(record['code'])
+        receipt = ScanReceipt(
+            teacher=teacher, device_id=device_id, seq=seq,
+            code=record['code'], scanned_at=scanned_at,
+        )
+        receipts.append(receipt)
+        if target is None:
+            receipt.result = 'invalid'
+            continue
+        if target.teacher_id != teacher.id:
+            receipt.result = 'wrong_teacher'
+            continue
+
+        pair = (target.lesson_id, target.student_id)
+        previous = earliest.get(pair)
+        if previous is not None and previous[0].scanned_at <= scanned_at:
+            receipt.result = 'duplicate'
+            continue
+        if previous is not None:
+            previous[0].result = 'duplicate'
+            previous[0].attendance_status = ''
+        receipt.result = 'ok'
+        receipt.attendance_status = classify_scan(target.start_time, scanned_at)
+        earliest[pair] = (receipt, target)
+
+    # The earliest scan of a student wins, also against rows already marked
+    # online; upsert_attendance enforces it, including for scans still in the
+    # write-behind queue.
+    attendances = [
+        Attendance(
+            lesson_id=lesson_id, student_id=student_id,
+            status=receipt.attendance_status, marked_at=receipt.scanned_at,
+        )
+        for (lesson_id, student_id), (receipt, _) in earliest.items()
+    ]
+
+    with transaction.atomic():
+        record_attendance(attendances)
+        ScanReceipt.objects.bulk_create(receipts, ignore_conflicts=True)
+
+    results = {receipt.seq: receipt for receipt in receipts}
+    results.update(stored)
+    return [
+        {
+            'seq': seq,
+            'qr_code': receipt.code,
+            'result': receipt.result,
+            'status': receipt.attendance_status or None,
+        }
+        for seq, receipt in sorted(results.items())
+    ]
+
+
+def sync_cursor(teacher, device_id):
+    return ScanReceipt.objects.filter(teacher=teacher, device_id=device_id).aggregate(
+        cursor=Max('seq')
+    )['cursor']
@@ -1,8 +1,12 @@
 from rest_framework import serializers
 from django.contrib.auth import authenticate
+from django.db.models import Prefetch
+from django.urls import reverse
+from django.utils.http import urlencode
 from django.utils import timezone
-from datetime import timedelta
 from .models import User, Class, Subject, Lesson, QRCode, Attendance
+from .rendering import QR_ERROR_CORRECTION, QR_FORMATS, QR_RENDER_DEFAULTS
+from .scanning import classify_scan, mark_attendance_batch, resolve_scan_code, sync_scans, record_attendance
 
 
 class ForgotPasswordSerializer(serializers.Serializer):
@@ -47,6 +51,44 @@ class ResetPasswordSerializer(serializers.Serializer):
         cache.delete(f"reset_code_{phone_number}")
         return user
 
+def split_param(value):
+    return [item.strip() for item in (value or '').split(',') if item.strip()]
+
+
+class DynamicFieldsMixin:
+    # Drops every field not listed in context['fields'] (a ?fields=a,b switch).
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = self.context.get('fields')
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+class ExpandableFieldsMixin:
+    # Relations in `expandable` render as ids unless context['expand'] (a
+    # ?expand=classes,classes.students switch) names them; an expanded
+    # relation uses the given serializer, which receives the dotted rest of
+    # the path as its own expand list.
+    expandable = {}
+    
+    def __init__(self, *args, **kwargs):
+        expand = kwargs.pop('expand', None)
+        super().__init__(*args, **kwargs)
+        if expand is None:
+            expand = self.context.get('expand', [])
+        for name, serializer_class in self.expandable.items():
+            if name in expand and name in self.fields:
+                nested = {}
+                if issubclass(serializer_class, ExpandableFieldsMixin):
+                    nested['expand'] = nested_expand(expand, name)
+                self.fields[name] = serializer_class(many=True, read_only=True, **nested)
+
+def nested_expand(expand, name):
+    return [path.split('.', 1)[1] for path in expand if path.startswith(f'{name}.')]
+
+def wanted(fields, name):
+    return not fields or name in fields
+
 class UserSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=False)
     
@@ -85,13 +127,29 @@ class LoginSerializer(serializers.Serializer):
         raise serializers.ValidationError("Username and password are required.")
 
 
-class ClassSerializer(serializers.ModelSerializer):
-    students = UserSerializer(many=True, read_only=True)
+# List views pass their querysets through the serializer's
+# setup_eager_loading(), which joins or prefetches every relation the
+# serializer reads, so a list costs the same number of queries at any length.
+class ClassSerializer(DynamicFieldsMixin, ExpandableFieldsMixin, serializers.ModelSerializer):
+    students = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+    student_count = serializers.SerializerMethodField()
     student_ids = serializers.ListField(child=serializers.IntegerField(), write_only=True, required=False)
     
     class Meta:
         model = Class
-        fields = ['id', 'name', 'students', 'student_ids', 'created_at']
+        fields = ['id', 'name', 'students', 'student_count', 'student_ids', 'created_at']
+    
+    expandable = {'students': UserSerializer}
+    
+    @staticmethod
+    def setup_eager_loading(queryset, fields=(), expand=()):
+        if not (wanted(fields, 'students') or wanted(fields, 'student_count')):
+            return queryset
+        students = User.objects.all() if 'students' in expand else User.objects.only('id')
+        return queryset.prefetch_related(Prefetch('students', queryset=students))
+    
+    def get_student_count(self, obj):
+        return len(obj.students.all())
     
     def create(self, validated_data):
         student_ids = validated_data.pop('student_ids', [])
@@ -101,14 +159,32 @@ class ClassSerializer(serializers.ModelSerializer):
             class_obj.students.set(students)
         return class_obj
 
-class SubjectSerializer(serializers.ModelSerializer):
+class SubjectSerializer(DynamicFieldsMixin, ExpandableFieldsMixin, serializers.ModelSerializer):
     teacher_name = serializers.CharField(source='teacher.full_name', read_only=True)
-    classes = ClassSerializer(many=True, read_only=True)
+    classes = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+    class_count = serializers.SerializerMethodField()
     class_ids = serializers.ListField(child=serializers.IntegerField(), write_only=True, required=False)
     
     class Meta:
         model = Subject
-        fields = ['id', 'name', 'teacher', 'teacher_name', 'classes', 'class_ids']
+        fields = ['id', 'name', 'teacher', 'teacher_name', 'classes', 'class_count', 'class_ids']
+    
+    expandable = {'classes': ClassSerializer}
+    
+    @staticmethod
+    def setup_eager_loading(queryset, fields=(), expand=()):
+        if wanted(fields, 'teacher_name'):
+            queryset = queryset.select_related('teacher')
+        if not (wanted(fields, 'classes') or wanted(fields, 'class_count')):
+            return queryset
+        if 'classes' in expand:
+            classes = ClassSerializer.setup_eager_loading(Class.objects.all(), expand=nested_expand(expand, 'classes'))
+        else:
+            classes = Class.objects.only('id')
+        return queryset.prefetch_related(Prefetch('classes', queryset=classes))
+    
+    def get_class_count(self, obj):
+        return len(obj.classes.all())
     
     def create(self, validated_data):
         class_ids = validated_data.pop('class_ids', [])
@@ -126,19 +202,78 @@ class LessonSerializer(serializers.ModelSerializer):
     class Meta:
         model = Lesson
         fields = ['id', 'subject', 'subject_name', 'class_room', 'class_name', 
-                 'teacher_name', 'start_time', 'end_time', 'created_at']
+                 'teacher_name', 'start_time', 'end_time', 'finalized_at', 'created_at']
+        read_only_fields = ['finalized_at']
+    
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.select_related('subject__teacher', 'class_room')
+
+class QRRenderOptionsSerializer(serializers.Serializer):
+    image_format = serializers.ChoiceField(choices=list(QR_FORMATS), source='format', default=QR_RENDER_DEFAULTS['format'])
+    box_size = serializers.IntegerField(min_value=1, max_value=40, default=QR_RENDER_DEFAULTS['box_size'])
+    border = serializers.IntegerField(min_value=0, max_value=20, default=QR_RENDER_DEFAULTS['border'])
+    error_correction = serializers.ChoiceField(choices=list(QR_ERROR_CORRECTION), default=QR_RENDER_DEFAULTS['error_correction'])
+    
+    @classmethod
+    def to_query(cls, options):
+        changed = {
+            name: value for name, value in options.items()
+            if value != QR_RENDER_DEFAULTS[name]
+        }
+        if 'format' in changed:
+            changed['image_format'] = changed.pop('format')
+        return urlencode(changed)
+
+class QRSheetOptionsSerializer(serializers.Serializer):
+    sheet_format = serializers.ChoiceField(choices=['pdf', 'png'], default='pdf')
+    columns = serializers.IntegerField(min_value=1, max_value=10, default=4)
+    rows_per_page = serializers.IntegerField(min_value=1, max_value=20, default=5)
+    box_size = serializers.IntegerField(min_value=1, max_value=20, default=4)
+    border = serializers.IntegerField(min_value=0, max_value=10, default=2)
+    error_correction = serializers.ChoiceField(choices=list(QR_ERROR_CORRECTION), default=QR_RENDER_DEFAULTS['error_correction'])
+    date = serializers.DateField(required=False)
 
-class QRCodeSerializer(serializers.ModelSerializer):
+class QRCodeListQuerySerializer(serializers.Serializer):
+    date = serializers.DateField(required=False)
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    upcoming = serializers.BooleanField(required=False, default=False)
+    include = serializers.CharField(required=False, default='')
+    fields = serializers.CharField(required=False, default='')
+
+class QRCodeSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     qr_image = serializers.SerializerMethodField()
+    qr_image_url = serializers.SerializerMethodField()
     lesson_info = serializers.SerializerMethodField()
     student_name = serializers.CharField(source='student.full_name', read_only=True)
     
     class Meta:
         model = QRCode
-        fields = ['id', 'code', 'qr_image', 'lesson_info', 'student_name', 'created_at']
+        fields = ['id', 'code', 'qr_image', 'qr_image_url', 'lesson_info', 'student_name', 'created_at']
+    
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.select_related('lesson__subject', 'lesson__class_room', 'student')
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if not self.context.get('embed_qr_image', True):
+            self.fields.pop('qr_image', None)
     
     def get_qr_image(self, obj):
-        return obj.generate_qr_image()
+        return obj.generate_qr_image(**self.context.get('qr_render_options', {}))
+    
+    def get_qr_image_url(self, obj):
+        if obj.id is None:
+            path = reverse('qr_code_image_by_code', args=[obj.code])
+        else:
+            path = reverse('qr_code_image', args=[obj.id])
+        query = QRRenderOptionsSerializer.to_query(self.context.get('qr_render_options', {}))
+        if query:
+            path = f'{path}?{query}'
+        request = self.context.get('request')
+        return request.build_absolute_uri(path) if request else path
     
     def get_lesson_info(self, obj):
         return {
@@ -158,6 +293,10 @@ class AttendanceSerializer(serializers.ModelSerializer):
         fields = ['id', 'lesson', 'student', 'student_name', 'status', 
                  'marked_at', 'lesson_info', 'is_present', 'created_at']
     
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.select_related('lesson__subject__teacher', 'lesson__class_room', 'student')
+    
     def get_lesson_info(self, obj):
         return {
             'subject': obj.lesson.subject.name,
@@ -173,38 +312,56 @@ class MarkAttendanceSerializer(serializers.Serializer):
     qr_code = serializers.CharField()
     
     def validate_qr_code(self, value):
-        try:
-            qr_obj = QRCode.objects.get(code=value)
-            return qr_obj
-        except QRCode.DoesNotExist:
+        target = resolve_scan_code(value)
+        if target is None:
             raise serializers.ValidationError('Invalid QR code.')
+        return target
     
-    def mark_attendance(self, qr_obj):
-        lesson = qr_obj.lesson
-        student = qr_obj.student
+    def mark_attendance(self, target):
         current_time = timezone.now()
         
-        time_diff = current_time - lesson.start_time
-        
-        if time_diff <= timedelta(minutes=15):
-            status = 'present'
-        elif time_diff <= timedelta(minutes=30):
-            status = 'late'
-        else:
-            status = 'absent'
-        
-        attendance, created = Attendance.objects.get_or_create(
-            lesson=lesson,
-            student=student,
-            defaults={
-                'status': status,
-                'marked_at': current_time
-            }
+        attendance = Attendance(
+            lesson_id=target.lesson_id,
+            student_id=target.student_id,
+            status=classify_scan(target.start_time, current_time),
+            marked_at=current_time
         )
         
-        if not created:
-            attendance.status = status
-            attendance.marked_at = current_time
-            attendance.save()
-        
+        written = record_attendance([attendance])
+        if written:
+            attendance = written[0]
+        elif written is not None:
+            # An earlier scan of the student is already stored and wins; it is
+            # the only case the upsert returns nothing for.
+            attendance = Attendance.objects.get(lesson_id=target.lesson_id, student_id=target.student_id)
+        return self._attach_related(attendance, target)
+    
+    def _attach_related(self, attendance, target):
+        if target.lesson is not None:
+            attendance.lesson = target.lesson
+        if target.student is not None:
+            attendance.student = target.student
         return attendance
+
+class MarkAttendanceBatchSerializer(serializers.Serializer):
+    qr_codes = serializers.ListField(child=serializers.CharField(), allow_empty=False, max_length=500)
+    
+    def mark_attendance(self, teacher):
+        return mark_attendance_batch(self.validated_data['qr_codes'], teacher, timezone.now())
+
+class ScanRecordSerializer(serializers.Serializer):
+    code = serializers.CharField(max_length=100)
+    scanned_at = serializers.DateTimeField()
+    seq = serializers.IntegerField(min_value=0)
+
+class ScanSyncSerializer(serializers.Serializer):
+    device_id = serializers.CharField(max_length=64)
+    records = ScanRecordSerializer(many=True, allow_empty=True, max_length=1000)
+    
+    def sync(self, teacher):
+        return sync_scans(
+            teacher,
+            self.validated_data['device_id'],
+            self.validated_data['records'],
+            timezone.now()
+        )
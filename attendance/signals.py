@@ -0,0 +1,105 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .models import Class, Lesson, QRCode, Subject
+from .response_cache import ADMIN_SCOPE, invalidate_scopes, user_scope
+from .scan_index import invalidate_scan_index
+
+
+@receiver([post_save, post_delete], sender=QRCode)
+@receiver([post_save, post_delete], sender=Lesson)
+@receiver([post_save, post_delete], sender=Subject)
+def invalidate_active_lesson_index(sender, **kwargs):
+    invalidate_scan_index()
+
+
+def lesson_scopes(lessons):
+    # Everyone whose lesson or QR code lists show these lessons: the students
+    # of their classes, their teachers and the admins.
+    class_ids = lessons.values('class_room_id')
+    student_ids = Class.students.through.objects.filter(
+        class_id__in=class_ids
+    ).values_list('user_id', flat=True)
+    teacher_ids = lessons.values_list('subject__teacher_id', flat=True)
+    return {ADMIN_SCOPE} | {user_scope(user_id) for user_id in {*student_ids, *teacher_ids}}
+
+
+def class_student_scopes(class_ids):
+    student_ids = Class.students.through.objects.filter(
+        class_id__in=class_ids
+    ).values_list('user_id', flat=True)
+    return {user_scope(user_id) for user_id in set(student_ids)}
+
+
+@receiver(pre_save, sender=Lesson)
+def remember_lesson_audience(sender, instance, **kwargs):
+    # A lesson moved to another class or subject leaves the old lists too.
+    instance._previous_scopes = lesson_scopes(Lesson.objects.filter(pk=instance.pk)) if instance.pk else set()
+
+
+@receiver(post_save, sender=Lesson)
+def invalidate_saved_lesson_responses(sender, instance, **kwargs):
+    scopes = lesson_scopes(Lesson.objects.filter(pk=instance.pk))
+    invalidate_scopes(scopes | getattr(instance, '_previous_scopes', set()))
+
+
+@receiver(pre_delete, sender=Lesson)
+def invalidate_deleted_lesson_responses(sender, instance, **kwargs):
+    # Before the delete: afterwards the lesson, and with a cascading class
+    # delete its roster, are gone.
+    invalidate_scopes(lesson_scopes(Lesson.objects.filter(pk=instance.pk)))
+
+
+@receiver([post_save, post_delete], sender=QRCode)
+def invalidate_qr_code_responses(sender, instance, **kwargs):
+    invalidate_scopes({user_scope(instance.student_id)})
+
+
+@receiver(pre_save, sender=Subject)
+def remember_subject_teacher(sender, instance, **kwargs):
+    instance._previous_teacher_id = (
+        Subject.objects.filter(pk=instance.pk).values_list('teacher_id', flat=True).first()
+        if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=Subject)
+def invalidate_subject_responses(sender, instance, **kwargs):
+    # Lessons show the subject's name and teacher.
+    scopes = lesson_scopes(Lesson.objects.filter(subject=instance))
+    previous_teacher_id = getattr(instance, '_previous_teacher_id', None)
+    if previous_teacher_id is not None:
+        scopes.add(user_scope(previous_teacher_id))
+    invalidate_scopes(scopes)
+
+
+@receiver(post_save, sender=Class)
+def invalidate_class_responses(sender, instance, created, **kwargs):
+    # Lessons show the class name.
+    if not created:
+        invalidate_scopes(lesson_scopes(Lesson.objects.filter(class_room=instance)))
+
+
+@receiver(m2m_changed, sender=Class.students.through)
+def invalidate_roster_responses(sender, instance, action, reverse, pk_set, **kwargs):
+    # Only the students who joined or left see different lessons.
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if reverse:
+        invalidate_scopes({user_scope(instance.pk)})
+    elif action == 'pre_clear':
+        invalidate_scopes(class_student_scopes([instance.pk]))
+    else:
+        invalidate_scopes({user_scope(user_id) for user_id in pk_set})
+
+
+@receiver(m2m_changed, sender=Subject.classes.through)
+def invalidate_subject_class_responses(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if reverse:
+        invalidate_scopes(class_student_scopes([instance.pk]))
+    elif action == 'pre_clear':
+        invalidate_scopes(class_student_scopes(instance.classes.values('id')))
+    else:
+        invalidate_scopes(class_student_scopes(pk_set))
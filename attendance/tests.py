@@ -1,3 +1,1201 @@
-from django.test import TestCase
+import asyncio
+import contextlib
+import csv
+import io
+import json
+import tempfile
+import threading
+from datetime import timedelta
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from benchmarks.pipeline import compare, measure, percentile
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, modify_settings, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .live_roster import InProcessBroker, get_live_roster
+from .middleware import QueryCountMiddleware
+from .models import Attendance, Class, Lesson, QRCode, Subject, User
+from .qr_cache import get_qr_image_cache
+from .qr_sheets import LABEL_HEIGHT, sheet_cell_size, sheet_tile
+from .qr_tokens import lesson_qr_token, make_qr_token, read_qr_token, verify_qr_token
+from .renderers import CSVRenderer, FastJSONRenderer
+from .rendering import QR_RENDER_DEFAULTS, RASTERIZERS, default_rasterizer, render_qr
+from .scan_index import get_scan_index
+from .scanning import record_attendance, resolve_scan_code, upsert_attendance
+from .serializers import MarkAttendanceSerializer
+from .throttling import _in_flight_slots
+from .views import calculate_attendance_rate
+from .write_behind import get_scan_queue
+
+
+def create_user(username, role):
+    return User.objects.create_user(username=username, password='x', role=role, phone_number=username)
+
+
+class LessonTestCase(TestCase):
+    # A teacher with one subject, a class of class_size students and a lesson
+    # of theirs that started five minutes ago, with its QR codes. self.client
+    # is signed in as the teacher.
+    class_size = 3
+    
+    def setUp(self):
+        cache.clear()
+        self.teacher = create_user('teacher', 'teacher')
+        self.students = [create_user(f'student{i}', 'student') for i in range(self.class_size)]
+        self.class_room = Class.objects.create(name='9-A')
+        self.class_room.students.set(self.students)
+        self.subject = Subject.objects.create(name='Fizika', teacher=self.teacher)
+        self.lesson = self.add_lesson(timezone.now() - timedelta(minutes=5))
+        self.client = self.client_for(self.teacher)
+    
+    def add_lesson(self, start, subject=None):
+        return Lesson.objects.create(
+            subject=subject or self.subject, class_room=self.class_room,
+            start_time=start, end_time=start + timedelta(minutes=45)
+        )
+    
+    def code(self, student, lesson=None):
+        return QRCode.objects.get(lesson=lesson or self.lesson, student=student).code
+    
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+
+class QRImageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+    
+    @override_settings(QR_IMAGE_CACHE={'MAX_ENTRIES': 2})
+    def test_renders_once_and_evicts_the_least_recently_used(self):
+        image_cache = get_qr_image_cache()
+        first = image_cache.get_or_render('a')
+        self.assertEqual(image_cache.get_or_render('a'), first)
+        image_cache.get_or_render('b')
+        image_cache.get_or_render('a')
+        image_cache.get_or_render('c')
+        stats = image_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions'], stats['entries']), (2, 3, 1, 2))
+        
+        # 'b' was the least recently used entry, so it is rendered again.
+        image_cache.get_or_render('a')
+        image_cache.get_or_render('b')
+        self.assertEqual((image_cache.stats()['hits'], image_cache.stats()['misses']), (3, 4))
+    
+    @override_settings(QR_IMAGE_CACHE={'SHARED_CACHE': 'default'})
+    def test_shared_tier_serves_other_processes(self):
+        rendered = get_qr_image_cache().get_or_render('a')
+        with override_settings(QR_IMAGE_CACHE={'SHARED_CACHE': 'default', 'MAX_ENTRIES': 1}):
+            image_cache = get_qr_image_cache()
+            self.assertEqual(image_cache.get_or_render('a'), rendered)
+            self.assertEqual((image_cache.stats()['shared_hits'], image_cache.stats()['misses']), (1, 0))
+
+
+class LessonProvisioningTests(LessonTestCase):
+    def test_one_code_per_student_in_constant_queries(self):
+        queries = []
+        for size in (2, 20):
+            class_room = Class.objects.create(name=f'{size}-B')
+            class_room.students.set([create_user(f'pupil{size}-{i}', 'student') for i in range(size)])
+            start = timezone.now()
+            with CaptureQueriesContext(connection) as captured:
+                lesson = Lesson.objects.create(
+                    subject=self.subject, class_room=class_room, start_time=start, end_time=start + timedelta(minutes=45)
+                )
+            queries.append(len(captured))
+            self.assertEqual(QRCode.objects.filter(lesson=lesson).count(), size)
+            self.assertEqual(QRCode.objects.filter(lesson=lesson).values('student').distinct().count(), size)
+        self.assertEqual(queries[0], queries[1])
+    
+    def test_provisioning_again_adds_only_new_students(self):
+        codes = set(QRCode.objects.filter(lesson=self.lesson).values_list('code', flat=True))
+        newcomer = create_user('newcomer', 'student')
+        self.class_room.students.add(newcomer)
+        
+        self.assertEqual(len(self.lesson.provision_qr_codes()), 1)
+        self.assertEqual(set(QRCode.objects.filter(lesson=self.lesson).exclude(student=newcomer).values_list('code', flat=True)), codes)
+        self.assertEqual(len(self.lesson.provision_qr_codes()), 0)
+
+
+@override_settings(QR_IMAGE_CACHE={'SHARED_CACHE': 'default'})
+class PrerenderQRCodesTests(LessonTestCase):
+    def setUp(self):
+        super().setUp()
+        get_qr_image_cache().clear()
+        self.codes = list(QRCode.objects.filter(lesson=self.lesson).order_by('id').values_list('id', 'code'))
+    
+    def prerender(self, *args):
+        day = timezone.localdate(self.lesson.start_time).isoformat()
+        call_command('prerender_qr_codes', '--start', day, '--workers', '1', '--chunk-size', '2', *args, stdout=io.StringIO())
+    
+    def test_images_are_published_and_written(self):
+        image_cache = get_qr_image_cache()
+        with tempfile.TemporaryDirectory() as output_dir:
+            self.prerender('--output-dir', output_dir)
+            for _, code in self.codes:
+                with open(f'{output_dir}/{code}.png', 'rb') as f:
+                    self.assertEqual(f.read(), image_cache.get_or_render(code))
+        # Every image came from the shared tier; none was rendered here.
+        self.assertEqual((image_cache.stats()['shared_hits'], image_cache.stats()['misses']), (3, 0))
+    
+    def test_resume_after_skips_rendered_codes(self):
+        self.prerender('--resume-after', str(self.codes[0][0]))
+        image_cache = get_qr_image_cache()
+        for _, code in self.codes:
+            image_cache.get_or_render(code)
+        self.assertEqual((image_cache.stats()['shared_hits'], image_cache.stats()['misses']), (2, 1))
+
+
+class QRImageViewTests(LessonTestCase):
+    class_size = 2
+    
+    def setUp(self):
+        super().setUp()
+        self.qr_code = QRCode.objects.get(lesson=self.lesson, student=self.students[0])
+        self.url = f'/api/api/qr-codes/{self.qr_code.id}/image.png'
+        self.client = self.client_for(self.students[0])
+    
+    def test_image_is_raw_png_with_an_etag(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(response['Cache-Control'], 'private, max-age=31536000, immutable')
+        self.assertEqual(response.content, get_qr_image_cache().get_or_render(self.qr_code.code))
+        
+        by_code = self.client.get(f'/api/api/qr-codes/by-code/{self.qr_code.code}/image.png')
+        self.assertEqual((by_code.content, by_code['ETag']), (response.content, response['ETag']))
+    
+    def test_matching_etag_is_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+    
+    def test_students_only_get_their_own_images(self):
+        self.assertEqual(self.client_for(self.students[1]).get(self.url).status_code, 403)
+    
+    def test_render_options_change_the_image_and_its_etag(self):
+        png = self.client.get(self.url)
+        png1bit = self.client.get(self.url, {'image_format': 'png1bit'})
+        self.assertEqual(png1bit['Content-Type'], 'image/png')
+        self.assertLess(len(png1bit.content), len(png.content))
+        self.assertNotEqual(png1bit['ETag'], png['ETag'])
+        
+        options = {'box_size': 4, 'border': 1, 'error_correction': 'H'}
+        svg = self.client.get(self.url, {'image_format': 'svg', **options})
+        self.assertEqual(svg['Content-Type'], 'image/svg+xml')
+        self.assertEqual(svg.content, get_qr_image_cache().get_or_render(self.qr_code.code, format='svg', **options))
+    
+    def test_invalid_render_options_are_rejected(self):
+        for params in [{'image_format': 'gif'}, {'box_size': 0}, {'border': 21}, {'error_correction': 'X'}]:
+            self.assertEqual(self.client.get(self.url, params).status_code, 400, params)
+
+
+class QRSheetTests(LessonTestCase):
+    class_size = 5
+    
+    def setUp(self):
+        super().setUp()
+        self.other = create_user('other', 'teacher')
+        self.add_lesson(self.lesson.start_time, subject=Subject.objects.create(name='Kimyo', teacher=self.other))
+    
+    def sheet(self, url, **params):
+        response = self.client.get(url, {'columns': 2, 'rows_per_page': 2, **params})
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+    
+    def cell_size(self):
+        return sheet_cell_size(self.code(self.students[0]), {'box_size': 4, 'border': 2, 'error_correction': 'M'})
+    
+    def test_lesson_pdf_has_a_page_per_rows_per_page(self):
+        pdf = self.sheet(f'/api/api/lessons/{self.lesson.id}/qr-sheet/')
+        self.assertTrue(pdf.startswith(b'%PDF-1.4'))
+        self.assertTrue(pdf.rstrip().endswith(b'%%EOF'))
+        self.assertIn(b'/Count 2', pdf)
+    
+    def test_lesson_png_is_a_grid_of_tiles(self):
+        png = self.sheet(f'/api/api/lessons/{self.lesson.id}/qr-sheet/', sheet_format='png')
+        image = Image.open(io.BytesIO(png))
+        image.load()
+        self.assertEqual(image.size, (2 * self.cell_size(), 3 * (self.cell_size() + LABEL_HEIGHT)))
+    
+    def test_teachers_only_print_their_own_lessons(self):
+        other = self.client_for(self.other)
+        self.assertEqual(other.get(f'/api/api/lessons/{self.lesson.id}/qr-sheet/').status_code, 403)
+        
+        # One row of five: the class sheet leaves out the other teacher's lesson.
+        day = timezone.localdate(self.lesson.start_time).isoformat()
+        png = self.sheet(f'/api/api/classes/{self.class_room.id}/qr-sheet/', sheet_format='png', columns=5, date=day)
+        self.assertEqual(Image.open(io.BytesIO(png)).height, self.cell_size() + LABEL_HEIGHT)
+
+
+@override_settings(QR_IMAGE_CACHE={'MAX_ENTRIES': 2})
+class QRSheetCacheTests(TestCase):
+    def setUp(self):
+        get_qr_image_cache().clear()
+    
+    def test_printing_a_sheet_leaves_the_image_cache_alone(self):
+        image_cache = get_qr_image_cache()
+        params = dict(QR_RENDER_DEFAULTS)
+        image_cache.get_or_render('hot', **params)
+        before = image_cache.stats()
+        
+        cell_size = sheet_cell_size('hot', params)
+        for index in range(5):
+            sheet_tile(f'student-{index}', 'label', params, cell_size)
+        sheet_tile('hot', 'label', params, cell_size)
+        
+        self.assertEqual(image_cache.stats(), before)
+        self.assertIsNotNone(image_cache.peek(image_cache.key_for('hot', **params)))
+    
+    def test_tiles_are_cut_from_the_cached_default_render(self):
+        image_cache = get_qr_image_cache()
+        params = {'format': 'png', 'box_size': 4, 'border': 2, 'error_correction': 'M'}
+        cell_size = sheet_cell_size('hot', params)
+        tiles = {code: sheet_tile(code, 'label', params, cell_size).tobytes() for code in ('hot', 'old')}
+        
+        image_cache.get_or_render('hot')
+        self.assertEqual(sheet_tile('hot', 'label', params, cell_size).tobytes(), tiles['hot'])
+        # The tile really comes from the cached entry, not a fresh render.
+        image_cache.set(image_cache.key_for('hot'), render_qr('old'))
+        self.assertEqual(sheet_tile('hot', 'label', params, cell_size).tobytes(), tiles['old'])
+
+
+class StudentQRCodeListTests(LessonTestCase):
+    class_size = 1
+    
+    def setUp(self):
+        super().setUp()
+        for day in (1, 2):
+            self.add_lesson(self.lesson.start_time + timedelta(days=day))
+        self.client = self.client_for(self.students[0])
+    
+    def test_images_are_linked_unless_asked_for(self):
+        results = self.client.get('/api/api/my-qr-codes/').json()['results']
+        self.assertEqual(len(results), 3)
+        self.assertNotIn('qr_image', results[0])
+        self.assertTrue(results[0]['qr_image_url'].endswith(f"/api/api/qr-codes/{results[0]['id']}/image.png"))
+        
+        svg = self.client.get('/api/api/my-qr-codes/', {'image_format': 'svg'}).json()['results']
+        self.assertTrue(svg[0]['qr_image_url'].endswith('image.png?image_format=svg'))
+        
+        embedded = self.client.get('/api/api/my-qr-codes/', {'include': 'qr_image'}).json()['results']
+        qr_code = QRCode.objects.get(id=embedded[0]['id'])
+        self.assertEqual(embedded[0]['qr_image'], qr_code.generate_qr_image())
+    
+    def test_fields_and_pages(self):
+        first = self.client.get('/api/api/my-qr-codes/', {'fields': 'id,code', 'page_size': 2}).json()
+        self.assertEqual([set(row) for row in first['results']], [{'id', 'code'}] * 2)
+        second = self.client.get(first['next']).json()
+        self.assertEqual(
+            [row['code'] for row in first['results'] + second['results']],
+            list(QRCode.objects.order_by('lesson__start_time').values_list('code', flat=True))
+        )
+        self.assertIsNone(second['next'])
+
+
+class QRTokenTests(LessonTestCase):
+    class_size = 1
+    
+    def test_tokens_round_trip_and_reject_tampering(self):
+        expires_at = timezone.now().replace(microsecond=0) + timedelta(hours=1)
+        token = make_qr_token(7, 42, expires_at)
+        self.assertEqual(tuple(read_qr_token(token)), (7, 42, expires_at))
+        
+        payload, signature = token.split('.')
+        forged = make_qr_token(7, 43, expires_at).split('.')[0]
+        for tampered in [f'{forged}.{signature}', f'{payload}.{signature[::-1]}', f'{payload}.', 'not-a-token']:
+            self.assertIsNone(read_qr_token(tampered), tampered)
+    
+    def test_expired_tokens_are_refused(self):
+        now = timezone.now()
+        token = make_qr_token(7, 42, now)
+        self.assertIsNotNone(verify_qr_token(token, now=now - timedelta(seconds=1)))
+        self.assertIsNone(verify_qr_token(token, now=now + timedelta(seconds=1)))
+    
+    @override_settings(QR_TOKENS={'MODE': 'signed', 'EXPIRY_GRACE_SECONDS': 600})
+    def test_signed_mode_scans_without_code_rows(self):
+        lesson = self.add_lesson(timezone.now() - timedelta(minutes=1))
+        self.assertFalse(QRCode.objects.filter(lesson=lesson).exists())
+        
+        token = lesson_qr_token(lesson, self.students[0].id)
+        self.assertEqual(verify_qr_token(token).expires_at, lesson.end_time.replace(microsecond=0) + timedelta(minutes=10))
+        response = self.client.post('/api/api/mark-attendance/', {'qr_code': token}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(Attendance.objects.filter(lesson=lesson, student=self.students[0], status='present').exists())
+
+
+class RasterizerTests(TestCase):
+    def test_rasterizers_draw_the_same_pixels(self):
+        if 'numpy' not in RASTERIZERS:
+            self.skipTest('NumPy is not installed')
+        for params in [{}, {'box_size': 3, 'border': 0, 'error_correction': 'H'}, {'format': 'png1bit'}]:
+            images = [
+                Image.open(io.BytesIO(render_qr('a3f1c2d4-0000-4000-8000-000000000000', rasterizer=name, **params))).convert('1')
+                for name in ('pil', 'numpy')
+            ]
+            self.assertEqual(images[0].size, images[1].size)
+            self.assertEqual(images[0].tobytes(), images[1].tobytes(), params)
+    
+    def test_unknown_rasterizer_falls_back_to_pil(self):
+        with override_settings(QR_RASTERIZER='cairo'):
+            self.assertEqual(default_rasterizer(), 'pil')
+
+
+class PipelineBenchmarkTests(TestCase):
+    def test_measure_reports_latency_and_queries(self):
+        calls = []
+        result = measure('users', lambda: calls.append(User.objects.count()), 4, items_per_call=3)
+        # One warm-up call, the measured calls and one traced for peak memory.
+        self.assertEqual(len(calls), 6)
+        self.assertEqual((result['calls'], result['items_per_call'], result['queries_per_call']), (4, 3, 1))
+        self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+        self.assertEqual(percentile([5, 1, 3, 2, 4], 50), 3)
+    
+    def test_compare_diffs_two_runs(self):
+        row = {'name': 'case', 'p50_ms': 2.0, 'items_per_sec': 10.0, 'queries_per_call': 1.0}
+        with tempfile.TemporaryDirectory() as directory:
+            before, after = f'{directory}/before.json', f'{directory}/after.json'
+            with open(before, 'w') as f:
+                json.dump({'results': [row]}, f)
+            with open(after, 'w') as f:
+                json.dump({'results': [{**row, 'p50_ms': 1.0}, {**row, 'name': 'added'}]}, f)
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                compare(before, after)
+        lines = output.getvalue().splitlines()
+        self.assertIn('-50%', lines[1])
+        self.assertIn('(new)', lines[2])
+
+
+class MarkAttendanceBatchTests(LessonTestCase):
+    def setUp(self):
+        super().setUp()
+        other = create_user('other', 'teacher')
+        self.foreign_lesson = self.add_lesson(self.lesson.start_time, subject=Subject.objects.create(name='Kimyo', teacher=other))
+    
+    def mark(self, codes):
+        response = self.client.post('/api/api/mark-attendance/batch/', {'qr_codes': codes}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+    
+    def test_each_code_gets_a_result(self):
+        first, second = self.code(self.students[0]), self.code(self.students[1])
+        foreign = self.code(self.students[0], self.foreign_lesson)
+        body = self.mark([first, first, 'no-such-code', foreign, second])
+        self.assertEqual([item['result'] for item in body['results']], ['ok', 'duplicate', 'invalid', 'wrong_teacher', 'ok'])
+        self.assertEqual(body['summary'], {'ok': 2, 'duplicate': 1, 'invalid': 1, 'wrong_teacher': 1})
+        self.assertEqual(
+            set(Attendance.objects.values_list('student_id', flat=True)),
+            {self.students[0].id, self.students[1].id}
+        )
+        self.assertFalse(Attendance.objects.filter(lesson=self.foreign_lesson).exists())
+    
+    def test_repeated_codes_of_other_teachers_stay_refused(self):
+        foreign = self.code(self.students[0], self.foreign_lesson)
+        results = self.mark([foreign, foreign])['results']
+        self.assertEqual([item['result'] for item in results], ['wrong_teacher', 'wrong_teacher'])
+        self.assertNotIn('student', results[1])
+
+
+@override_settings(SCAN_INDEX={'ENABLED': True, 'MAX_AGE': 60})
+class ScanIndexTests(LessonTestCase):
+    class_size = 1
+    
+    def setUp(self):
+        super().setUp()
+        self.later_lesson = self.add_lesson(timezone.now() + timedelta(days=1))
+    
+    def test_open_lessons_resolve_without_queries(self):
+        code = self.code(self.students[0])
+        resolve_scan_code(code)
+        with self.assertNumQueries(0):
+            target = resolve_scan_code(code)
+        self.assertEqual(
+            (target.lesson_id, target.student_id, target.teacher_id),
+            (self.lesson.id, self.students[0].id, self.teacher.id)
+        )
+        
+        # Codes of lessons that are not open fall back to the database.
+        later_code = self.code(self.students[0], self.later_lesson)
+        with self.assertNumQueries(1):
+            self.assertEqual(resolve_scan_code(later_code).lesson_id, self.later_lesson.id)
+        with self.assertNumQueries(1):
+            self.assertIsNone(resolve_scan_code('no-such-code'))
+    
+    def test_changes_invalidate_the_index(self):
+        resolve_scan_code(self.code(self.students[0]))
+        loads = get_scan_index().stats()['loads']
+        
+        lesson = self.add_lesson(timezone.now() - timedelta(minutes=1))
+        self.assertEqual(resolve_scan_code(self.code(self.students[0], lesson)).lesson_id, lesson.id)
+        self.assertEqual(get_scan_index().stats()['loads'], loads + 1)
+        
+        Lesson.objects.get(pk=self.lesson.pk).delete()
+        self.assertIsNone(get_scan_index().snapshot()[1].get(self.lesson.id))
+
+
+class ScanWriteBehindTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        write_behind = override_settings(SCAN_WRITE_BEHIND={
+            'ENABLED': True, 'PATH': f'{directory.name}/scan_queue.sqlite3', 'FLUSH_INTERVAL': 3600,
+        })
+        write_behind.enable()
+        self.addCleanup(write_behind.disable)
+        
+        self.teacher = User.objects.create_user(username='teacher', password='x', role='teacher', phone_number='1')
+        self.student = User.objects.create_user(username='student', password='x', role='student', phone_number='2')
+        class_room = Class.objects.create(name='9-A')
+        class_room.students.set([self.student])
+        start = timezone.now() - timedelta(minutes=5)
+        self.lesson = Lesson.objects.create(
+            subject=Subject.objects.create(name='Fizika', teacher=self.teacher),
+            class_room=class_room, start_time=start, end_time=start + timedelta(minutes=45)
+        )
+        self.code = QRCode.objects.get(lesson=self.lesson, student=self.student).code
+        self.client = APIClient()
+        self.client.force_authenticate(self.teacher)
+    
+    def test_queued_scan_is_visible_before_and_after_the_flush(self):
+        response = self.client.post('/api/api/mark-attendance/', {'qr_code': self.code}, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertIsNone(response.json()['id'])
+        self.assertFalse(Attendance.objects.exists())
+        
+        listed = self.client.get('/api/api/attendance/').json()['results']
+        self.assertEqual([(row['id'], row['student'], row['status']) for row in listed], [(None, self.student.id, 'present')])
+        
+        self.assertEqual(get_scan_queue().flush(), 1)
+        attendance = Attendance.objects.get(lesson=self.lesson, student=self.student)
+        self.assertEqual(attendance.status, 'present')
+        self.assertEqual(get_scan_queue().stats()['pending'], 0)
+        listed = self.client.get('/api/api/attendance/').json()['results']
+        self.assertEqual([(row['id'], row['status']) for row in listed], [(attendance.id, 'present')])
+    
+    def test_overlay_does_not_replace_an_earlier_stored_scan(self):
+        earlier = self.lesson.start_time
+        Attendance.objects.create(lesson=self.lesson, student=self.student, status='present', marked_at=earlier)
+        Lesson.objects.filter(pk=self.lesson.pk).update(start_time=timezone.now() - timedelta(minutes=20))
+        self.client.post('/api/api/mark-attendance/', {'qr_code': self.code}, format='json')
+        
+        listed = self.client.get('/api/api/attendance/').json()['results']
+        self.assertEqual([row['status'] for row in listed], ['present'])
+        get_scan_queue().flush()
+        self.assertEqual(Attendance.objects.get(lesson=self.lesson, student=self.student).marked_at, earlier)
+
+
+class ScanQueueFlushTests(TransactionTestCase):
+    # Foreign keys are only checked when the flush commits, so this needs
+    # real transactions.
+    
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        write_behind = override_settings(SCAN_WRITE_BEHIND={
+            'ENABLED': True, 'PATH': f'{directory.name}/scan_queue.sqlite3', 'FLUSH_INTERVAL': 3600,
+        })
+        write_behind.enable()
+        self.addCleanup(write_behind.disable)
+        
+        teacher = create_user('teacher', 'teacher')
+        self.students = [create_user(f'student{i}', 'student') for i in range(2)]
+        class_room = Class.objects.create(name='9-A')
+        class_room.students.set(self.students)
+        subject = Subject.objects.create(name='Fizika', teacher=teacher)
+        start = timezone.now() - timedelta(minutes=5)
+        self.lessons = [
+            Lesson.objects.create(subject=subject, class_room=class_room, start_time=start, end_time=start + timedelta(minutes=45))
+            for _ in range(2)
+        ]
+    
+    def test_scans_of_deleted_lessons_and_students_do_not_block_the_queue(self):
+        now = timezone.now()
+        record_attendance([
+            Attendance(lesson_id=lesson.id, student_id=student.id, status='present', marked_at=now)
+            for lesson in self.lessons for student in self.students
+        ])
+        self.students[0].delete()
+        self.lessons[1].delete()
+        
+        queue = get_scan_queue()
+        with self.assertLogs('attendance.write_behind', 'WARNING'):
+            self.assertEqual(queue.flush(), 4)
+        self.assertEqual(
+            list(Attendance.objects.values_list('lesson_id', 'student_id')),
+            [(self.lessons[0].id, self.students[1].id)]
+        )
+        self.assertEqual((queue.stats()['pending'], queue.stats()['dropped']), (0, 3))
+
+
+class ScanSyncTests(LessonTestCase):
+    url = '/api/api/mark-attendance/sync/'
+    
+    def setUp(self):
+        super().setUp()
+        # The lesson ended a quarter of an hour ago; the scanner uploads now.
+        self.start = timezone.now() - timedelta(hours=1)
+        self.lesson = self.add_lesson(self.start)
+        foreign = self.add_lesson(
+            self.start, subject=Subject.objects.create(name='Adabiyot', teacher=create_user('other', 'teacher'))
+        )
+        self.codes = [self.code(student) for student in self.students]
+        self.foreign_code = self.code(self.students[0], foreign)
+    
+    def record(self, seq, code, minutes):
+        return {'seq': seq, 'code': code, 'scanned_at': (self.start + timedelta(minutes=minutes)).isoformat()}
+    
+    def sync(self, records):
+        response = self.client.post(self.url, {'device_id': 'phone-1', 'records': records}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+    
+    def test_records_are_classified_by_scan_time(self):
+        data = self.sync([
+            self.record(1, self.codes[0], 5),
+            self.record(2, self.codes[1], 20),
+            self.record(3, self.codes[0], 2),
+            self.record(4, 'no-such-code', 5),
+            self.record(5, self.foreign_code, 5),
+        ])
+        results = {item['seq']: (item['result'], item['status']) for item in data['results']}
+        self.assertEqual(results, {
+            1: ('duplicate', None),
+            2: ('ok', 'late'),
+            3: ('ok', 'present'),
+            4: ('invalid', None),
+            5: ('wrong_teacher', None),
+        })
+        self.assertEqual(data['cursor'], 5)
+        marked_at = Attendance.objects.get(lesson=self.lesson, student=self.students[0]).marked_at
+        self.assertEqual(marked_at, self.start + timedelta(minutes=2))
+    
+    @override_settings(QR_TOKENS={'MODE': 'signed', 'EXPIRY_GRACE_SECONDS': 300})
+    def test_signed_tokens_expire_by_scan_time_not_upload_time(self):
+        tokens = [lesson_qr_token(self.lesson, student.id) for student in self.students]
+        data = self.sync([
+            self.record(1, tokens[0], 5),
+            self.record(2, tokens[1], 49),
+            self.record(3, tokens[2], 51),
+        ])
+        results = {item['seq']: (item['result'], item['status']) for item in data['results']}
+        self.assertEqual(results, {1: ('ok', 'present'), 2: ('ok', 'absent'), 3: ('invalid', None)})
+        self.assertEqual(
+            set(Attendance.objects.values_list('student_id', flat=True)),
+            {self.students[0].id, self.students[1].id}
+        )
+    
+    def test_replaying_an_upload_is_idempotent(self):
+        records = [self.record(1, self.codes[0], 5), self.record(2, self.codes[1], 20)]
+        first = self.sync(records)
+        self.assertEqual(self.sync(records), first)
+        self.assertEqual(Attendance.objects.count(), 2)
+        
+        response = self.client.get(self.url, {'device_id': 'phone-1'})
+        self.assertEqual(response.json()['cursor'], 2)
+        self.assertIsNone(self.client.get(self.url, {'device_id': 'phone-2'}).json()['cursor'])
+    
+    def test_earliest_scan_wins_against_online_scans(self):
+        # Scanned online an hour after the start (absent), uploaded later
+        # from a device that saw the student on time.
+        MarkAttendanceSerializer().mark_attendance(resolve_scan_code(self.codes[0]))
+        self.sync([self.record(1, self.codes[0], 1)])
+        self.assertEqual(Attendance.objects.get(lesson=self.lesson, student=self.students[0]).status, 'present')
+        
+        MarkAttendanceSerializer().mark_attendance(resolve_scan_code(self.codes[0]))
+        self.assertEqual(Attendance.objects.get(lesson=self.lesson, student=self.students[0]).status, 'present')
+    
+    def test_earliest_scan_wins_against_queued_scans(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = f'{directory.name}/scan_queue.sqlite3'
+        with override_settings(SCAN_WRITE_BEHIND={'ENABLED': True, 'PATH': path, 'FLUSH_INTERVAL': 3600}):
+            MarkAttendanceSerializer().mark_attendance(resolve_scan_code(self.codes[0]))
+            self.sync([self.record(1, self.codes[0], 1)])
+        # Leaving override_settings stops the queue, which flushes it.
+        self.assertEqual(Attendance.objects.get(lesson=self.lesson, student=self.students[0]).status, 'present')
+
+
+class MarkAttendanceTests(LessonTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other = create_user('other', 'teacher')
+        self.foreign_lesson = self.add_lesson(
+            self.lesson.start_time, subject=Subject.objects.create(name='Kimyo', teacher=self.other)
+        )
+        self.codes = [self.code(student) for student in self.students]
+        self.foreign_code = self.code(self.students[0], self.foreign_lesson)
+    
+    def mark(self, code):
+        return self.client.post('/api/api/mark-attendance/', {'qr_code': code}, format='json')
+    
+    def test_scan_is_stored_and_returned(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.mark(self.codes[0])
+        self.assertEqual(response.status_code, 201)
+        attendance = Attendance.objects.get(lesson=self.lesson, student=self.students[0])
+        self.assertEqual((response.json()['id'], response.json()['status']), (attendance.id, 'present'))
+        # The upsert returns the stored row; nothing reads it back.
+        self.assertEqual(len([query for query in queries if 'attendance_attendance' in query['sql']]), 1)
+    
+    def test_upsert_writes_only_earlier_scans(self):
+        def scan(student, status, minutes):
+            return Attendance(
+                lesson_id=self.lesson.id, student_id=student.id, status=status,
+                marked_at=self.lesson.start_time + timedelta(minutes=minutes)
+            )
+        
+        # A row without a scan, as Lesson.finalize writes them.
+        Attendance.objects.create(lesson=self.lesson, student=self.students[1], status='absent')
+        written = upsert_attendance([scan(self.students[0], 'late', 20), scan(self.students[1], 'present', 5)])
+        self.assertEqual(
+            sorted((attendance.student_id, attendance.status) for attendance in written),
+            [(self.students[0].id, 'late'), (self.students[1].id, 'present')]
+        )
+        
+        written = upsert_attendance([scan(self.students[0], 'present', 1), scan(self.students[1], 'late', 25)])
+        stored = Attendance.objects.get(lesson=self.lesson, student=self.students[0])
+        self.assertEqual(
+            [(attendance.id, attendance.status, attendance.marked_at, attendance.created_at) for attendance in written],
+            [(stored.id, 'present', self.lesson.start_time + timedelta(minutes=1), stored.created_at)]
+        )
+        self.assertEqual(Attendance.objects.get(lesson=self.lesson, student=self.students[1]).status, 'present')
+    
+    def test_rescan_keeps_the_first_scan(self):
+        first = self.mark(self.codes[0]).json()
+        Lesson.objects.filter(pk=self.lesson.pk).update(start_time=timezone.now() - timedelta(minutes=20))
+        second = self.mark(self.codes[0]).json()
+        self.assertEqual((second['id'], second['status'], second['marked_at']), (first['id'], 'present', first['marked_at']))
+    
+    def test_other_teachers_codes_and_unknown_codes_are_refused(self):
+        self.assertEqual(self.mark(self.foreign_code).status_code, 403)
+        self.assertEqual(self.mark('no-such-code').status_code, 400)
+        self.assertFalse(Attendance.objects.exists())
+
+
+class ConcurrentMarkAttendanceTests(TransactionTestCase):
+    threads = 16
+    
+    def setUp(self):
+        teacher = User.objects.create_user(username='teacher', password='x', role='teacher', phone_number='1')
+        self.student = User.objects.create_user(username='student', password='x', role='student', phone_number='2')
+        class_room = Class.objects.create(name='9-A')
+        class_room.students.add(self.student)
+        subject = Subject.objects.create(name='Math', teacher=teacher)
+        subject.classes.add(class_room)
+        now = timezone.now()
+        self.lesson = Lesson.objects.create(
+            subject=subject,
+            class_room=class_room,
+            start_time=now - timedelta(minutes=5),
+            end_time=now + timedelta(minutes=40)
+        )
+        self.code = QRCode.objects.get(lesson=self.lesson, student=self.student).code
+    
+    def test_same_student_from_many_threads(self):
+        barrier = threading.Barrier(self.threads)
+        errors = []
+        
+        def scan():
+            try:
+                barrier.wait()
+                target = resolve_scan_code(self.code)
+                MarkAttendanceSerializer().mark_attendance(target)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+        
+        workers = [threading.Thread(target=scan) for _ in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        
+        self.assertEqual(errors, [])
+        attendance = Attendance.objects.get(lesson=self.lesson, student=self.student)
+        self.assertEqual(attendance.status, 'present')
+        self.assertEqual(Attendance.objects.count(), 1)
+
+
+class FinalizeLessonsTests(LessonTestCase):
+    class_size = 4
+    
+    def setUp(self):
+        super().setUp()
+        start = timezone.now() - timedelta(days=1)
+        self.lessons = [self.add_lesson(start + timedelta(hours=hours)) for hours in (0, 2, 48)]
+        Attendance.objects.create(lesson=self.lessons[0], student=self.students[0], status='present', marked_at=start)
+    
+    def finalize(self):
+        out = io.StringIO()
+        call_command('finalize_lessons', stdout=out)
+        return out.getvalue()
+    
+    def test_counts_only_the_rows_written(self):
+        self.assertIn('Finalized 2 lessons, marked 7 students absent.', self.finalize())
+        self.assertEqual(Attendance.objects.filter(status='absent').count(), 7)
+        self.assertIsNone(Lesson.objects.get(pk=self.lessons[2].pk).finalized_at)
+        
+        # A lesson finalized again (e.g. by a second run that picked it up
+        # concurrently) writes nothing and reports nothing.
+        self.assertEqual(Lesson.objects.get(pk=self.lessons[0].pk).finalize(), 0)
+    
+    def test_attendance_rate_counts_ended_lessons_before_finalizing(self):
+        client = self.client_for(self.students[0])
+        # Present at one of the two ended lessons; the upcoming ones are ignored.
+        self.assertEqual(client.get('/api/api/dashboard/').json()['my_attendance_rate'], 50.0)
+        self.finalize()
+        self.assertEqual(client.get('/api/api/dashboard/').json()['my_attendance_rate'], 50.0)
+    
+    def test_attendance_rate_reads_the_attendance_rows(self):
+        self.finalize()
+        # The attendance aggregate, and the count of ended lessons still
+        # waiting to be finalized.
+        with self.assertNumQueries(2):
+            self.assertEqual(calculate_attendance_rate(self.students[1]), 0)
+        Attendance.objects.filter(lesson=self.lessons[1], student=self.students[1]).update(status='late')
+        self.assertEqual(calculate_attendance_rate(self.students[1]), 50.0)
+
+
+class RecordingBroker(InProcessBroker):
+    # Keeps every published event, so tests can check them without a stream.
+    
+    def __init__(self, queue_size=256):
+        super().__init__(queue_size)
+        self.events = []
+    
+    def publish(self, lesson_id, event):
+        self.events.append((lesson_id, event))
+        super().publish(lesson_id, event)
+
+
+@override_settings(LIVE_ROSTER={'BACKEND': 'attendance.tests.RecordingBroker'})
+class LiveRosterPublishTests(LessonTestCase):
+    def setUp(self):
+        super().setUp()
+        Attendance.objects.create(
+            lesson=self.lesson, student=self.students[0], status='present', marked_at=self.lesson.start_time
+        )
+        get_live_roster().events.clear()
+    
+    def published(self):
+        return [
+            (lesson_id, event['student_id'], event['status'], event['marked_at'])
+            for lesson_id, event in get_live_roster().events
+        ]
+    
+    def stored(self, student):
+        attendance = Attendance.objects.get(lesson=self.lesson, student=student)
+        return (self.lesson.id, student.id, attendance.status, attendance.marked_at.isoformat())
+    
+    def test_only_rows_the_upsert_changed_are_published(self):
+        # Student 0 already has an earlier scan, which wins over both rescans.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/api/mark-attendance/', {'qr_code': self.code(self.students[0])}, format='json')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                '/api/api/mark-attendance/batch/',
+                {'qr_codes': [self.code(student) for student in self.students[:2]]}, format='json'
+            )
+        self.assertEqual(self.published(), [self.stored(self.students[1])])
+    
+    def test_queued_scans_are_published_once_flushed(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = f'{directory.name}/scan_queue.sqlite3'
+        scans = [
+            Attendance(lesson_id=self.lesson.id, student_id=student.id, status='late', marked_at=timezone.now())
+            for student in self.students[:2]
+        ]
+        with override_settings(SCAN_WRITE_BEHIND={'ENABLED': True, 'PATH': path, 'FLUSH_INTERVAL': 3600}):
+            with self.captureOnCommitCallbacks(execute=True):
+                record_attendance(scans)
+            self.assertEqual(self.published(), [])
+            with self.captureOnCommitCallbacks(execute=True):
+                get_scan_queue().flush()
+        self.assertEqual(self.published(), [self.stored(self.students[1])])
+
+
+class LiveRosterStreamTests(TransactionTestCase):
+    # The stream reads through executor threads with their own connections,
+    # which would not see the rows of a TestCase transaction.
+    
+    def setUp(self):
+        self.teacher = User.objects.create_user(username='teacher', password='x', role='teacher', phone_number='1')
+        self.other = User.objects.create_user(username='other', password='x', role='teacher', phone_number='2')
+        self.students = [
+            User.objects.create_user(username=f'student{i}', password='x', role='student', phone_number=f'3{i}')
+            for i in range(2)
+        ]
+        class_room = Class.objects.create(name='9-A')
+        class_room.students.set(self.students)
+        start = timezone.now() - timedelta(minutes=5)
+        self.lesson = Lesson.objects.create(
+            subject=Subject.objects.create(name='Geografiya', teacher=self.teacher),
+            class_room=class_room, start_time=start, end_time=start + timedelta(minutes=45)
+        )
+        Attendance.objects.create(lesson=self.lesson, student=self.students[0], status='present', marked_at=start)
+        self.url = f'/api/api/lessons/{self.lesson.id}/roster/stream/'
+    
+    def event(self, chunk):
+        name, data = (chunk.decode() if isinstance(chunk, bytes) else chunk).strip().split('\n')
+        return name.removeprefix('event: '), json.loads(data.removeprefix('data: '))
+    
+    async def test_snapshot_then_marks(self):
+        token = str(RefreshToken.for_user(self.teacher).access_token)
+        response = await self.async_client.get(self.url, {'token': token})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        
+        name, data = self.event(await asyncio.wait_for(anext(stream), 5))
+        self.assertEqual(name, 'snapshot')
+        self.assertEqual([(item['student_id'], item['status']) for item in data], [(self.students[0].id, 'present')])
+        
+        await sync_to_async(record_attendance)([Attendance(
+            lesson_id=self.lesson.id, student_id=self.students[1].id, status='late', marked_at=timezone.now()
+        )])
+        name, data = self.event(await asyncio.wait_for(anext(stream), 5))
+        self.assertEqual((name, data['student_id'], data['status']), ('mark', self.students[1].id, 'late'))
+        await stream.aclose()
+    
+    async def test_only_the_lessons_teacher_may_listen(self):
+        token = str(RefreshToken.for_user(self.other).access_token)
+        self.assertEqual((await self.async_client.get(self.url, {'token': token})).status_code, 403)
+        self.assertEqual((await self.async_client.get(self.url)).status_code, 401)
+
+
+@modify_settings(MIDDLEWARE={'append': 'attendance.middleware.QueryCountMiddleware'})
+class QueryCountMiddlewareTests(LessonTestCase):
+    def test_responses_report_their_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/api/lessons/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(int(response['X-Query-Count']), len(queries))
+        self.assertNotIn('X-DB-Lock-Timeout', response)
+    
+    def test_lock_timeouts_are_flagged(self):
+        def locked(request):
+            middleware.process_exception(request, OperationalError('database is locked'))
+            return HttpResponse(status=500)
+        
+        middleware = QueryCountMiddleware(locked)
+        response = middleware(RequestFactory().get('/'))
+        self.assertEqual((response['X-Query-Count'], response['X-DB-Lock-Timeout']), ('0', '1'))
+
+
+class ScanAdmissionTests(LessonTestCase):
+    def scan(self, device):
+        return self.client.post('/api/api/mark-attendance/', {'qr_code': 'no-such-code'}, format='json', HTTP_X_DEVICE_ID=device)
+    
+    @override_settings(SCAN_THROTTLE={'RATE': 0.5, 'BURST': 2})
+    def test_each_device_gets_its_own_bucket(self):
+        self.assertEqual([self.scan('door').status_code for _ in range(2)], [400, 400])
+        throttled = self.scan('door')
+        self.assertEqual(throttled.status_code, 429)
+        self.assertGreaterEqual(int(throttled['Retry-After']), 1)
+        self.assertEqual(self.scan('window').status_code, 400)
+    
+    @override_settings(SCAN_THROTTLE={'MAX_CONCURRENT': 1, 'BUSY_RETRY_AFTER': 3})
+    def test_scans_past_the_concurrency_cap_are_shed(self):
+        slots = _in_flight_slots()
+        slots.acquire()
+        try:
+            response = self.scan('door')
+        finally:
+            slots.release()
+        self.assertEqual((response.status_code, response['Retry-After']), (503, '3'))
+        self.assertEqual(self.scan('door').status_code, 400)
+
+
+# The response cache would answer repeated GETs without the queries counted here.
+@override_settings(RESPONSE_CACHE={'ENABLED': False})
+class ListQueryBudgetTests(TestCase):
+    # A list endpoint must cost the same number of queries whatever the number
+    # of rows. A serializer reading a relation that its view did not load
+    # shows up as a difference between the small and the large school.
+    endpoints = [
+        ('admin', '/api/api/users/'),
+        ('admin', '/api/api/classes/'),
+        ('admin', '/api/api/classes/?expand=students'),
+        ('teacher', '/api/api/subjects/'),
+        ('teacher', '/api/api/subjects/?expand=classes,classes.students'),
+        ('admin', '/api/api/lessons/'),
+        ('teacher', '/api/api/lessons/'),
+        ('student', '/api/api/lessons/'),
+        ('student', '/api/api/my-qr-codes/'),
+        ('student', '/api/api/my-qr-codes/?fields=code,lesson_info,qr_image_url'),
+        ('admin', '/api/api/attendance/'),
+        ('teacher', '/api/api/attendance/'),
+        ('student', '/api/api/attendance/'),
+    ]
+    
+    def setUp(self):
+        self.users = {
+            'admin': User.objects.create_user(username='admin', password='x', role='admin', phone_number='1'),
+            'teacher': User.objects.create_user(username='teacher', password='x', role='teacher', phone_number='2'),
+            'student': User.objects.create_user(username='student', password='x', role='student', phone_number='3'),
+        }
+        self.size = 0
+    
+    def grow(self, count):
+        # Each step adds a classmate, a class, a subject and a lesson with
+        # marked attendance, all visible to the three users.
+        start = timezone.now() - timedelta(minutes=5)
+        for _ in range(count):
+            self.size += 1
+            classmate = User.objects.create_user(
+                username=f'classmate{self.size}', password='x', role='student', phone_number=f'9{self.size:04d}'
+            )
+            class_room = Class.objects.create(name=f'Class {self.size}')
+            class_room.students.set([self.users['student'], classmate])
+            subject = Subject.objects.create(name=f'Subject {self.size}', teacher=self.users['teacher'])
+            subject.classes.set([class_room])
+            lesson = Lesson.objects.create(
+                subject=subject,
+                class_room=class_room,
+                start_time=start + timedelta(days=self.size),
+                end_time=start + timedelta(days=self.size, minutes=45)
+            )
+            Attendance.objects.bulk_create([
+                Attendance(lesson=lesson, student=student, status='present', marked_at=start)
+                for student in (self.users['student'], classmate)
+            ])
+    
+    def count_queries(self, role, url):
+        client = APIClient()
+        client.force_authenticate(self.users[role])
+        with CaptureQueriesContext(connection) as captured:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(captured)
+    
+    def test_query_count_does_not_grow_with_rows(self):
+        self.grow(2)
+        small = {endpoint: self.count_queries(*endpoint) for endpoint in self.endpoints}
+        self.grow(8)
+        for endpoint in self.endpoints:
+            with self.subTest(endpoint=endpoint):
+                self.assertEqual(self.count_queries(*endpoint), small[endpoint])
+
+
+@override_settings(RESPONSE_CACHE={'ENABLED': False})
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username='admin', password='x', role='admin', phone_number='1')
+        teacher = User.objects.create_user(username='teacher', password='x', role='teacher', phone_number='2')
+        class_room = Class.objects.create(name='9-A')
+        subject = Subject.objects.create(name='Math', teacher=teacher)
+        start = timezone.now()
+        # Lessons sharing a start_time must still page without gaps or repeats.
+        for offset in [0, 0, 0, 1, 1, 2, 3]:
+            Lesson.objects.create(
+                subject=subject,
+                class_room=class_room,
+                start_time=start + timedelta(hours=offset),
+                end_time=start + timedelta(hours=offset, minutes=45)
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+    
+    def walk(self, url, link):
+        pages = []
+        while url:
+            data = self.client.get(url).json()
+            pages.append([lesson['id'] for lesson in data['results']])
+            url = data[link]
+        return pages
+    
+    def test_next_and_previous_links_cover_every_row_once(self):
+        expected = list(Lesson.objects.order_by('start_time', 'id').values_list('id', flat=True))
+        forward = self.walk('/api/api/lessons/?page_size=2', 'next')
+        self.assertEqual(sum(forward, []), expected)
+        
+        last_page = self.client.get('/api/api/lessons/?page_size=2').json()
+        while last_page['next']:
+            last_page = self.client.get(last_page['next']).json()
+        backward = self.walk(last_page['previous'], 'previous')
+        self.assertEqual(sum(reversed(backward), []), expected[:-len(forward[-1])])
+    
+    def test_invalid_cursor_is_not_found(self):
+        self.assertEqual(self.client.get('/api/api/lessons/?cursor=not-a-cursor').status_code, 404)
+
+
+@override_settings(RESPONSE_CACHE={'ENABLED': False})
+class FastReadPathTests(TestCase):
+    # The .values() projections and the orjson renderer must produce exactly
+    # the bytes of the serializers and JSONRenderer.
+    
+    def setUp(self):
+        self.teacher = User.objects.create_user(
+            username='teacher', password='x', role='teacher', phone_number='1', full_name='Ozoda \u2028 "Karimova"'
+        )
+        self.student = User.objects.create_user(
+            username='student', password='x', role='student', phone_number='2', full_name='Sardor Qo‘chqorov'
+        )
+        class_room = Class.objects.create(name='9-A')
+        class_room.students.set([self.student])
+        subject = Subject.objects.create(name='Matematika', teacher=self.teacher)
+        subject.classes.set([class_room])
+        start = timezone.now() - timedelta(minutes=5)
+        for day in range(3):
+            lesson = Lesson.objects.create(
+                subject=subject,
+                class_room=class_room,
+                start_time=start + timedelta(days=day),
+                end_time=start + timedelta(days=day, minutes=45)
+            )
+        Attendance.objects.create(lesson=lesson, student=self.student, status='late', marked_at=start)
+    
+    def get(self, user, url):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.get(url).content
+    
+    def test_responses_match_serializer_path(self):
+        for user, url in [
+            (self.teacher, '/api/api/lessons/'),
+            (self.student, '/api/api/lessons/?page_size=2'),
+            (self.teacher, '/api/api/attendance/'),
+            (self.student, '/api/api/my-qr-codes/'),
+            (self.student, '/api/api/my-qr-codes/?fields=code,lesson_info&image_format=svg'),
+        ]:
+            with self.subTest(url=url):
+                fast = self.get(user, url)
+                with override_settings(FAST_READ_PATH={'ENABLED': False}):
+                    self.assertEqual(fast, self.get(user, url))
+    
+    def test_renderer_matches_json_renderer(self):
+        data = {
+            'name': 'Qo‘chqorov \u2028 \u2029 "x"\n',
+            'at': timezone.now(),
+            'nested': [{'id': 1, 'ok': True, 'none': None}],
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+
+class AttendanceExportTests(TestCase):
+    def setUp(self):
+        self.teacher = User.objects.create_user(
+            username='teacher', password='x', role='teacher', phone_number='1', full_name='Teacher'
+        )
+        self.students = [
+            User.objects.create_user(
+                username=f'student{i}', password='x', role='student', phone_number=f'2{i}', full_name=f'Student, {i}'
+            )
+            for i in range(3)
+        ]
+        subject = Subject.objects.create(name='Fizika', teacher=self.teacher)
+        start = timezone.now() - timedelta(minutes=5)
+        for name in ['9-A', '9-B']:
+            class_room = Class.objects.create(name=name)
+            class_room.students.set(self.students)
+            lesson = Lesson.objects.create(
+                subject=subject, class_room=class_room, start_time=start, end_time=start + timedelta(minutes=45)
+            )
+            for student in self.students:
+                Attendance.objects.create(lesson=lesson, student=student, status='present', marked_at=start)
+        self.class_room = class_room
+        self.client = APIClient()
+        self.client.force_authenticate(self.teacher)
+    
+    def export(self, query):
+        response = self.client.get('/api/api/attendance/export/', query)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+    
+    def test_ndjson_lines_match_the_list(self):
+        lines = self.export({'format': 'ndjson', 'class_id': self.class_room.id}).splitlines()
+        listed = self.client.get('/api/api/attendance/', {'class_id': self.class_room.id}).json()['results']
+        self.assertEqual([json.loads(line) for line in lines], listed)
+    
+    def test_csv_has_a_header_and_a_row_per_record(self):
+        rows = list(csv.DictReader(self.export({}).splitlines()))
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[0]['student_name'], 'Student, 0')
+        self.assertEqual(rows[0]['lesson_info.subject'], 'Fizika')
+    
+    def test_the_first_row_is_sent_before_the_rest_is_read(self):
+        read = []
+        
+        def rows():
+            for index in range(1000):
+                read.append(index)
+                yield {'id': index, 'status': 'present'}
+        
+        stream = CSVRenderer().stream(rows())
+        self.assertEqual(next(stream), b'id,status\r\n0,present\r\n')
+        self.assertEqual(read, [0])
+        self.assertEqual(b''.join(stream).count(b'\r\n'), 999)
+    
+    def test_students_export_only_their_own_records(self):
+        self.client.force_authenticate(self.students[0])
+        lines = self.export({'format': 'ndjson'}).splitlines()
+        self.assertEqual({json.loads(line)['student'] for line in lines}, {self.students[0].id})
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        teacher = User.objects.create_user(username='teacher', password='x', role='teacher', phone_number='1')
+        self.subject = Subject.objects.create(name='Kimyo', teacher=teacher)
+        self.students = []
+        self.classes = []
+        for name in ['9-A', '9-B']:
+            student = User.objects.create_user(username=f'student {name}', password='x', role='student', phone_number=name)
+            class_room = Class.objects.create(name=name)
+            class_room.students.set([student])
+            self.students.append(student)
+            self.classes.append(class_room)
+            self.add_lesson(class_room)
+    
+    def add_lesson(self, class_room):
+        start = timezone.now() + timedelta(days=Lesson.objects.count())
+        with self.captureOnCommitCallbacks(execute=True):
+            return Lesson.objects.create(
+                subject=self.subject, class_room=class_room, start_time=start, end_time=start + timedelta(minutes=45)
+            )
+    
+    def get(self, student, url):
+        client = APIClient()
+        client.force_authenticate(student)
+        return client.get(url).json()['results']
+    
+    def test_repeated_requests_are_served_from_the_cache(self):
+        for url in ['/api/api/lessons/', '/api/api/my-qr-codes/']:
+            first = self.get(self.students[0], url)
+            with self.assertNumQueries(0):
+                self.assertEqual(self.get(self.students[0], url), first)
+    
+    def test_read_paths_do_not_share_entries(self):
+        self.get(self.students[0], '/api/api/lessons/')
+        with override_settings(FAST_READ_PATH={'ENABLED': False}):
+            with CaptureQueriesContext(connection) as captured:
+                self.get(self.students[0], '/api/api/lessons/')
+        self.assertGreater(len(captured), 0)
+    
+    def test_changes_invalidate_only_the_affected_students(self):
+        for student in self.students:
+            self.get(student, '/api/api/my-qr-codes/')
+        
+        self.add_lesson(self.classes[0])
+        self.assertEqual(len(self.get(self.students[0], '/api/api/my-qr-codes/')), 2)
+        with self.assertNumQueries(0):
+            self.assertEqual(len(self.get(self.students[1], '/api/api/my-qr-codes/')), 1)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.classes[0].students.add(self.students[1])
+        self.assertEqual(len(self.get(self.students[1], '/api/api/lessons/')), 3)
@@ -0,0 +1,129 @@
+import functools
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.throttling import BaseThrottle
+
+
+DEFAULT_SCAN_THROTTLE = {
+    'ENABLED': True,
+    'RATE': 5,
+    'BURST': 30,
+    'CACHE': 'default',
+    'MAX_CONCURRENT': 32,
+    'BUSY_RETRY_AFTER': 1,
+}
+
+
+class AdmissionCounters:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.accepted = 0
+        self.throttled = 0
+        self.shed = 0
+        self.in_flight = 0
+
+    def add(self, name, amount=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'accepted': self.accepted,
+                'throttled': self.throttled,
+                'shed': self.shed,
+                'in_flight': self.in_flight,
+            }
+
+
+admission_counters = AdmissionCounters()
+_slots = None
+
+
+def scan_throttle_option(name):
+    return {**DEFAULT_SCAN_THROTTLE, **getattr(settings, 'SCAN_THROTTLE', {})}[name]
+
+
+def device_id(request):
+    return request.META.get('HTTP_X_DEVICE_ID', '')[:64]
+
+
+class ScanRateThrottle(BaseThrottle):
+    # Token bucket per (teacher, X-Device-ID): BURST scans at once, refilled
+    # at RATE scans per second, so a scanner replaying its queue is slowed
+    # down without touching other classrooms. The bucket lives in the CACHE
+    # alias; with a shared cache the limit holds across workers. Reads and
+    # writes are not atomic, so concurrent requests from one device may
+    # overshoot by a token or two.
+
+    def allow_request(self, request, view):
+        if not scan_throttle_option('ENABLED') or not request.user.is_authenticated:
+            return True
+
+        rate = scan_throttle_option('RATE')
+        burst = scan_throttle_option('BURST')
+        cache = caches[scan_throttle_option('CACHE')]
+        key = f'scan-throttle:{request.user.id}:{device_id(request)}'
+        now = time.time()
+
+        tokens, updated_at = cache.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated_at) * rate)
+        if tokens < 1:
+            self._wait = (1 - tokens) / rate
+            admission_counters.add('throttled')
+            return False
+
+        cache.set(key, (tokens - 1, now), timeout=int(burst / rate) + 1)
+        return True
+
+    def wait(self):
+        return self._wait
+
+
+def _in_flight_slots():
+    global _slots
+    if _slots is None:
+        _slots = threading.BoundedSemaphore(scan_throttle_option('MAX_CONCURRENT'))
+    return _slots
+
+
+def admit_scan(view):
+    # Caps the scans a process works on at once. Past MAX_CONCURRENT the
+    # request is refused with 503 straight away instead of queueing on the
+    # database write lock, where every classroom's latency would grow.
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not scan_throttle_option('ENABLED'):
+            return view(request, *args, **kwargs)
+
+        slots = _in_flight_slots()
+        if not slots.acquire(blocking=False):
+            admission_counters.add('shed')
+            retry_after = scan_throttle_option('BUSY_RETRY_AFTER')
+            return Response(
+                {'error': 'Server is busy, retry shortly'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={'Retry-After': str(retry_after)}
+            )
+        admission_counters.add('accepted')
+        admission_counters.add('in_flight')
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            admission_counters.add('in_flight', -1)
+            slots.release()
+    return wrapper
+
+
+@receiver(setting_changed)
+def _reset_scan_slots(sender, setting, **kwargs):
+    global _slots
+    if setting == 'SCAN_THROTTLE':
+        _slots = None
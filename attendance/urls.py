@@ -17,19 +17,28 @@ urlpatterns = [
     
     path('api/classes/', classes_view, name='classes'),
     path('api/classes/<int:class_id>/', class_detail_view, name='class_detail'),
+    path('api/classes/<int:class_id>/qr-sheet/', class_qr_sheet_view, name='class_qr_sheet'),
     
 
     path('api/subjects/', subjects_view, name='subjects'),
     
     path('api/lessons/', lessons_view, name='lessons'),
+    path('api/lessons/<int:lesson_id>/qr-sheet/', lesson_qr_sheet_view, name='lesson_qr_sheet'),
+    path('api/lessons/<int:lesson_id>/roster/stream/', lesson_roster_stream_view, name='lesson_roster_stream'),
     
     path('api/my-qr-codes/', student_qr_codes_view, name='student_qr_codes'),
     path('api/qr-codes/<int:qr_id>/', qr_code_detail_view, name='qr_code_detail'),
+    path('api/qr-codes/<int:qr_id>/image.png', qr_code_image_view, name='qr_code_image'),
+    path('api/qr-codes/by-code/<str:code>/image.png', qr_code_image_by_code_view, name='qr_code_image_by_code'),
     
     path('api/mark-attendance/', mark_attendance_view, name='mark_attendance'),
+    path('api/mark-attendance/batch/', mark_attendance_batch_view, name='mark_attendance_batch'),
+    path('api/mark-attendance/sync/', scan_sync_view, name='scan_sync'),
     path('api/attendance/', attendance_list_view, name='attendance_list'),
+    path('api/attendance/export/', attendance_export_view, name='attendance_export'),
     
     path('api/dashboard/', dashboard_view, name='dashboard'),
+    path('api/metrics/', metrics_view, name='metrics'),
 ]
 
 if settings.DEBUG:
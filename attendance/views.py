@@ -1,20 +1,50 @@
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, renderer_classes, throttle_classes
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
 from rest_framework_simplejwt.tokens import RefreshToken
+from asgiref.sync import sync_to_async
 from django.contrib.auth import authenticate
 from drf_yasg import openapi
 from django.core.cache import cache
+import asyncio
+import functools
+import itertools
+import json
 import random
 from django.utils import timezone
-from django.db.models import Q
+from django.db import close_old_connections
+from django.db.models import Count, Exists, OuterRef, Q
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.utils.http import parse_etags
 from .models import User, Class, Subject, Lesson, QRCode, Attendance
+from .qr_cache import get_qr_image_cache, qr_image_cache_option
+from .live_roster import get_live_roster, live_roster_option
+from .response_cache import cache_response, get_response_cache
+from .scan_index import get_scan_index
+from .throttling import ScanRateThrottle, admission_counters, admit_scan
+from .write_behind import get_scan_queue
 from .serializers import (
     UserSerializer, LoginSerializer, ClassSerializer, SubjectSerializer,
-    LessonSerializer, QRCodeSerializer, AttendanceSerializer, MarkAttendanceSerializer, ForgotPasswordSerializer,ResetPasswordSerializer
+    LessonSerializer, QRCodeSerializer, AttendanceSerializer, MarkAttendanceSerializer, ForgotPasswordSerializer,ResetPasswordSerializer,
+    QRRenderOptionsSerializer, QRSheetOptionsSerializer, QRCodeListQuerySerializer, split_param,
+    MarkAttendanceBatchSerializer, ScanSyncSerializer
 )
+from .scanning import sync_cursor
+from .pagination import KeysetPagination
+from .projections import (
+    ATTENDANCE_VALUES, LESSON_VALUES, QR_CODE_VALUES,
+    attendance_row, attendance_rows, fast_read_path_option, lesson_rows, qr_code_rows
+)
+from .renderers import CSVRenderer, FastJSONRenderer, NDJSONRenderer
+from .qr_tokens import is_qr_token, lesson_qr_token, read_qr_token, signed_tokens_enabled
+from .qr_sheets import sheet_cell_size, stream_pdf_sheet, stream_png_sheet
+from .rendering import QR_FORMATS
 
 
 
@@ -117,7 +147,9 @@ def register_view(request):
 @swagger_auto_schema(
     method='get',
     manual_parameters=[
-        openapi.Parameter('role', openapi.IN_QUERY, description="Filter by role", type=openapi.TYPE_STRING)
+        openapi.Parameter('role', openapi.IN_QUERY, description="Filter by role", type=openapi.TYPE_STRING),
+        openapi.Parameter('cursor', openapi.IN_QUERY, description="Opaque cursor from the next/previous link", type=openapi.TYPE_STRING),
+        openapi.Parameter('page_size', openapi.IN_QUERY, description="Items per page (max 100)", type=openapi.TYPE_INTEGER)
     ],
     responses={200: UserSerializer(many=True)},
     operation_description="List all users (admin only)"
@@ -140,8 +172,10 @@ def users_view(request):
         users = User.objects.all()
         if role:
             users = users.filter(role=role)
-        serializer = UserSerializer(users, many=True)
-        return Response(serializer.data)
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(users, request)
+        serializer = UserSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
     
     elif request.method == 'POST':
         if request.user.role != 'admin':
@@ -211,8 +245,20 @@ def user_detail_view(request, user_id):
         return Response({'message': 'User deleted successfully'}, status=status.HTTP_204_NO_CONTENT)
 
 # Class Management
+def expansion_context(request):
+    return {
+        'fields': split_param(request.GET.get('fields')),
+        'expand': split_param(request.GET.get('expand')),
+    }
+
 @swagger_auto_schema(
     method='get',
+    manual_parameters=[
+        openapi.Parameter('fields', openapi.IN_QUERY, description="Comma-separated fields to return", type=openapi.TYPE_STRING),
+        openapi.Parameter('expand', openapi.IN_QUERY, description="Relations to nest in full, e.g. classes,classes.students", type=openapi.TYPE_STRING),
+        openapi.Parameter('cursor', openapi.IN_QUERY, description="Opaque cursor from the next/previous link", type=openapi.TYPE_STRING),
+        openapi.Parameter('page_size', openapi.IN_QUERY, description="Items per page (max 100)", type=openapi.TYPE_INTEGER)
+    ],
     responses={200: ClassSerializer(many=True)},
     operation_description="List all classes"
 )
@@ -230,9 +276,12 @@ def user_detail_view(request, user_id):
 @permission_classes([IsAuthenticated])
 def classes_view(request):
     if request.method == 'GET':
-        classes = Class.objects.all()
-        serializer = ClassSerializer(classes, many=True)
-        return Response(serializer.data)
+        context = expansion_context(request)
+        classes = ClassSerializer.setup_eager_loading(Class.objects.all(), **context)
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(classes, request)
+        serializer = ClassSerializer(page, many=True, context=context)
+        return paginator.get_paginated_response(serializer.data)
     
     elif request.method == 'POST':
         if request.user.role != 'admin':
@@ -246,6 +295,10 @@ def classes_view(request):
 
 @swagger_auto_schema(
     method='get',
+    manual_parameters=[
+        openapi.Parameter('fields', openapi.IN_QUERY, description="Comma-separated fields to return", type=openapi.TYPE_STRING),
+        openapi.Parameter('expand', openapi.IN_QUERY, description="Relations to nest in full, e.g. classes,classes.students", type=openapi.TYPE_STRING)
+    ],
     responses={
         200: ClassSerializer,
         404: 'Class not found'
@@ -281,7 +334,7 @@ def class_detail_view(request, class_id):
         return Response({'error': 'Class not found'}, status=status.HTTP_404_NOT_FOUND)
     
     if request.method == 'GET':
-        serializer = ClassSerializer(class_obj)
+        serializer = ClassSerializer(class_obj, context=expansion_context(request))
         return Response(serializer.data)
     
     elif request.method == 'PUT':
@@ -303,6 +356,10 @@ def class_detail_view(request, class_id):
 
 @swagger_auto_schema(
     method='get',
+    manual_parameters=[
+        openapi.Parameter('fields', openapi.IN_QUERY, description="Comma-separated fields to return", type=openapi.TYPE_STRING),
+        openapi.Parameter('expand', openapi.IN_QUERY, description="Relations to nest in full, e.g. classes,classes.students", type=openapi.TYPE_STRING)
+    ],
     responses={200: SubjectSerializer(many=True)},
     operation_description="List all subjects"
 )
@@ -320,10 +377,11 @@ def class_detail_view(request, class_id):
 @permission_classes([IsAuthenticated])
 def subjects_view(request):
     if request.method == 'GET':
-        subjects = Subject.objects.all()
+        context = expansion_context(request)
+        subjects = SubjectSerializer.setup_eager_loading(Subject.objects.all(), **context)
         if request.user.role == 'admin':
             subjects = subjects.filter(teacher=request.user)
-        serializer = SubjectSerializer(subjects, many=True)
+        serializer = SubjectSerializer(subjects, many=True, context=context)
         return Response(serializer.data)
     
     elif request.method == 'POST':
@@ -340,7 +398,9 @@ def subjects_view(request):
 @swagger_auto_schema(
     method='get',
     manual_parameters=[
-        openapi.Parameter('date', openapi.IN_QUERY, description="Filter by date (YYYY-MM-DD)", type=openapi.TYPE_STRING)
+        openapi.Parameter('date', openapi.IN_QUERY, description="Filter by date (YYYY-MM-DD)", type=openapi.TYPE_STRING),
+        openapi.Parameter('cursor', openapi.IN_QUERY, description="Opaque cursor from the next/previous link", type=openapi.TYPE_STRING),
+        openapi.Parameter('page_size', openapi.IN_QUERY, description="Items per page (max 100)", type=openapi.TYPE_INTEGER)
     ],
     responses={200: LessonSerializer(many=True)},
     operation_description="List all lessons"
@@ -357,9 +417,11 @@ def subjects_view(request):
 )
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
+@renderer_classes([FastJSONRenderer, BrowsableAPIRenderer])
+@cache_response('lessons')
 def lessons_view(request):
     if request.method == 'GET':
-        lessons = Lesson.objects.all()
+        lessons = LessonSerializer.setup_eager_loading(Lesson.objects.all())
         
         if request.user.role == 'teacher':
             lessons = lessons.filter(subject__teacher=request.user)
@@ -371,8 +433,14 @@ def lessons_view(request):
         if date:
             lessons = lessons.filter(start_time__date=date)
         
-        serializer = LessonSerializer(lessons, many=True)
-        return Response(serializer.data)
+        paginator = KeysetPagination(ordering=('start_time', 'id'))
+        if fast_read_path_option('ENABLED'):
+            page = paginator.paginate_queryset(lessons.values(*LESSON_VALUES), request)
+            return paginator.get_paginated_response(lesson_rows(page))
+        
+        page = paginator.paginate_queryset(lessons, request)
+        serializer = LessonSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
     
     elif request.method == 'POST':
         if request.user.role != 'admin':
@@ -388,7 +456,18 @@ def lessons_view(request):
 @swagger_auto_schema(
     method='get',
     manual_parameters=[
-        openapi.Parameter('date', openapi.IN_QUERY, description="Filter by date (YYYY-MM-DD)", type=openapi.TYPE_STRING)
+        openapi.Parameter('date', openapi.IN_QUERY, description="Filter by date (YYYY-MM-DD)", type=openapi.TYPE_STRING),
+        openapi.Parameter('date_from', openapi.IN_QUERY, description="Lessons on or after this date (YYYY-MM-DD)", type=openapi.TYPE_STRING),
+        openapi.Parameter('date_to', openapi.IN_QUERY, description="Lessons on or before this date (YYYY-MM-DD)", type=openapi.TYPE_STRING),
+        openapi.Parameter('upcoming', openapi.IN_QUERY, description="Only lessons that have not ended yet", type=openapi.TYPE_BOOLEAN),
+        openapi.Parameter('include', openapi.IN_QUERY, description="Set to 'qr_image' to embed the base64 image", type=openapi.TYPE_STRING),
+        openapi.Parameter('fields', openapi.IN_QUERY, description="Comma-separated fields to return", type=openapi.TYPE_STRING),
+        openapi.Parameter('cursor', openapi.IN_QUERY, description="Opaque cursor from the next/previous link", type=openapi.TYPE_STRING),
+        openapi.Parameter('page_size', openapi.IN_QUERY, description="Items per page (max 100)", type=openapi.TYPE_INTEGER),
+        openapi.Parameter('image_format', openapi.IN_QUERY, description="png, png1bit or svg", type=openapi.TYPE_STRING),
+        openapi.Parameter('box_size', openapi.IN_QUERY, description="Pixels per module", type=openapi.TYPE_INTEGER),
+        openapi.Parameter('border', openapi.IN_QUERY, description="Quiet zone in modules", type=openapi.TYPE_INTEGER),
+        openapi.Parameter('error_correction', openapi.IN_QUERY, description="L, M, Q or H", type=openapi.TYPE_STRING)
     ],
     responses={
         200: QRCodeSerializer(many=True),
@@ -398,22 +477,81 @@ def lessons_view(request):
 )
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@renderer_classes([FastJSONRenderer, BrowsableAPIRenderer])
+@cache_response('my_qr_codes', skip_params=('upcoming',))
 def student_qr_codes_view(request):
     if request.user.role != 'student':
         return Response({'error': 'Only students can access QR codes'}, status=status.HTTP_403_FORBIDDEN)
     
-    qr_codes = QRCode.objects.filter(student=request.user)
+    query = QRCodeListQuerySerializer(data=request.GET)
+    if not query.is_valid():
+        return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+    params = query.validated_data
     
-   
-    date = request.GET.get('date')
-    if date:
-        qr_codes = qr_codes.filter(lesson__start_time__date=date)
+    # Both modes page over the student's lessons, seeking on (start_time, id)
+    # with the lesson_start_time_id index, so a deep page costs the same as
+    # the first; a student has at most one code per lesson.
+    if signed_tokens_enabled():
+        # Tokens are derived from the student's lessons; there are no rows.
+        lessons = Lesson.objects.filter(class_room__students=request.user)
+    else:
+        # EXISTS rather than a join: the lessons are walked in index order and
+        # each is probed on the (lesson, student) unique index, where a join
+        # would read all of the student's codes and sort them.
+        lessons = Lesson.objects.filter(
+            Exists(QRCode.objects.filter(lesson=OuterRef('pk'), student=request.user))
+        )
     
-    serializer = QRCodeSerializer(qr_codes, many=True)
-    return Response(serializer.data)
+    if params.get('date'):
+        lessons = lessons.filter(start_time__date=params['date'])
+    if params.get('date_from'):
+        lessons = lessons.filter(start_time__date__gte=params['date_from'])
+    if params.get('date_to'):
+        lessons = lessons.filter(start_time__date__lte=params['date_to'])
+    if params['upcoming']:
+        lessons = lessons.filter(end_time__gte=timezone.now())
+    
+    options = QRRenderOptionsSerializer(data=request.GET)
+    if not options.is_valid():
+        return Response(options.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    fields = split_param(params['fields'])
+    context = qr_serializer_context(request, options.validated_data)
+    context['fields'] = fields
+    context['embed_qr_image'] = 'qr_image' in split_param(params['include']) or 'qr_image' in fields
+    
+    paginator = KeysetPagination(ordering=('start_time', 'id'))
+    if signed_tokens_enabled():
+        page = paginator.paginate_queryset(lessons.select_related('subject', 'class_room'), request)
+        page = [
+            QRCode(lesson=lesson, student=request.user, code=lesson_qr_token(lesson, request.user.id))
+            for lesson in page
+        ]
+        serializer = QRCodeSerializer(page, many=True, context=context)
+        return paginator.get_paginated_response(serializer.data)
+    
+    lesson_ids = [lesson['id'] for lesson in paginator.paginate_queryset(lessons.values('id', 'start_time'), request)]
+    qr_codes = QRCode.objects.filter(student=request.user, lesson_id__in=lesson_ids)
+    if fast_read_path_option('ENABLED') and not context['embed_qr_image']:
+        rows = {row['lesson__id']: row for row in qr_codes.values(*QR_CODE_VALUES)}
+        query = QRRenderOptionsSerializer.to_query(options.validated_data)
+        page = [rows[lesson_id] for lesson_id in lesson_ids]
+        return paginator.get_paginated_response(qr_code_rows(page, request, query, fields))
+    
+    qr_codes = {qr_code.lesson_id: qr_code for qr_code in QRCodeSerializer.setup_eager_loading(qr_codes)}
+    page = [qr_codes[lesson_id] for lesson_id in lesson_ids]
+    serializer = QRCodeSerializer(page, many=True, context=context)
+    return paginator.get_paginated_response(serializer.data)
 
 @swagger_auto_schema(
     method='get',
+    manual_parameters=[
+        openapi.Parameter('qr_image', openapi.IN_QUERY, description="Set to 'url' to return qr_image_url instead of the embedded image", type=openapi.TYPE_STRING),
+        openapi.Parameter('image_format', openapi.IN_QUERY, description="png, png1bit or svg", type=openapi.TYPE_STRING),
+        openapi.Parameter('box_size', openapi.IN_QUERY, description="Pixels per module", type=openapi.TYPE_INTEGER),
+        openapi.Parameter('border', openapi.IN_QUERY, description="Quiet zone in modules", type=openapi.TYPE_INTEGER),
+        openapi.Parameter('error_correction', openapi.IN_QUERY, description="L, M, Q or H", type=openapi.TYPE_STRING)
+    ],
     responses={
         200: QRCodeSerializer,
         403: 'Permission denied',
@@ -432,14 +570,242 @@ def qr_code_detail_view(request, qr_id):
     if request.user.role == 'student' and qr_code.student != request.user:
         return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
     
-    serializer = QRCodeSerializer(qr_code)
+    options = QRRenderOptionsSerializer(data=request.GET)
+    if not options.is_valid():
+        return Response(options.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    serializer = QRCodeSerializer(qr_code, context=qr_serializer_context(request, options.validated_data))
     return Response(serializer.data)
 
+
+def qr_serializer_context(request, render_options):
+    return {
+        'request': request,
+        'embed_qr_image': request.GET.get('qr_image') != 'url',
+        'qr_render_options': render_options,
+    }
+
+
+def qr_image_response(request, code, student_id):
+    if request.user.role == 'student' and student_id != request.user.id:
+        return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
+    
+    options = QRRenderOptionsSerializer(data=request.GET)
+    if not options.is_valid():
+        return Response(options.errors, status=status.HTTP_400_BAD_REQUEST)
+    render_options = options.validated_data
+    
+    image_cache = get_qr_image_cache()
+    etag = f'"{image_cache.key_for(code, **render_options)}"'
+    cache_control = qr_image_cache_option('CACHE_CONTROL')
+    
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(
+            image_cache.get_or_render(code, **render_options),
+            content_type=QR_FORMATS[render_options['format']]
+        )
+    response['ETag'] = etag
+    response['Cache-Control'] = cache_control
+    return response
+
+@swagger_auto_schema(
+    method='get',
+    manual_parameters=[
+        openapi.Parameter('image_format', openapi.IN_QUERY, description="png, png1bit or svg", type=openapi.TYPE_STRING),
+        openapi.Parameter('box_size', openapi.IN_QUERY, description="Pixels per module", type=openapi.TYPE_INTEGER),
+        openapi.Parameter('border', openapi.IN_QUERY, description="Quiet zone in modules", type=openapi.TYPE_INTEGER),
+        openapi.Parameter('error_correction', openapi.IN_QUERY, description="L, M, Q or H", type=openapi.TYPE_STRING)
+    ],
+    responses={
+        200: 'QR image',
+        304: 'Not modified',
+        403: 'Permission denied',
+        404: 'QR code not found'
+    },
+    operation_description="Get the QR code image as raw PNG or SVG bytes"
+)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def qr_code_image_view(request, qr_id):
+    try:
+        qr_code = QRCode.objects.only('code', 'student_id').get(id=qr_id)
+    except QRCode.DoesNotExist:
+        return Response({'error': 'QR code not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    return qr_image_response(request, qr_code.code, qr_code.student_id)
+
+@swagger_auto_schema(
+    method='get',
+    manual_parameters=[
+        openapi.Parameter('image_format', openapi.IN_QUERY, description="png, png1bit or svg", type=openapi.TYPE_STRING),
+        openapi.Parameter('box_size', openapi.IN_QUERY, description="Pixels per module", type=openapi.TYPE_INTEGER),
+        openapi.Parameter('border', openapi.IN_QUERY, description="Quiet zone in modules", type=openapi.TYPE_INTEGER),
+        openapi.Parameter('error_correction', openapi.IN_QUERY, description="L, M, Q or H", type=openapi.TYPE_STRING)
+    ],
+    responses={
+        200: 'QR image',
+        304: 'Not modified',
+        403: 'Permission denied',
+        404: 'QR code not found'
+    },
+    operation_description="Get the QR code image for a code as raw PNG or SVG bytes"
+)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def qr_code_image_by_code_view(request, code):
+    if signed_tokens_enabled() and is_qr_token(code):
+        claims = read_qr_token(code)
+        if claims is None:
+            return Response({'error': 'QR code not found'}, status=status.HTTP_404_NOT_FOUND)
+        return qr_image_response(request, code, claims.student_id)
+    
+    try:
+        qr_code = QRCode.objects.only('code', 'student_id').get(code=code)
+    except QRCode.DoesNotExist:
+        return Response({'error': 'QR code not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    return qr_image_response(request, qr_code.code, qr_code.student_id)
+
+def qr_sheet_response(opts, entries, total, filename):
+    params = {
+        'format': 'png',
+        'box_size': opts['box_size'],
+        'border': opts['border'],
+        'error_correction': opts['error_correction'],
+    }
+    
+    entries = iter(entries)
+    first = next(entries, None)
+    if first is None:
+        return Response({'error': 'No QR codes found'}, status=status.HTTP_404_NOT_FOUND)
+    cell_size = sheet_cell_size(first[0], params)
+    entries = itertools.chain([first], entries)
+    
+    if opts['sheet_format'] == 'png':
+        content = stream_png_sheet(entries, total, params, opts['columns'], cell_size)
+        content_type = 'image/png'
+    else:
+        content = stream_pdf_sheet(entries, params, opts['columns'], cell_size, opts['rows_per_page'])
+        content_type = 'application/pdf'
+    
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{opts["sheet_format"]}"'
+    return response
+
+@swagger_auto_schema(
+    method='get',
+    manual_parameters=[
+        openapi.Parameter('sheet_format', openapi.IN_QUERY, description="pdf or png", type=openapi.TYPE_STRING),
+        openapi.Parameter('columns', openapi.IN_QUERY, description="Codes per row", type=openapi.TYPE_INTEGER),
+        openapi.Parameter('rows_per_page', openapi.IN_QUERY, description="Rows per PDF page", type=openapi.TYPE_INTEGER),
+        openapi.Parameter('box_size', openapi.IN_QUERY, description="Pixels per module", type=openapi.TYPE_INTEGER),
+        openapi.Parameter('border', openapi.IN_QUERY, description="Quiet zone in modules", type=openapi.TYPE_INTEGER),
+        openapi.Parameter('error_correction', openapi.IN_QUERY, description="L, M, Q or H", type=openapi.TYPE_STRING)
+    ],
+    responses={
+        200: 'Streamed PDF or PNG sheet',
+        403: 'Permission denied',
+        404: 'Lesson not found'
+    },
+    operation_description="Printable sheet with every student's QR code for a lesson (admin or the lesson's teacher)"
+)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def lesson_qr_sheet_view(request, lesson_id):
+    try:
+        lesson = Lesson.objects.select_related('subject').get(id=lesson_id)
+    except Lesson.DoesNotExist:
+        return Response({'error': 'Lesson not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    if request.user.role != 'admin' and lesson.subject.teacher_id != request.user.id:
+        return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
+    
+    options = QRSheetOptionsSerializer(data=request.GET)
+    if not options.is_valid():
+        return Response(options.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    if signed_tokens_enabled():
+        students = lesson.class_room.students.order_by('full_name', 'id')
+        entries = (
+            (lesson_qr_token(lesson, student_id), full_name)
+            for student_id, full_name in students.values_list('id', 'full_name').iterator(chunk_size=200)
+        )
+        return qr_sheet_response(options.validated_data, entries, students.count(), f'lesson_{lesson.id}_qr_codes')
+    
+    qr_codes = QRCode.objects.filter(lesson=lesson).order_by('student__full_name', 'id')
+    entries = qr_codes.values_list('code', 'student__full_name').iterator(chunk_size=200)
+    return qr_sheet_response(options.validated_data, entries, qr_codes.count(), f'lesson_{lesson.id}_qr_codes')
+
+@swagger_auto_schema(
+    method='get',
+    manual_parameters=[
+        openapi.Parameter('sheet_format', openapi.IN_QUERY, description="pdf or png", type=openapi.TYPE_STRING),
+        openapi.Parameter('columns', openapi.IN_QUERY, description="Codes per row", type=openapi.TYPE_INTEGER),
+        openapi.Parameter('rows_per_page', openapi.IN_QUERY, description="Rows per PDF page", type=openapi.TYPE_INTEGER),
+        openapi.Parameter('box_size', openapi.IN_QUERY, description="Pixels per module", type=openapi.TYPE_INTEGER),
+        openapi.Parameter('border', openapi.IN_QUERY, description="Quiet zone in modules", type=openapi.TYPE_INTEGER),
+        openapi.Parameter('error_correction', openapi.IN_QUERY, description="L, M, Q or H", type=openapi.TYPE_STRING),
+        openapi.Parameter('date', openapi.IN_QUERY, description="Lesson date (YYYY-MM-DD), defaults to today", type=openapi.TYPE_STRING)
+    ],
+    responses={
+        200: 'Streamed PDF or PNG sheet',
+        403: 'Permission denied',
+        404: 'Class not found'
+    },
+    operation_description="Printable sheet with the QR codes of a class's lessons on a date (admin or the class's teachers)"
+)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def class_qr_sheet_view(request, class_id):
+    try:
+        class_obj = Class.objects.get(id=class_id)
+    except Class.DoesNotExist:
+        return Response({'error': 'Class not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    qr_codes = QRCode.objects.filter(lesson__class_room=class_obj)
+    if request.user.role == 'teacher':
+        qr_codes = qr_codes.filter(lesson__subject__teacher=request.user)
+    elif request.user.role != 'admin':
+        return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
+    
+    options = QRSheetOptionsSerializer(data=request.GET)
+    if not options.is_valid():
+        return Response(options.errors, status=status.HTTP_400_BAD_REQUEST)
+    date = options.validated_data.get('date') or timezone.localdate()
+    
+    if signed_tokens_enabled():
+        lessons = list(Lesson.objects.filter(
+            class_room=class_obj,
+            start_time__date=date,
+            **({'subject__teacher': request.user} if request.user.role == 'teacher' else {})
+        ).order_by('start_time', 'id'))
+        students = list(class_obj.students.order_by('full_name', 'id').values_list('id', 'full_name'))
+        entries = (
+            (lesson_qr_token(lesson, student_id), f"{full_name} {timezone.localtime(lesson.start_time):%H:%M}")
+            for lesson in lessons
+            for student_id, full_name in students
+        )
+        return qr_sheet_response(options.validated_data, entries, len(lessons) * len(students), f'class_{class_obj.id}_{date}_qr_codes')
+    
+    qr_codes = qr_codes.filter(lesson__start_time__date=date).order_by(
+        'lesson__start_time', 'student__full_name', 'id'
+    )
+    entries = (
+        (code, f"{full_name} {timezone.localtime(start_time):%H:%M}")
+        for code, full_name, start_time in qr_codes.values_list(
+            'code', 'student__full_name', 'lesson__start_time'
+        ).iterator(chunk_size=200)
+    )
+    return qr_sheet_response(options.validated_data, entries, qr_codes.count(), f'class_{class_obj.id}_{date}_qr_codes')
+
 @swagger_auto_schema(
     method='post',
     request_body=MarkAttendanceSerializer,
     responses={
         201: AttendanceSerializer,
+        202: 'Scan queued (write-behind mode)',
         400: 'Invalid data',
         403: 'Permission denied'
     },
@@ -447,57 +813,287 @@ def qr_code_detail_view(request, qr_id):
 )
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@throttle_classes([ScanRateThrottle])
+@admit_scan
 def mark_attendance_view(request):
     if request.user.role != 'teacher':
         return Response({'error': 'Only teachers can mark attendance'}, status=status.HTTP_403_FORBIDDEN)
     
     serializer = MarkAttendanceSerializer(data=request.data)
     if serializer.is_valid():
-        qr_obj = serializer.validated_data['qr_code']
+        target = serializer.validated_data['qr_code']
         
-        if qr_obj.lesson.subject.teacher != request.user:
+        if target.teacher_id != request.user.id:
             return Response({'error': 'You are not authorized to mark attendance for this lesson'}, 
                           status=status.HTTP_403_FORBIDDEN)
         
-        attendance = serializer.mark_attendance(qr_obj)
-        return Response(AttendanceSerializer(attendance).data, status=status.HTTP_201_CREATED)
+        attendance = serializer.mark_attendance(target)
+        # A scan queued by write-behind mode has no id until it is flushed.
+        response_status = status.HTTP_202_ACCEPTED if attendance.pk is None else status.HTTP_201_CREATED
+        return Response(AttendanceSerializer(attendance).data, status=response_status)
+    
+    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+@swagger_auto_schema(
+    method='post',
+    request_body=MarkAttendanceBatchSerializer,
+    responses={
+        200: 'Per-code results: ok, invalid, wrong_teacher or duplicate',
+        400: 'Invalid data',
+        403: 'Permission denied'
+    },
+    operation_description="Mark attendance for many QR codes in one request (teacher only)"
+)
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([ScanRateThrottle])
+@admit_scan
+def mark_attendance_batch_view(request):
+    if request.user.role != 'teacher':
+        return Response({'error': 'Only teachers can mark attendance'}, status=status.HTTP_403_FORBIDDEN)
+    
+    serializer = MarkAttendanceBatchSerializer(data=request.data)
+    if serializer.is_valid():
+        results = serializer.mark_attendance(request.user)
+        summary = {}
+        for item in results:
+            summary[item['result']] = summary.get(item['result'], 0) + 1
+        return Response({'results': results, 'summary': summary})
     
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 @swagger_auto_schema(
     method='get',
     manual_parameters=[
-        openapi.Parameter('class_id', openapi.IN_QUERY, description="Filter by class ID", type=openapi.TYPE_INTEGER),
-        openapi.Parameter('subject_id', openapi.IN_QUERY, description="Filter by subject ID", type=openapi.TYPE_INTEGER),
-        openapi.Parameter('date', openapi.IN_QUERY, description="Filter by date (YYYY-MM-DD)", type=openapi.TYPE_STRING)
+        openapi.Parameter('device_id', openapi.IN_QUERY, description="Scanner device ID", type=openapi.TYPE_STRING)
     ],
-    responses={200: AttendanceSerializer(many=True)},
-    operation_description="List attendance records"
+    responses={
+        200: 'Highest seq already received from the device',
+        400: 'device_id is required',
+        403: 'Permission denied'
+    },
+    operation_description="Get the sync cursor of an offline scanner (teacher only)"
 )
-@api_view(['GET'])
+@swagger_auto_schema(
+    method='post',
+    request_body=ScanSyncSerializer,
+    responses={
+        200: 'Per-record results and the new cursor',
+        400: 'Invalid data',
+        403: 'Permission denied'
+    },
+    operation_description="Upload scans recorded offline; records are deduplicated by (device_id, seq) (teacher only)"
+)
+@api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
-def attendance_list_view(request):
-    attendances = Attendance.objects.all()
+@throttle_classes([ScanRateThrottle])
+@admit_scan
+def scan_sync_view(request):
+    if request.user.role != 'teacher':
+        return Response({'error': 'Only teachers can mark attendance'}, status=status.HTTP_403_FORBIDDEN)
+    
+    if request.method == 'GET':
+        device_id = request.GET.get('device_id')
+        if not device_id:
+            return Response({'error': 'device_id is required'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'device_id': device_id, 'cursor': sync_cursor(request.user, device_id)})
+    
+    elif request.method == 'POST':
+        serializer = ScanSyncSerializer(data=request.data)
+        if serializer.is_valid():
+            results = serializer.sync(request.user)
+            device_id = serializer.validated_data['device_id']
+            return Response({
+                'device_id': device_id,
+                'cursor': sync_cursor(request.user, device_id),
+                'results': results,
+            })
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+def filter_attendances(request, attendances):
+    # The role scoping and query filters shared by the list and the export.
+    lesson_filters = {}
+    student_id = None
     
     if request.user.role == 'teacher':
-        attendances = attendances.filter(lesson__subject__teacher=request.user)
+        lesson_filters['subject__teacher'] = request.user
     elif request.user.role == 'student':
+        student_id = request.user.id
         attendances = attendances.filter(student=request.user)
     
     class_id = request.GET.get('class_id')
     if class_id:
-        attendances = attendances.filter(lesson__class_room_id=class_id)
+        lesson_filters['class_room_id'] = class_id
     
     subject_id = request.GET.get('subject_id')
     if subject_id:
-        attendances = attendances.filter(lesson__subject_id=subject_id)
+        lesson_filters['subject_id'] = subject_id
     
     date = request.GET.get('date')
     if date:
-        attendances = attendances.filter(lesson__start_time__date=date)
+        lesson_filters['start_time__date'] = date
     
-    serializer = AttendanceSerializer(attendances, many=True)
-    return Response(serializer.data)
+    attendances = attendances.filter(**{f'lesson__{key}': value for key, value in lesson_filters.items()})
+    return attendances, lesson_filters, student_id
+
+@swagger_auto_schema(
+    method='get',
+    manual_parameters=[
+        openapi.Parameter('class_id', openapi.IN_QUERY, description="Filter by class ID", type=openapi.TYPE_INTEGER),
+        openapi.Parameter('subject_id', openapi.IN_QUERY, description="Filter by subject ID", type=openapi.TYPE_INTEGER),
+        openapi.Parameter('date', openapi.IN_QUERY, description="Filter by date (YYYY-MM-DD)", type=openapi.TYPE_STRING),
+        openapi.Parameter('cursor', openapi.IN_QUERY, description="Opaque cursor from the next/previous link", type=openapi.TYPE_STRING),
+        openapi.Parameter('page_size', openapi.IN_QUERY, description="Items per page (max 100)", type=openapi.TYPE_INTEGER)
+    ],
+    responses={200: AttendanceSerializer(many=True)},
+    operation_description="List attendance records"
+)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@renderer_classes([FastJSONRenderer, BrowsableAPIRenderer])
+def attendance_list_view(request):
+    attendances, lesson_filters, student_id = filter_attendances(
+        request, AttendanceSerializer.setup_eager_loading(Attendance.objects.all())
+    )
+    
+    paginator = KeysetPagination()
+    queue = get_scan_queue()
+    if fast_read_path_option('ENABLED') and queue is None:
+        page = paginator.paginate_queryset(attendances.values(*ATTENDANCE_VALUES), request)
+        return paginator.get_paginated_response(attendance_rows(page))
+    
+    page = paginator.paginate_queryset(attendances, request)
+    if queue is not None:
+        # Unflushed scans have no id yet; they are listed after the last row.
+        page = queue.overlay(page, lesson_filters, student_id, add_missing=not paginator.has_next)
+    
+    serializer = AttendanceSerializer(page, many=True)
+    return paginator.get_paginated_response(serializer.data)
+
+EXPORT_CHUNK_SIZE = 2000
+
+@swagger_auto_schema(
+    method='get',
+    manual_parameters=[
+        openapi.Parameter('format', openapi.IN_QUERY, description="csv (default) or ndjson", type=openapi.TYPE_STRING),
+        openapi.Parameter('class_id', openapi.IN_QUERY, description="Filter by class ID", type=openapi.TYPE_INTEGER),
+        openapi.Parameter('subject_id', openapi.IN_QUERY, description="Filter by subject ID", type=openapi.TYPE_INTEGER),
+        openapi.Parameter('date', openapi.IN_QUERY, description="Filter by date (YYYY-MM-DD)", type=openapi.TYPE_STRING)
+    ],
+    responses={200: 'Streamed CSV or NDJSON, one attendance record per row'},
+    operation_description="Export every matching attendance record"
+)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@renderer_classes([CSVRenderer, NDJSONRenderer])
+def attendance_export_view(request):
+    # The rows are read with a chunked iterator over the same projection as
+    # the list, joins done in SQL, and written out as they arrive, so memory
+    # does not grow with the export. Ordered by id to follow the primary key
+    # rather than sort the whole result before the first row.
+    queue = get_scan_queue()
+    if queue is not None:
+        queue.flush()
+    
+    attendances, _, _ = filter_attendances(request, Attendance.objects.all())
+    rows = attendances.order_by('id').values(*ATTENDANCE_VALUES).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    
+    renderer = request.accepted_renderer
+    response = StreamingHttpResponse(
+        renderer.stream(attendance_row(row) for row in rows),
+        content_type=f'{renderer.media_type}; charset={renderer.charset}'
+    )
+    response['Content-Disposition'] = f'attachment; filename="attendance.{renderer.format}"'
+    return response
+
+def authenticate_stream(request):
+    # EventSource cannot send an Authorization header, so the access token may
+    # also be passed as ?token=.
+    authenticator = JWTAuthentication()
+    try:
+        raw_token = request.GET.get('token')
+        if raw_token:
+            validated = authenticator.get_validated_token(raw_token)
+            return authenticator.get_user(validated)
+        result = authenticator.authenticate(request)
+    except (AuthenticationFailed, InvalidToken):
+        return None
+    return result[0] if result else None
+
+def stream_db_work(func):
+    # The stream's database work runs on executor threads outside Django's
+    # request cycle, so nothing else would close their connections.
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return wrapper
+
+@stream_db_work
+def roster_snapshot(lesson_id):
+    return [
+        {
+            'student_id': student_id,
+            'status': attendance_status,
+            'marked_at': marked_at.isoformat() if marked_at else None,
+        }
+        for student_id, attendance_status, marked_at in Attendance.objects.filter(
+            lesson_id=lesson_id
+        ).values_list('student_id', 'status', 'marked_at')
+    ]
+
+def sse_event(name, data):
+    return f'event: {name}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'
+
+@stream_db_work
+def roster_stream_lesson(request, lesson_id):
+    user = authenticate_stream(request)
+    if user is None:
+        return JsonResponse({'error': 'Authentication required'}, status=status.HTTP_401_UNAUTHORIZED)
+    
+    try:
+        lesson = Lesson.objects.select_related('subject').get(id=lesson_id)
+    except Lesson.DoesNotExist:
+        return JsonResponse({'error': 'Lesson not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    if user.role != 'admin' and lesson.subject.teacher_id != user.id:
+        return JsonResponse({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
+    return lesson
+
+async def lesson_roster_stream_view(request, lesson_id):
+    # Server-Sent Events: one 'snapshot' with the marks so far, then a
+    # 'mark' event per recorded scan. The database work runs on the shared
+    # thread pool (thread_sensitive=False) so an open stream holds neither a
+    # thread nor a connection while it waits.
+    lesson = await sync_to_async(roster_stream_lesson, thread_sensitive=False)(request, lesson_id)
+    if isinstance(lesson, HttpResponse):
+        return lesson
+    
+    broker = get_live_roster()
+    keepalive = live_roster_option('KEEPALIVE_SECONDS')
+    
+    async def events():
+        # Subscribe before reading the snapshot so no mark falls in between.
+        subscription = broker.subscribe(lesson.id)
+        try:
+            yield sse_event('snapshot', await sync_to_async(roster_snapshot, thread_sensitive=False)(lesson.id))
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.get(), keepalive)
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                    continue
+                yield sse_event('mark', event)
+        finally:
+            broker.unsubscribe(subscription)
+    
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 @swagger_auto_schema(
     method='get',
@@ -546,13 +1142,42 @@ def dashboard_view(request):
     return Response(data)
 
 def calculate_attendance_rate(student):
-    total_lessons = Lesson.objects.filter(class_room__students=student).count()
-    if total_lessons == 0:
+    # One aggregate over the student's attendance rows (scans and the absent
+    # rows of finalized lessons) on the attendance_student_status index. Ended
+    # lessons that finalize_lessons has not reached yet hold no row for an
+    # unscanned student; they are counted as absent.
+    counts = Attendance.objects.filter(student=student).aggregate(
+        total=Count('id'),
+        attended=Count('id', filter=Q(status__in=['present', 'late']))
+    )
+    unfinalized = Lesson.objects.filter(
+        class_room__students=student, end_time__lte=timezone.now(), finalized_at__isnull=True
+    ).exclude(attendances__student=student).count()
+    total = counts['total'] + unfinalized
+    if total == 0:
         return 0
     
-    present_count = Attendance.objects.filter(
-        student=student,
-        status__in=['present', 'late']
-    ).count()
+    return round((counts['attended'] / total) * 100, 2)
+
+@swagger_auto_schema(
+    method='get',
+    responses={
+        200: 'Runtime counters',
+        403: 'Permission denied'
+    },
+    operation_description="Get cache and runtime counters (admin only)"
+)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def metrics_view(request):
+    if request.user.role != 'admin':
+        return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
     
-    return round((present_count / total_lessons) * 100, 2)
\ No newline at end of file
+    return Response({
+        'qr_image_cache': get_qr_image_cache().stats(),
+        'scan_index': get_scan_index().stats() if get_scan_index() else None,
+        'scan_write_behind': get_scan_queue().stats() if get_scan_queue() else None,
+        'live_roster': get_live_roster().stats(),
+        'scan_admission': admission_counters.stats(),
+        'response_cache': get_response_cache().stats(),
+    })
@@ -0,0 +1,233 @@
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import close_old_connections, transaction
+from django.dispatch import receiver
+
+from .live_roster import publish_attendance
+from .models import Attendance, Lesson, User
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SCAN_WRITE_BEHIND = {
+    'ENABLED': False,
+    'PATH': 'scan_queue.sqlite3',
+    'FLUSH_INTERVAL': 1.0,
+    'BATCH_SIZE': 500,
+}
+
+
+def earliest_scans(rows):
+    scans = {}
+    for lesson_id, student_id, status, marked_at in rows:
+        marked_at = datetime.fromisoformat(marked_at)
+        pair = (lesson_id, student_id)
+        if pair not in scans or marked_at < scans[pair][1]:
+            scans[pair] = (status, marked_at)
+    return scans
+
+
+class ScanQueue:
+    # Durable local queue of accepted scans. Scans are appended to a WAL-mode
+    # SQLite side file and acknowledged at once; a background thread moves
+    # them into Attendance in batched upserts. Re-flushing a batch after a
+    # crash is harmless because the upsert is idempotent.
+
+    def __init__(self, path, flush_interval=1.0, batch_size=500):
+        self.path = str(path)
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._local = threading.local()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._worker = None
+        self.enqueued = 0
+        self.flushed = 0
+        self.failures = 0
+        self.dropped = 0
+        with self._connection() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS pending_scans ('
+                ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+                ' lesson_id INTEGER NOT NULL,'
+                ' student_id INTEGER NOT NULL,'
+                ' status TEXT NOT NULL,'
+                ' marked_at TEXT NOT NULL)'
+            )
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=FULL')
+            self._local.conn = conn
+        return conn
+
+    def start(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._stop.clear()
+            self._worker = threading.Thread(target=self._run, name='scan-write-behind', daemon=True)
+            self._worker.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._worker is not None:
+            self._worker.join()
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                self.failures += 1
+                logger.exception("Flushing queued attendance scans failed; will retry.")
+            finally:
+                close_old_connections()
+
+    def enqueue(self, attendances):
+        with self._connection() as conn:
+            conn.executemany(
+                'INSERT INTO pending_scans (lesson_id, student_id, status, marked_at) VALUES (?, ?, ?, ?)',
+                [
+                    (a.lesson_id, a.student_id, a.status, a.marked_at.isoformat())
+                    for a in attendances
+                ],
+            )
+        self.enqueued += len(attendances)
+        self.start()
+
+    def pending(self):
+        rows = self._connection().execute(
+            'SELECT lesson_id, student_id, status, marked_at FROM pending_scans ORDER BY id'
+        ).fetchall()
+        # The earliest scan of the same student and lesson wins, as in the upsert.
+        return earliest_scans(rows)
+
+    def flush(self):
+        from .scanning import upsert_attendance
+
+        total = 0
+        with self._flush_lock:
+            conn = self._connection()
+            while True:
+                rows = conn.execute(
+                    'SELECT id, lesson_id, student_id, status, marked_at FROM pending_scans ORDER BY id LIMIT ?',
+                    (self.batch_size,),
+                ).fetchall()
+                if not rows:
+                    break
+                earliest = earliest_scans(row[1:] for row in rows)
+                self._drop_orphaned(earliest)
+                with transaction.atomic():
+                    written = upsert_attendance([
+                        Attendance(lesson_id=lesson_id, student_id=student_id, status=status, marked_at=marked_at)
+                        for (lesson_id, student_id), (status, marked_at) in earliest.items()
+                    ])
+                    publish_attendance(written)
+                with conn:
+                    conn.execute('DELETE FROM pending_scans WHERE id <= ?', (rows[-1][0],))
+                total += len(rows)
+        self.flushed += total
+        return total
+
+    def _drop_orphaned(self, scans):
+        # A scan whose lesson or student was deleted while it waited would
+        # fail the foreign key checks on every flush and hold up the scans
+        # queued behind it, so it is dropped instead.
+        lessons = set(Lesson.objects.filter(id__in={lesson_id for lesson_id, _ in scans}).values_list('id', flat=True))
+        students = set(User.objects.filter(id__in={student_id for _, student_id in scans}).values_list('id', flat=True))
+        orphaned = [pair for pair in scans if pair[0] not in lessons or pair[1] not in students]
+        for pair in orphaned:
+            del scans[pair]
+        if orphaned:
+            self.dropped += len(orphaned)
+            logger.warning("Dropped %d queued attendance scans whose lesson or student no longer exists.", len(orphaned))
+    
+    def overlay(self, attendances, lesson_filters=None, student_id=None, add_missing=True):
+        # Read-your-writes: apply queued scans on top of the rows an
+        # Attendance queryset returns, adding rows that were never flushed
+        # when their lesson (and student) match the caller's filters.
+        pending = self.pending()
+        if not pending:
+            return attendances
+
+        rows = list(attendances)
+        by_pair = {(a.lesson_id, a.student_id): a for a in rows}
+        missing = []
+        for pair, (status, marked_at) in pending.items():
+            attendance = by_pair.get(pair)
+            if attendance is not None:
+                if attendance.marked_at is not None and attendance.marked_at <= marked_at:
+                    continue
+                attendance.status = status
+                attendance.marked_at = marked_at
+            elif add_missing and (student_id is None or pair[1] == student_id):
+                missing.append((pair, status, marked_at))
+
+        if missing:
+            # Fetched with their relations so serializing the added rows does
+            # not query per row.
+            visible = Lesson.objects.filter(
+                id__in={lesson_id for (lesson_id, _), _, _ in missing},
+                **(lesson_filters or {})
+            ).select_related('subject__teacher', 'class_room').in_bulk()
+            students = User.objects.in_bulk({pair_student_id for (_, pair_student_id), _, _ in missing})
+            rows.extend(
+                Attendance(
+                    lesson=visible[lesson_id], student=students[pair_student_id],
+                    status=status, marked_at=marked_at
+                )
+                for (lesson_id, pair_student_id), status, marked_at in missing
+                if lesson_id in visible and pair_student_id in students
+            )
+        return rows
+
+    def stats(self):
+        return {
+            'pending': self._connection().execute('SELECT COUNT(*) FROM pending_scans').fetchone()[0],
+            'enqueued': self.enqueued,
+            'flushed': self.flushed,
+            'failures': self.failures,
+            'dropped': self.dropped,
+        }
+
+
+_scan_queue = None
+_scan_queue_lock = threading.Lock()
+
+
+def scan_write_behind_option(name):
+    return {**DEFAULT_SCAN_WRITE_BEHIND, **getattr(settings, 'SCAN_WRITE_BEHIND', {})}[name]
+
+
+def get_scan_queue():
+    global _scan_queue
+    if not scan_write_behind_option('ENABLED'):
+        return None
+    if _scan_queue is None:
+        with _scan_queue_lock:
+            if _scan_queue is None:
+                queue = ScanQueue(
+                    scan_write_behind_option('PATH'),
+                    flush_interval=scan_write_behind_option('FLUSH_INTERVAL'),
+                    batch_size=scan_write_behind_option('BATCH_SIZE'),
+                )
+                # Start at once so scans left over from a previous run drain.
+                queue.start()
+                _scan_queue = queue
+    return _scan_queue
+
+
+@receiver(setting_changed)
+def _reset_scan_queue(sender, setting, **kwargs):
+    global _scan_queue
+    if setting == 'SCAN_WRITE_BEHIND' and _scan_queue is not None:
+        _scan_queue.stop()
+        _scan_queue = None
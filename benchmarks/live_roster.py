@@ -0,0 +1,203 @@
+"""Load-test the live roster stream on a single in-process ASGI worker.
+
+Opens N concurrent Server-Sent Events connections to one lesson's roster by
+calling the ASGI application directly (no network), then reports the memory
+held per open stream, the CPU spent while they sit idle and how long one scan
+takes to fan out to all of them. Django's ASGI handler keeps one idle thread
+per open request (its thread-sensitive context), so the thread count is
+reported too; it is usually what bounds a worker first.
+
+    python -m benchmarks.live_roster [--connections 100,1000,5000] [--marks 20]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import tempfile
+import threading
+import time
+import tracemalloc
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+# Each ASGI request runs its sync code on its own thread, so the in-memory
+# database of the other benchmarks would not be shared; use a throwaway file.
+os.environ.setdefault('BENCHMARK_DATABASE', os.path.join(tempfile.mkdtemp(), 'live_roster.sqlite3'))
+
+
+def seed():
+    from django.core.management import call_command
+    from django.utils import timezone
+    from datetime import timedelta
+    from rest_framework_simplejwt.tokens import RefreshToken
+    from attendance.models import Class, Lesson, Subject, User
+
+    call_command('migrate', verbosity=0)
+    teacher = User.objects.create(phone_number='900000000', full_name='Bench Teacher', role='teacher')
+    class_room = Class.objects.create(name='Bench')
+    subject = Subject.objects.create(name='Bench Subject', teacher=teacher)
+    subject.classes.set([class_room])
+    now = timezone.now()
+    lesson = Lesson.objects.create(
+        subject=subject, class_room=class_room,
+        start_time=now - timedelta(minutes=5), end_time=now + timedelta(minutes=40),
+    )
+    return lesson.id, str(RefreshToken.for_user(teacher).access_token)
+
+
+class Connection:
+    def __init__(self, application, lesson_id, token):
+        self.scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': f'/api/api/lessons/{lesson_id}/roster/stream/',
+            'raw_path': f'/api/api/lessons/{lesson_id}/roster/stream/'.encode(),
+            'query_string': f'token={token}'.encode(),
+            'root_path': '',
+            'headers': [(b'host', b'localhost')],
+            'client': ('127.0.0.1', 50000),
+            'server': ('localhost', 80),
+        }
+        self.application = application
+        self.status = None
+        self.ready = asyncio.Event()
+        self.closed = asyncio.Event()
+        self.marks = 0
+        self.mark_received = None
+        self._body_sent = False
+
+    async def receive(self):
+        if not self._body_sent:
+            self._body_sent = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await self.closed.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(self, message):
+        if message['type'] == 'http.response.start':
+            self.status = message['status']
+            if self.status != 200:
+                self.ready.set()
+        elif message['type'] == 'http.response.body':
+            body = message.get('body', b'')
+            if body.startswith(b'event: snapshot'):
+                self.ready.set()
+            elif body.startswith(b'event: mark'):
+                self.marks += 1
+                if self.mark_received is not None:
+                    self.mark_received()
+
+    async def run(self):
+        await self.application(self.scope, self.receive, self.send)
+
+
+async def run_level(application, lesson_id, token, connections, marks):
+    from asgiref.sync import sync_to_async
+    from attendance.live_roster import get_live_roster
+
+    broker = get_live_roster()
+    tracemalloc.start()
+    base, _ = tracemalloc.get_traced_memory()
+    started = time.perf_counter()
+    clients = [Connection(application, lesson_id, token) for _ in range(connections)]
+    tasks = [asyncio.create_task(client.run()) for client in clients]
+    await asyncio.gather(*(client.ready.wait() for client in clients))
+    connect_seconds = time.perf_counter() - started
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    failed = sum(1 for client in clients if client.status != 200)
+
+    cpu_started = time.process_time()
+    await asyncio.sleep(1)
+    idle_cpu_ms = (time.process_time() - cpu_started) * 1000
+    threads = threading.active_count()
+
+    fanout = []
+    for i in range(marks if failed < connections else 0):
+        remaining = connections - failed
+        done = asyncio.Event()
+
+        def received():
+            nonlocal remaining
+            remaining -= 1
+            if remaining == 0:
+                done.set()
+
+        for client in clients:
+            client.mark_received = received
+        event = {'student_id': i, 'status': 'present', 'marked_at': None}
+        started = time.perf_counter()
+        # Published from a worker thread, as a sync scan request would.
+        await sync_to_async(broker.publish, thread_sensitive=False)(lesson_id, event)
+        await done.wait()
+        fanout.append(time.perf_counter() - started)
+
+    for client in clients:
+        client.closed.set()
+    await asyncio.gather(*tasks)
+    delivered = sum(client.marks for client in clients)
+
+    return {
+        'connections': connections,
+        'failed': failed,
+        'connect_seconds': connect_seconds,
+        'memory_per_connection_kb': (held - base) / connections / 1024,
+        'idle_cpu_ms_per_second': idle_cpu_ms,
+        'fanout_p50_ms': statistics.median(fanout) * 1000 if fanout else 0,
+        'fanout_max_ms': max(fanout) * 1000 if fanout else 0,
+        'delivered': delivered,
+        'subscribers_left': broker.stats()['subscribers'],
+        'threads': threads,
+    }
+
+
+async def run(args):
+    import django
+    from asgiref.sync import sync_to_async
+
+    django.setup()
+    from django.core.asgi import get_asgi_application
+
+    application = get_asgi_application()
+    lesson_id, token = await sync_to_async(seed)()
+    await run_level(application, lesson_id, token, 1, 1)  # warm imports and caches
+    levels = [int(level) for level in args.connections.split(',')]
+    return {
+        'meta': {
+            'marks': args.marks,
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': [await run_level(application, lesson_id, token, level, args.marks) for level in levels],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--connections', default='100,1000,5000',
+                        help="Comma-separated numbers of concurrent streams to hold")
+    parser.add_argument('--marks', type=int, default=20, help="Scans to fan out per level")
+    parser.add_argument('--output', help="Write the results as JSON to this path")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    print(f"{'streams':>8}{'failed':>8}{'threads':>9}{'connect s':>11}{'KB/stream':>11}{'idle cpu ms/s':>15}"
+          f"{'fanout p50 ms':>15}{'fanout max ms':>15}")
+    for row in report['results']:
+        print(
+            f"{row['connections']:>8}{row['failed']:>8}{row['threads']:>9}{row['connect_seconds']:>11.2f}"
+            f"{row['memory_per_connection_kb']:>11.1f}{row['idle_cpu_ms_per_second']:>15.1f}"
+            f"{row['fanout_p50_ms']:>15.2f}{row['fanout_max_ms']:>15.2f}"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,301 @@
+"""Load-test mark-attendance and my-qr-codes against a locally started server.
+
+Seeds a synthetic school (one open lesson per class, a QR code per student)
+into a throwaway SQLite file, starts the app under the chosen server and
+drives it from simulated devices with JWT auth: scanner devices mark
+attendance in bursts (a queue of students at the door, then a pause) while
+student devices poll their QR codes. Reports throughput, p50/p95/p99
+latency, error and lock-timeout rates and database queries per request.
+
+    python -m benchmarks.loadtest [--server runserver|gunicorn|uvicorn] [--devices 20] [--duration 30]
+    python -m benchmarks.loadtest --classes 40 --students-per-class 30 --output run.json
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+
+from benchmarks.pipeline import percentile
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+# The server runs in another process, so the database has to be a file.
+os.environ.setdefault('BENCHMARK_DATABASE', os.path.join(tempfile.mkdtemp(), 'loadtest.sqlite3'))
+
+SERVERS = {
+    'runserver': [sys.executable, 'manage.py', 'runserver', '--noreload', '{host}:{port}'],
+    'gunicorn': ['gunicorn', 'config.wsgi:application', '--bind', '{host}:{port}', '--workers', '{workers}', '--threads', '{threads}'],
+    'uvicorn': ['uvicorn', 'config.asgi:application', '--host', '{host}', '--port', '{port}', '--workers', '{workers}', '--no-access-log'],
+}
+
+
+def seed(classes, students_per_class, lessons_per_class):
+    import django
+    from django.core.management import call_command
+
+    django.setup()
+    call_command('migrate', verbosity=0)
+
+    from django.utils import timezone
+    from rest_framework_simplejwt.tokens import RefreshToken
+    from attendance.models import Class, Lesson, QRCode, Subject, User
+
+    now = timezone.now()
+    scanners = []
+    students = []
+    for c in range(classes):
+        teacher = User.objects.create(
+            username=f'load_teacher{c}', phone_number=f'90{c:07d}',
+            full_name=f'Load Teacher {c}', role='teacher',
+        )
+        User.objects.bulk_create([
+            User(
+                username=f'load{c}_{i}', phone_number=f'91{c:03d}{i:04d}',
+                full_name=f'Load Student {c}/{i}', role='student', password='pbkdf2_unusable',
+            )
+            for i in range(students_per_class)
+        ])
+        roster = list(User.objects.filter(username__startswith=f'load{c}_'))
+        class_room = Class.objects.create(name=f'Load {c}')
+        class_room.students.set(roster)
+        subject = Subject.objects.create(name=f'Load Subject {c}', teacher=teacher)
+        subject.classes.set([class_room])
+        for i in range(lessons_per_class):
+            # The first lesson is open now; the others fill the QR code lists.
+            start = now - timedelta(minutes=5) + timedelta(days=i)
+            Lesson.objects.create(
+                subject=subject, class_room=class_room,
+                start_time=start, end_time=start + timedelta(minutes=45),
+            )
+        codes = list(QRCode.objects.filter(
+            lesson__class_room=class_room, lesson__start_time__lte=now,
+        ).values_list('code', flat=True))
+        scanners.append((str(RefreshToken.for_user(teacher).access_token), codes))
+        students.extend(str(RefreshToken.for_user(student).access_token) for student in roster)
+    return scanners, students
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(args, port):
+    command = [
+        part.format(host='127.0.0.1', port=port, workers=args.workers, threads=args.threads)
+        for part in SERVERS[args.server]
+    ]
+    process = subprocess.Popen(
+        command, env=os.environ.copy(), cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"{args.server} exited with code {process.returncode}")
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise SystemExit(f"{args.server} did not start listening on port {port}")
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, latency, ok, lock_timeout, queries):
+        with self._lock:
+            self.samples.setdefault(name, []).append((latency, ok, lock_timeout, queries))
+
+    def summary(self, duration):
+        rows = []
+        for name, samples in sorted(self.samples.items()):
+            latencies = [sample[0] for sample in samples]
+            queries = [sample[3] for sample in samples if sample[3] is not None]
+            rows.append({
+                'name': name,
+                'requests': len(samples),
+                'requests_per_sec': len(samples) / duration,
+                'p50_ms': percentile(latencies, 50) * 1000,
+                'p95_ms': percentile(latencies, 95) * 1000,
+                'p99_ms': percentile(latencies, 99) * 1000,
+                'error_rate': sum(1 for sample in samples if not sample[1]) / len(samples),
+                'lock_timeout_rate': sum(1 for sample in samples if sample[2]) / len(samples),
+                'queries_per_request': sum(queries) / len(queries) if queries else None,
+            })
+        return rows
+
+
+class Device(threading.Thread):
+    def __init__(self, port, token, recorder, stop_at, rng):
+        super().__init__(daemon=True)
+        self.port = port
+        self.headers = {'Authorization': f'Bearer {token}', 'Content-Type': 'application/json'}
+        self.recorder = recorder
+        self.stop_at = stop_at
+        self.rng = rng
+        self.connection = None
+
+    def request(self, name, method, path, body=None):
+        if self.connection is None:
+            self.connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+        started = time.perf_counter()
+        try:
+            self.connection.request(method, path, body=body and json.dumps(body), headers=self.headers)
+            response = self.connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            self.connection = None
+            self.recorder.add(name, time.perf_counter() - started, False, False, None)
+            return
+        queries = response.getheader('X-Query-Count')
+        self.recorder.add(
+            name, time.perf_counter() - started, response.status < 400,
+            response.getheader('X-DB-Lock-Timeout') is not None,
+            int(queries) if queries is not None else None,
+        )
+        if response.getheader('Connection', '').lower() == 'close':
+            self.connection.close()
+            self.connection = None
+
+    def pause(self, seconds):
+        time.sleep(max(0, min(seconds, self.stop_at - time.monotonic())))
+
+
+class Scanner(Device):
+    # A teacher's phone at the classroom door: bursts of students scanned a
+    # moment apart, separated by exponentially distributed quiet gaps.
+
+    def __init__(self, port, token, codes, recorder, stop_at, rng, burst_size, burst_gap, scan_interval):
+        super().__init__(port, token, recorder, stop_at, rng)
+        # Several scanners may share a teacher; SCAN_THROTTLE buckets by device.
+        self.headers['X-Device-ID'] = self.name
+        self.codes = codes
+        self.burst_size = burst_size
+        self.burst_gap = burst_gap
+        self.scan_interval = scan_interval
+
+    def run(self):
+        self.pause(self.rng.expovariate(1 / self.burst_gap))
+        while time.monotonic() < self.stop_at:
+            for _ in range(self.rng.randint(1, self.burst_size)):
+                if time.monotonic() >= self.stop_at:
+                    break
+                self.request('mark_attendance', 'POST', '/api/api/mark-attendance/', {'qr_code': self.rng.choice(self.codes)})
+                self.pause(self.rng.uniform(0, 2 * self.scan_interval))
+            self.pause(self.rng.expovariate(1 / self.burst_gap))
+
+
+class StudentClient(Device):
+    def __init__(self, port, token, recorder, stop_at, rng, poll_interval):
+        super().__init__(port, token, recorder, stop_at, rng)
+        self.poll_interval = poll_interval
+
+    def run(self):
+        self.pause(self.rng.uniform(0, self.poll_interval))
+        while time.monotonic() < self.stop_at:
+            self.request('my_qr_codes', 'GET', '/api/api/my-qr-codes/')
+            self.pause(self.rng.expovariate(1 / self.poll_interval))
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    scanners, students = seed(args.classes, args.students_per_class, args.lessons_per_class)
+    port = args.port or free_port()
+    server = start_server(args, port)
+    try:
+        recorder = Recorder()
+        stop_at = time.monotonic() + args.duration
+        devices = [
+            Scanner(
+                port, *scanners[i % len(scanners)], recorder, stop_at, random.Random(rng.random()),
+                args.burst_size, args.burst_gap, args.scan_interval,
+            )
+            for i in range(args.devices)
+        ] + [
+            StudentClient(port, students[i % len(students)], recorder, stop_at, random.Random(rng.random()), args.poll_interval)
+            for i in range(args.student_devices)
+        ]
+        started = time.monotonic()
+        for device in devices:
+            device.start()
+        for device in devices:
+            device.join()
+        duration = time.monotonic() - started
+    finally:
+        server.terminate()
+        server.wait()
+
+    return {
+        'meta': {
+            'server': args.server,
+            'workers': args.workers,
+            'threads': args.threads,
+            'devices': args.devices,
+            'student_devices': args.student_devices,
+            'classes': args.classes,
+            'students_per_class': args.students_per_class,
+            'duration': duration,
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': recorder.summary(duration),
+    }
+
+
+def print_results(report):
+    print(f"{'endpoint':<18}{'requests':>9}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          f"{'errors':>8}{'locked':>8}{'queries':>9}")
+    for row in report['results']:
+        queries = row['queries_per_request']
+        print(
+            f"{row['name']:<18}{row['requests']:>9}{row['requests_per_sec']:>9.1f}{row['p50_ms']:>9.1f}"
+            f"{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}{row['error_rate']:>8.1%}{row['lock_timeout_rate']:>8.1%}"
+            f"{queries if queries is None else format(queries, '.1f'):>9}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--server', choices=sorted(SERVERS), default='runserver')
+    parser.add_argument('--workers', type=int, default=1, help="Server processes (gunicorn/uvicorn)")
+    parser.add_argument('--threads', type=int, default=8, help="Threads per worker (gunicorn)")
+    parser.add_argument('--port', type=int, help="Port to serve on (default: a free one)")
+    parser.add_argument('--classes', type=int, default=20)
+    parser.add_argument('--students-per-class', type=int, default=30)
+    parser.add_argument('--lessons-per-class', type=int, default=5)
+    parser.add_argument('--devices', type=int, default=20, help="Scanner devices")
+    parser.add_argument('--student-devices', type=int, default=20, help="Students polling my-qr-codes")
+    parser.add_argument('--duration', type=float, default=30, help="Seconds of load")
+    parser.add_argument('--burst-size', type=int, default=15, help="Most scans in one burst")
+    parser.add_argument('--burst-gap', type=float, default=3, help="Mean seconds between bursts")
+    parser.add_argument('--scan-interval', type=float, default=0.2, help="Mean seconds between scans in a burst")
+    parser.add_argument('--poll-interval', type=float, default=5, help="Mean seconds between student polls")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="Write the results as JSON to this path")
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    print_results(report)
+
+
+if __name__ == '__main__':
+    main()
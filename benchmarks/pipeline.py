@@ -0,0 +1,213 @@
+"""Benchmark the QR generation and serialization pipeline.
+
+Runs against an in-memory SQLite database seeded with synthetic lessons and
+reports latency percentiles, throughput, peak memory and query counts.
+
+    python -m benchmarks.pipeline [--students 40] [--lessons 20] [--output run.json]
+    python -m benchmarks.pipeline --compare before.json after.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import time
+import tracemalloc
+from datetime import timedelta
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+
+
+def setup_django():
+    import django
+    from django.core.management import call_command
+
+    django.setup()
+    call_command('migrate', verbosity=0)
+
+
+def seed(students, lessons):
+    from django.utils import timezone
+    from attendance.models import Class, Lesson, Subject, User
+
+    teacher = User.objects.create(phone_number='900000000', full_name='Bench Teacher', role='teacher')
+    User.objects.bulk_create([
+        User(
+            username=f'bench{i}', phone_number=f'91{i:07d}', full_name=f'Bench Student {i}',
+            role='student', password='pbkdf2_unusable',
+        )
+        for i in range(students)
+    ])
+    roster = User.objects.filter(role='student')
+    class_room = Class.objects.create(name='Bench')
+    class_room.students.set(roster)
+    subject = Subject.objects.create(name='Bench Subject', teacher=teacher)
+    subject.classes.set([class_room])
+
+    start = timezone.now().replace(minute=0, second=0, microsecond=0)
+    for i in range(lessons):
+        Lesson.objects.create(
+            subject=subject,
+            class_room=class_room,
+            start_time=start + timedelta(hours=i),
+            end_time=start + timedelta(hours=i, minutes=45),
+        )
+    return teacher, roster.first()
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def measure(name, func, repeat, items_per_call=1, setup=None):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    func()  # warm imports and code paths outside the measured window
+    latencies = []
+    queries = 0
+    for _ in range(repeat):
+        if setup:
+            setup()
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            func()
+            latencies.append(time.perf_counter() - started)
+        queries += len(captured)
+
+    # Peak memory comes from one extra traced call so tracemalloc's overhead
+    # stays out of the latency numbers.
+    if setup:
+        setup()
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    total = sum(latencies)
+    return {
+        'name': name,
+        'calls': repeat,
+        'items_per_call': items_per_call,
+        'mean_ms': statistics.mean(latencies) * 1000,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p90_ms': percentile(latencies, 90) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'items_per_sec': repeat * items_per_call / total if total else 0,
+        'peak_memory_kb': peak / 1024,
+        'queries_per_call': queries / repeat,
+    }
+
+
+def run(args):
+    setup_django()
+
+    from rest_framework.test import APIClient
+    from attendance.models import QRCode
+    from attendance.qr_cache import get_qr_image_cache
+    from attendance.serializers import QRCodeSerializer
+    from attendance.utils import generate_qr_code
+
+    teacher, student = seed(args.students, args.lessons)
+    image_cache = get_qr_image_cache()
+    qr_code = QRCode.objects.filter(student=student).first()
+    student_codes = list(QRCode.objects.filter(student=student).select_related(
+        'lesson__subject', 'lesson__class_room', 'student'
+    ))
+    client = APIClient()
+    client.force_authenticate(student)
+
+    def view_call():
+        response = client.get('/api/api/my-qr-codes/', {'include': 'qr_image', 'page_size': 100})
+        assert response.status_code == 200, response.status_code
+
+    results = [
+        measure('generate_qr_image.cold', qr_code.generate_qr_image, args.repeat, setup=image_cache.clear),
+        measure('generate_qr_image.warm', qr_code.generate_qr_image, args.repeat),
+        measure('utils.generate_qr_code', lambda: generate_qr_code(qr_code.lesson, student), args.repeat),
+        measure(
+            'QRCodeSerializer.many.cold',
+            lambda: QRCodeSerializer(student_codes, many=True).data,
+            max(1, args.repeat // 10), items_per_call=len(student_codes), setup=image_cache.clear,
+        ),
+        measure(
+            'QRCodeSerializer.many.warm',
+            lambda: QRCodeSerializer(student_codes, many=True).data,
+            max(1, args.repeat // 10), items_per_call=len(student_codes),
+        ),
+        measure(
+            'view.my_qr_codes.cold', view_call,
+            max(1, args.repeat // 10), items_per_call=len(student_codes), setup=image_cache.clear,
+        ),
+        measure(
+            'view.my_qr_codes.warm', view_call,
+            max(1, args.repeat // 10), items_per_call=len(student_codes),
+        ),
+    ]
+    return {
+        'meta': {
+            'students': args.students,
+            'lessons': args.lessons,
+            'repeat': args.repeat,
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+
+
+def print_results(report):
+    print(f"{'case':<30}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'items/s':>12}{'peak KB':>10}{'queries':>9}")
+    for row in report['results']:
+        print(
+            f"{row['name']:<30}{row['p50_ms']:>10.2f}{row['p90_ms']:>10.2f}{row['p99_ms']:>10.2f}"
+            f"{row['items_per_sec']:>12.1f}{row['peak_memory_kb']:>10.0f}{row['queries_per_call']:>9.1f}"
+        )
+
+
+def compare(before_path, after_path):
+    with open(before_path) as f:
+        before = {row['name']: row for row in json.load(f)['results']}
+    with open(after_path) as f:
+        after = {row['name']: row for row in json.load(f)['results']}
+
+    print(f"{'case':<30}{'p50 ms':>18}{'items/s':>20}{'queries':>14}")
+    for name, new in after.items():
+        old = before.get(name)
+        if old is None:
+            print(f"{name:<30}{'(new)':>18}")
+            continue
+        change = (new['p50_ms'] - old['p50_ms']) / old['p50_ms'] * 100 if old['p50_ms'] else 0
+        print(
+            f"{name:<30}{old['p50_ms']:>8.2f}->{new['p50_ms']:<7.2f}{change:+.0f}%"
+            f"{old['items_per_sec']:>10.1f}->{new['items_per_sec']:<8.1f}"
+            f"{old['queries_per_call']:>6.1f}->{new['queries_per_call']:<6.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--students', type=int, default=40)
+    parser.add_argument('--lessons', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--output', help="Write the results as JSON to this path")
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help="Diff two saved runs")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    report = run(args)
+    print_results(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved {args.output}")
+
+
+if __name__ == '__main__':
+    main()
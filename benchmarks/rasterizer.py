@@ -0,0 +1,44 @@
+"""Compare the PIL and NumPy QR rasterizers.
+
+    python -m benchmarks.rasterizer [--count 500] [--box-size 10] [--border 5]
+"""
+import argparse
+import io
+import time
+import uuid
+
+from attendance.rendering import RASTERIZERS, build_qr
+
+
+def time_rasterizer(rasterize, qrs, encode):
+    started = time.perf_counter()
+    for qr in qrs:
+        img = rasterize(qr)
+        if encode:
+            img.save(io.BytesIO(), format='PNG')
+    return (time.perf_counter() - started) / len(qrs) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=500)
+    parser.add_argument('--box-size', type=int, default=10)
+    parser.add_argument('--border', type=int, default=5)
+    args = parser.parse_args()
+
+    qrs = [
+        build_qr(str(uuid.uuid4()), box_size=args.box_size, border=args.border)
+        for _ in range(args.count)
+    ]
+    print(f"{args.count} UUID codes, box_size={args.box_size}, border={args.border}")
+    print(f"{'rasterizer':<12}{'raster ms':>12}{'raster+png ms':>16}")
+    baseline = None
+    for name, rasterize in RASTERIZERS.items():
+        raster = time_rasterizer(rasterize, qrs, encode=False)
+        total = time_rasterizer(rasterize, qrs, encode=True)
+        baseline = baseline or raster
+        print(f"{name:<12}{raster:>12.3f}{total:>16.3f}   x{baseline / raster:.1f}")
+
+
+if __name__ == '__main__':
+    main()
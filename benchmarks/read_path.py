@@ -0,0 +1,87 @@
+"""Benchmark the list endpoints on the serializer path and the fast read path.
+
+Seeds an in-memory SQLite database with lessons and attendance, then calls
+the lessons, attendance and my-qr-codes lists a full page (100 rows) at a
+time, first with FAST_READ_PATH disabled (model instances, serializers and
+JSONRenderer) and then enabled (.values() rows and the orjson renderer).
+Reports rows per second, latency percentiles, peak memory and queries.
+
+    python -m benchmarks.read_path [--students 100] [--lessons 100] [--repeat 50] [--output run.json]
+"""
+import argparse
+import json
+import platform
+import time
+
+from benchmarks.pipeline import measure, print_results, seed, setup_django
+
+PAGE_SIZE = 100
+
+
+def run(args):
+    setup_django()
+
+    from django.test import override_settings
+    from rest_framework.test import APIClient
+    from attendance.models import Attendance, Lesson
+
+    teacher, student = seed(args.students, args.lessons)
+    Attendance.objects.bulk_create([
+        Attendance(lesson=lesson, student=pupil, status='present', marked_at=lesson.start_time)
+        for lesson in Lesson.objects.all()
+        for pupil in lesson.class_room.students.all()
+    ])
+
+    teacher_client = APIClient()
+    teacher_client.force_authenticate(teacher)
+    student_client = APIClient()
+    student_client.force_authenticate(student)
+    cases = [
+        ('lessons', teacher_client, '/api/api/lessons/'),
+        ('attendance', teacher_client, '/api/api/attendance/'),
+        ('my_qr_codes', student_client, '/api/api/my-qr-codes/'),
+    ]
+
+    results = []
+    for path, enabled in [('serializer', False), ('fast', True)]:
+        with override_settings(FAST_READ_PATH={'ENABLED': enabled}):
+            for name, client, url in cases:
+                rows = len(client.get(url, {'page_size': PAGE_SIZE}).json()['results'])
+
+                def call(client=client, url=url):
+                    response = client.get(url, {'page_size': PAGE_SIZE})
+                    assert response.status_code == 200, response.status_code
+
+                results.append(measure(f'{name}.{path}', call, args.repeat, items_per_call=rows))
+    return {
+        'meta': {
+            'students': args.students,
+            'lessons': args.lessons,
+            'repeat': args.repeat,
+            'page_size': PAGE_SIZE,
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--students', type=int, default=100)
+    parser.add_argument('--lessons', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--output', help="Write the results as JSON to this path")
+    args = parser.parse_args()
+
+    report = run(args)
+    print_results(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved {args.output}")
+
+
+if __name__ == '__main__':
+    main()
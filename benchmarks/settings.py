@@ -0,0 +1,24 @@
+import os
+
+from config.settings import *  # noqa: F401,F403
+
+DEBUG = False
+
+ALLOWED_HOSTS = ['testserver', 'localhost', '127.0.0.1']
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        # In-memory by default; set BENCHMARK_DATABASE to a file when the
+        # benchmark spreads database work over several threads.
+        'NAME': os.environ.get('BENCHMARK_DATABASE', ':memory:'),
+    }
+}
+
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+# Report queries per request (X-Query-Count) to benchmarks/loadtest.py.
+MIDDLEWARE = ['attendance.middleware.QueryCountMiddleware', *MIDDLEWARE]
+
+# Every case must reach the view; a cached response would measure nothing.
+RESPONSE_CACHE = {'ENABLED': False}
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 from pathlib import Path
+from corsheaders.defaults import default_headers
 
 from datetime import timedelta
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -92,6 +93,99 @@ SIMPLE_JWT = {
 WSGI_APPLICATION = 'config.wsgi.application'
 
 
+# Rendered QR images are cached per process (LRU) and, when SHARED_CACHE names
+# an alias in CACHES, in a tier shared by all workers.
+QR_IMAGE_CACHE = {
+    'MAX_ENTRIES': 2048,
+    'SHARED_CACHE': None,
+    'TIMEOUT': 60 * 60 * 24 * 7,
+    # Sent with /image.png responses; the bytes behind a URL never change.
+    'CACHE_CONTROL': 'private, max-age=31536000, immutable',
+}
+
+# Per-process index of the codes of lessons that are open right now, so a scan
+# is authorized without database reads. Signals invalidate it in the process
+# that made a change; MAX_AGE (seconds) bounds staleness in other processes.
+SCAN_INDEX = {
+    'ENABLED': True,
+    'MAX_AGE': 60,
+}
+
+# Optional write-behind for scans: accepted scans are appended to a durable
+# SQLite side file (WAL) and acknowledged with 202, then flushed into
+# Attendance in batched upserts every FLUSH_INTERVAL seconds. Pending scans are
+# overlaid on /api/attendance/ so they are visible immediately.
+SCAN_WRITE_BEHIND = {
+    'ENABLED': False,
+    'PATH': BASE_DIR / 'scan_queue.sqlite3',
+    'FLUSH_INTERVAL': 1.0,
+    'BATCH_SIZE': 500,
+}
+
+# Admission control on the scan endpoints. Each teacher/X-Device-ID pair gets
+# a token bucket of BURST scans refilled at RATE per second (429 with
+# Retry-After past it), kept in the CACHE alias, which must be shared for the
+# limit to span workers. MAX_CONCURRENT caps the scans one process handles at
+# once; more are refused with 503 before they queue on the database lock.
+SCAN_THROTTLE = {
+    'ENABLED': True,
+    'RATE': 5,
+    'BURST': 30,
+    'CACHE': 'default',
+    'MAX_CONCURRENT': 32,
+    'BUSY_RETRY_AFTER': 1,
+}
+
+# List endpoints are cursor paginated (?cursor=&page_size=); page_size is
+# capped at MAX_PAGE_SIZE.
+API_PAGINATION = {
+    'PAGE_SIZE': 20,
+    'MAX_PAGE_SIZE': 100,
+}
+
+# Lesson, attendance and QR code lists are built from .values() rows and
+# rendered with orjson (when installed) instead of through ModelSerializer.
+# The output is byte-identical; set ENABLED to False to use the serializers.
+FAST_READ_PATH = {
+    'ENABLED': True,
+}
+
+# GET /api/lessons/ and /api/my-qr-codes/ responses are cached per user (one
+# shared scope for admins) and query string in the CACHE alias. Signals on
+# Lesson, QRCode, Subject, Class and their class rosters invalidate only the
+# users whose lists changed; TIMEOUT (seconds) bounds anything they do not
+# see, such as a renamed teacher. ?upcoming= requests are never cached. With
+# several workers CACHE must be shared, or invalidations stay in one process.
+RESPONSE_CACHE = {
+    'ENABLED': True,
+    'CACHE': 'default',
+    'TIMEOUT': 300,
+}
+
+# Live roster streams (/api/lessons/<id>/roster/stream/, Server-Sent Events).
+# The in-process broker only reaches streams opened on the same process; run
+# the app as a single ASGI worker per host or plug in a shared BACKEND.
+LIVE_ROSTER = {
+    'BACKEND': 'attendance.live_roster.InProcessBroker',
+    'QUEUE_SIZE': 256,
+    'KEEPALIVE_SECONDS': 15,
+}
+
+# 'numpy' expands the module matrix with NumPy (pixel-identical, several times
+# faster); 'pil' uses qrcode's module-by-module drawing. Falls back to 'pil'
+# when NumPy is not installed.
+QR_RASTERIZER = 'numpy'
+
+# 'uuid' stores one random QRCode row per student and lesson. 'signed' issues
+# HMAC-signed tokens carrying (lesson, student, expiry) instead, so lessons no
+# longer write QRCode rows and scans skip the code lookup. Existing UUID codes
+# keep working in both modes.
+QR_TOKENS = {
+    'MODE': 'uuid',
+    'EXPIRY_GRACE_SECONDS': 0,
+}
+
+
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
@@ -99,6 +193,12 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # A file-backed test database: threads in the concurrency tests get
+        # their own connections, which shared-cache in-memory SQLite turns
+        # into "database table is locked" errors instead of waiting.
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
@@ -136,6 +236,11 @@ SWAGGER_SETTINGS = {
 
 CORS_ALLOW_ALL_ORIGINS = True
 
+CORS_ALLOW_HEADERS = (
+    *default_headers,
+    'x-device-id',
+)
+
 CORS_ALLOW_METHODS = [
     'GET',
     'POST',